@@ -8,6 +8,7 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+from document.middleware import JWTAuthMiddleware
 from document.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'KES_DocGen.settings')
@@ -15,6 +16,6 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'KES_DocGen.settings')
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
-        URLRouter(websocket_urlpatterns)
+        JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
     )
 })
\ No newline at end of file
@@ -66,6 +66,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'document.middleware.CurrentRequestMiddleware',  # Auteur des modifications journalisées
 ]
 
 ROOT_URLCONF = 'KES_DocGen.urls'
@@ -76,6 +77,8 @@ AUTH_USER_MODEL = "api_user.User"
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        # File de réception bornée par connexion : au-delà, les envois de groupe sont abandonnés
+        'CONFIG': {'capacity': 200, 'expiry': 60},
         #'CONFIG': {
         #    "hosts": [('127.0.0.1', 6379)],
         #},
@@ -110,6 +113,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Attente (secondes) du verrou d'écriture tenu par un autre processus
+        # (serveur, run_workers, run_relances) avant l'erreur "database is locked"
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -171,8 +177,13 @@ REST_FRAMEWORK = {
     #'DEFAULT_PERMISSION_CLASSES': [
     #   'rest_framework.permissions.IsAuthenticated',
     #],
+    'DEFAULT_PAGINATION_CLASS': 'document.pagination.KeysetPagination',
 }
 
+# Nombre maximal de lignes d'une liste demandée sans ?page_size= ni ?cursor=
+# (voir document/pagination.py)
+LIST_MAX_RESULTS = 1000
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost",
     "http://localhost:5173",
@@ -234,4 +245,38 @@ LOGGING = {
             'level': 'DEBUG',
         },
     },
-}
\ No newline at end of file
+}
+
+# Journal d'audit écrit par lots depuis un thread (voir document/audit.py)
+AUDIT_LOG_ASYNC = True
+AUDIT_LOG_BATCH_SIZE = 200
+AUDIT_LOG_FLUSH_INTERVAL = 2.0
+AUDIT_LOG_FALLBACK = BASE_DIR / 'logs' / 'audit_fallback.jsonl'
+
+# Rétention des journaux : au-delà, archives mensuelles compressées (voir document/retention.py)
+AUDIT_RETENTION_DAYS = 365
+AUDIT_ARCHIVE_DIR = BASE_DIR / 'archives'
+
+# File de tâches d'arrière-plan en base (voir document/jobs.py). Sans worker
+# déployé, les tâches sont exécutées dès leur mise en file : JOBS_ASYNC = True
+# seulement là où `manage.py run_workers` tourne
+JOBS_ASYNC = False
+JOBS_MAX_ATTEMPTS = 3
+JOBS_VISIBILITY_TIMEOUT = 300
+JOBS_RETRY_BACKOFF = 10
+JOBS_RETRY_BACKOFF_MAX = 3600
+JOBS_POLL_INTERVAL = 1.0
+
+# Planificateur des relances (voir document/relances.py, commande run_relances)
+RELANCE_MAX_SLEEP = 30
+RELANCE_BATCH_SIZE = 500
+
+# Notifications WebSocket (document.consumers) : regroupement des événements
+# en une trame par intervalle (secondes), et événements en attente par connexion
+NOTIFICATIONS_COALESCE_INTERVAL = 0.5
+NOTIFICATIONS_MAX_PENDING = 100
+
+# Flux des modifications (document/changes.py, ws/changes/) : durée de conservation
+# des événements (jours, purgés par archive_audit_log) et nombre maximal rejoué à la reprise
+CHANGE_FEED_RETENTION_DAYS = 7
+CHANGE_FEED_REPLAY_LIMIT = 1000
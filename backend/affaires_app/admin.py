@@ -21,7 +21,7 @@ class AffaireAdmin(admin.ModelAdmin):
         'statut_display',
     ]
     list_filter = ['statut', 'date_creation']
-    search_fields = ['reference', 'offre__reference', 'offre__client__nom']
+    search_fields = ['reference', 'offre__reference', 'client__nom']
     readonly_fields = ['reference']
     fieldsets = [
         (None, {
@@ -48,7 +48,7 @@ class AffaireAdmin(admin.ModelAdmin):
         """Affiche le nom du client lié à l'offre."""
         return obj.offre.client.nom
     client_nom.short_description = 'Client'
-    client_nom.admin_order_field = 'offre__client__nom'
+    client_nom.admin_order_field = 'client__nom'
     
     def get_titre(self, obj):
         """Retourne le titre de l'offre comme titre de l'affaire."""
@@ -17,7 +17,7 @@ class AffaireFilter(django_filters.FilterSet):
     
     # Recherche par client
     client = django_filters.CharFilter(
-        field_name='offre__client__nom',
+        field_name='client__nom',
         lookup_expr='icontains'
     )
     
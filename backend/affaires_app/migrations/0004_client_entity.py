@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def backfill(apps, schema_editor):
+    # Client et entité recopiés de l'offre, par tranches de clés primaires
+    Affaire = apps.get_model('affaires_app', 'Affaire')
+    offres = apps.get_model('offres_app', 'Offre').objects.filter(affaire=OuterRef('pk'))
+    last_pk = Affaire.objects.aggregate(last=Max('pk'))['last'] or 0
+    for start in range(0, last_pk, 1000):
+        Affaire.objects.filter(pk__gt=start, pk__lte=start + 1000).update(
+            client=Subquery(offres.values('client_id')[:1]),
+            entity=Subquery(offres.values('entity_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('affaires_app', '0003_remove_affaire_created_by_affaire_createur_and_more'),
+        ('client', '0012_clientkpisnapshot'),
+        ('document', '0030_documentdailystat'),
+        ('offres_app', '0012_alter_offre_sequence_number'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='affaire',
+            name='client',
+            field=models.ForeignKey(blank=True, editable=False, help_text="Client de l'offre (dénormalisé)", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='client.client'),
+        ),
+        migrations.AddField(
+            model_name='affaire',
+            name='entity',
+            field=models.ForeignKey(blank=True, editable=False, help_text="Entité de l'offre (dénormalisée)", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='document.entity'),
+        ),
+        migrations.AddIndex(
+            model_name='affaire',
+            index=models.Index(fields=['client', 'date_creation'], name='affaires_ap_client__b3be1b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='affaire',
+            index=models.Index(fields=['entity', 'date_creation'], name='affaires_ap_entity__288ff5_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
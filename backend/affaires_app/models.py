@@ -1,14 +1,17 @@
+import uuid
 from decimal import Decimal
 from django.db import models
 from django.conf import settings
 from django.utils.timezone import now
-from django.db.models import Max
+from django.db.models import Max, Value
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 
 from document.models import StatusTrackingModel
+from document.sequences import month_period, next_sequence
 from factures_app.models import Facture
 
 
@@ -25,6 +28,27 @@ class Affaire(StatusTrackingModel):
         related_name="affaire",
         help_text="Offre acceptée qui a généré cette affaire"
     )
+
+    # Copies du client et de l'entité de l'offre, pour filtrer sans jointure
+    # (sans relation inverse, pour ne pas remplir les champs affaires/factures des sérialiseurs de Client)
+    client = models.ForeignKey(
+        'client.Client',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        help_text="Client de l'offre (dénormalisé)"
+    )
+    entity = models.ForeignKey(
+        'document.Entity',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        help_text="Entité de l'offre (dénormalisée)"
+    )
     
     # Informations d'identification
     reference = models.CharField(
@@ -123,6 +147,19 @@ class Affaire(StatusTrackingModel):
         help_text="Montant total payé (HT)"
     )
     
+    # Transitions de statut autorisées depuis l'API
+    TRANSITIONS_AUTORISEES = {
+        'BROUILLON': ['VALIDE', 'ANNULEE'],
+        'VALIDE': ['EN_COURS', 'ANNULEE'],
+        'EN_COURS': ['EN_PAUSE', 'TERMINEE', 'ANNULEE'],
+        'EN_PAUSE': ['EN_COURS', 'TERMINEE', 'ANNULEE'],
+        'TERMINEE': ['EN_COURS'],  # Réouverture possible
+        'ANNULEE': ['BROUILLON']  # Réactivation possible
+    }
+
+    # Le passage à VALIDE initialise le projet (voir changer_statut)
+    statuts_avec_effets = ('VALIDE',)
+
     class Meta:
         verbose_name = "Affaire"
         verbose_name_plural = "Affaires"
@@ -131,6 +168,8 @@ class Affaire(StatusTrackingModel):
             models.Index(fields=['reference']),
             models.Index(fields=['statut']),
             models.Index(fields=['date_creation']),
+            models.Index(fields=['client', 'date_creation']),
+            models.Index(fields=['entity', 'date_creation']),
         ]
     
     def __str__(self):
@@ -163,16 +202,18 @@ class Affaire(StatusTrackingModel):
         
         # Format: AFF + année (2 chiffres) + mois + ID client + ID offre + séquence
         if not self.sequence_number:
-            # Récupère le dernier numéro de séquence pour le mois en cours
-            last_sequence = Affaire.objects.filter(
-                doc_type='AFF',
-                date_creation__year=date.year,
-                date_creation__month=date.month
-            ).aggregate(Max('sequence_number'))['sequence_number__max'] or 0
-            
-            self.sequence_number = last_sequence + 1
+            # Prochain numéro de séquence pour le mois en cours
+            self.sequence_number = next_sequence(
+                'AFF',
+                period=month_period(date),
+                initial=lambda: Affaire.objects.filter(
+                    doc_type='AFF',
+                    date_creation__year=date.year,
+                    date_creation__month=date.month
+                ).aggregate(Max('sequence_number'))['sequence_number__max']
+            )
         
-        client_id = str(self.offre.client.pk)
+        client_id = str(self.offre.client_id)
         offre_id = str(self.offre.pk)
         sequence = str(self.sequence_number).zfill(3)
         
@@ -181,6 +222,11 @@ class Affaire(StatusTrackingModel):
     def save(self, *args, **kwargs):
         """Sauvegarde avec génération de référence"""
         creating = not self.pk
+
+        # Client et entité recopiés de l'offre (voir Offre.propager_client_entite)
+        if creating or self.client_id is None:
+            self.client_id = self.offre.client_id
+            self.entity_id = self.offre.entity_id
         
         # Avant la première sauvegarde
         if creating:
@@ -202,6 +248,13 @@ class Affaire(StatusTrackingModel):
         # Sauvegarde l'objet avec la méthode parent
         super().save(*args, **kwargs)
     
+    @classmethod
+    def valeurs_changement_statut(cls, nouveau_statut, date_statut):
+        if nouveau_statut == 'TERMINEE':
+            # Date de fin réelle renseignée si absente, comme dans changer_statut()
+            return {'date_fin_reelle': Coalesce('date_fin_reelle', Value(date_statut))}
+        return {}
+
     def changer_statut(self, nouveau_statut, user=None, date_specifique=None, commentaire="", metadata=None):
         """
         Change le statut de l'affaire avec des actions spécifiques selon le statut
@@ -217,9 +270,6 @@ class Affaire(StatusTrackingModel):
         if nouveau_statut == 'TERMINEE' and not self.date_fin_reelle:
             self.date_fin_reelle = date_specifique or now()
         
-        # Stocker cet ancien statut pour utilisation dans les signaux
-        self._old_statut = ancien_statut
-        
         # Utiliser la méthode de la classe parent pour changer le statut avec historique
         changed = self.set_status(
             nouveau_statut,
@@ -231,122 +281,135 @@ class Affaire(StatusTrackingModel):
         
         if changed and nouveau_statut == 'VALIDE' and ancien_statut != 'VALIDE':
             # Initialiser le projet si on passe à VALIDE
-            self.initialiser_projet()
+            self.planifier_initialisation()
         
         return changed
     
+    def planifier_initialisation(self):
+        """
+        Met en file l'initialisation du projet, exécutée par un worker
+        (voir document.tasks.initialiser_projet). La clé d'idempotence porte
+        sur la validation (jeton posé par pre_save_affaire au passage à
+        VALIDE) : elle évite une seconde initialisation quand la même
+        validation est vue deux fois (signal post_save puis changer_statut()),
+        et une affaire réactivée puis validée à nouveau est réinitialisée.
+        """
+        from document.jobs import enqueue
+
+        validation = getattr(self, '_validation_token', None) or uuid.uuid4().hex
+        return enqueue(
+            'affaires.initialiser_projet', self.pk, key=f"initialiser_projet:{self.pk}:{validation}", priority=10
+        )
+
     @transaction.atomic
     def initialiser_projet(self):
-        """Initialise tous les éléments du projet après validation"""
+        """
+        Initialise tous les éléments du projet après validation : rapports,
+        formations et facture initiale.
+
+        L'offre, ses produits et leurs catégories sont lus une fois, les
+        références réservées par bloc et les lignes insérées par bulk_create :
+        le nombre de requêtes ne dépend pas du nombre de produits.
+        """
         self.cree_rapports()
         self.cree_facture_initiale()
         
         # Événement de journal
         # self.log_event("Affaire initialisée", "Création des rapports et de la facture initiale")
     
+    def _offre_chargee(self):
+        """Offre avec client, entité et produit principal, lue en une requête si besoin"""
+        from offres_app.models import Offre
+
+        relations = ('client', 'entity', 'produit_principal')
+        offre_field = self._meta.get_field('offre')
+        if not offre_field.is_cached(self) or not all(
+            Offre._meta.get_field(name).is_cached(self.offre) for name in relations
+        ):
+            self.offre = Offre.objects.select_related(*relations).get(pk=self.offre_id)
+        return self.offre
+
     def cree_rapports(self):
-        """Crée les rapports pour chaque produit de l'offre"""
-        from document.models import Rapport
+        """Crée les rapports pour chaque produit de l'offre, et les formations des produits de formation"""
+        from document.models import Formation, Rapport
+        from document.sequences import bulk_create_documents, bulk_create_with_references
         import logging
 
         logger = logging.getLogger(__name__)
         logger.info(f"Création des rapports pour l'affaire {self.reference}")
 
+        offre = self._offre_chargee()
         with transaction.atomic():
             # Récupération des rapports existants pour ne pas les recréer
             existing_reports = {
-                rapport.produit.pk: rapport 
+                rapport.produit_id: rapport
                 for rapport in Rapport.objects.filter(affaire=self)
             }
+            produits = list(offre.produits.select_related('category').order_by('pk'))
 
-            rapports_crees = []
-            produits_traites = set()
-
-            # Traiter chaque produit individuellement
-            for produit in self.offre.produits.all():
-                # Éviter les doublons de produits
-                if produit.id in produits_traites:
-                    logger.warning(f"Produit {produit.id} déjà traité pour l'affaire {self.reference}")
-                    continue
-
-                produits_traites.add(produit.id)
-
-                # Vérifier si ce rapport existe déjà
-                if produit.id in existing_reports:
-                    rapport = existing_reports[produit.id]
-                    logger.info(f"Rapport déjà existant pour produit {produit.id} dans l'affaire {self.reference}")
-                else:
-                    # Créer un nouveau rapport avec get_or_create pour éviter les conflits
-                    rapport, created = Rapport.objects.get_or_create(
-                        affaire=self,
-                        produit=produit,
-                        defaults={
-                            "client": self.offre.client,
-                            "entity": self.offre.entity,
-                            "sequence_number": self.sequence_number,
-                            "statut": 'BROUILLON'
-                        }
-                    )
-
-                    if created:
-                        logger.info(f"Nouveau rapport créé pour produit {produit.id} dans l'affaire {self.reference}")
-                    else:
-                        logger.info(f"Rapport existant trouvé pour produit {produit.id} dans l'affaire {self.reference}")
+            nouveaux = [
+                Rapport(
+                    affaire=self,
+                    produit=produit,
+                    client=offre.client,
+                    entity=offre.entity,
+                    sequence_number=self.sequence_number,
+                    statut='BROUILLON'
+                )
+                for produit in produits if produit.pk not in existing_reports
+            ]
+            bulk_create_with_references(Rapport, nouveaux)
+            rapports = {**existing_reports, **{rapport.produit_id: rapport for rapport in nouveaux}}
+            rapports_crees = [rapports[produit.pk] for produit in produits]
 
-                rapports_crees.append(rapport)
+            # Formations des produits de formation, sauf celles qui existent déjà
+            rapports_formation = [
+                (produit, rapports[produit.pk]) for produit in produits if produit.category.code == 'FOR'
+            ]
+            existantes = set()
+            if any(produit.pk in existing_reports for produit, rapport in rapports_formation):
+                existantes = set(Formation.objects.filter(
+                    rapport__in=[rapport.pk for produit, rapport in rapports_formation]
+                ).values_list('rapport_id', flat=True))
+            formations = bulk_create_documents(Formation, [
+                Formation(
+                    rapport=rapport,
+                    titre=f"Formation {produit.name}",
+                    client=offre.client,
+                    affaire=self,
+                    date_debut=self.date_debut,
+                    date_fin=self.date_fin_prevue,
+                    description=f"Formation {produit.name} pour {offre.client.nom}"
+                )
+                for produit, rapport in rapports_formation if rapport.pk not in existantes
+            ])
 
-                # Traiter immédiatement si c'est une formation
-                if produit.category.code == 'FOR':
-                    try:
-                        self.cree_formation(produit, rapport)
-                        logger.info(f"Formation créée pour rapport {rapport.pk}")
-                    except Exception as e:
-                        logger.error(f"Erreur lors de la création de formation pour rapport {rapport.pk}: {str(e)}")
-
-            return rapports_crees
-    
-    def cree_formation(self, produit, rapport=None):
-        """Crée une formation pour le produit spécifié"""
-        from document.models import Formation, Rapport
-        
-        # Si le rapport n'est pas fourni, essaie de le récupérer
-        if not rapport:
-            try:
-                rapport = Rapport.objects.get(affaire=self, produit=produit)
-            except Rapport.DoesNotExist:
-                return None
-        
-        # Crée la formation avec get_or_create pour éviter les doublons
-        formation, created = Formation.objects.get_or_create(
-            rapport=rapport,
-            defaults={
-                "titre": f"Formation {produit.name}",
-                "client": self.offre.client,
-                "affaire": self,
-                "date_debut": self.date_debut,
-                "date_fin": self.date_fin_prevue,
-                "description": f"Formation {produit.name} pour {self.offre.client.nom}"
-            }
+        logger.info(
+            f"Affaire {self.reference} : {len(nouveaux)} rapport(s) et {len(formations)} formation(s) créés, "
+            f"{len(existing_reports)} rapport(s) existant(s)"
         )
-        
-        return formation
+        return rapports_crees
     
     def cree_facture_initiale(self):
         """Crée la facture initiale pour l'affaire"""
+        from document.sequences import bulk_create_with_references
+
         # Vérifie si une facture existe déjà
         if Facture.objects.filter(affaire=self).exists():
             return None
         
-        # Crée la facture avec get_or_create pour éviter les doublons
-        facture, created = Facture.objects.get_or_create(
+        offre = self._offre_chargee()
+        facture = Facture(
             affaire=self,
-            defaults={
-                "statut": 'BROUILLON',
-                "sequence_number": self.sequence_number,
-                "montant_ht": self.montant_total,
-                "created_by": self.createur
-            }
+            client=offre.client,
+            entity=offre.entity,
+            statut='BROUILLON',
+            sequence_number=self.sequence_number,
+            montant_ht=self.montant_total,
+            created_by_id=self.createur_id
         )
+        facture.completer_champs()
+        bulk_create_with_references(Facture, [facture])
         
         return facture
     
@@ -354,13 +417,19 @@ class Affaire(StatusTrackingModel):
         """Calcule le pourcentage de progression de l'affaire"""
         from document.models import Rapport
         
-        rapports = Rapport.objects.filter(affaire=self)
-        total_rapports = rapports.count()
+        # Rapports préchargés (prefetch_related) : calcul sans requête
+        if 'rapports' in getattr(self, '_prefetched_objects_cache', {}):
+            statuts = [rapport.statut for rapport in self.rapports.all()]
+            total_rapports = len(statuts)
+            rapports_termines = sum(statut in ('VALIDE', 'TERMINE') for statut in statuts)
+        else:
+            rapports = Rapport.objects.filter(affaire=self)
+            total_rapports = rapports.count()
+            rapports_termines = rapports.filter(statut__in=['VALIDE', 'TERMINE']).count() if total_rapports else 0
         
         if total_rapports == 0:
             return 0
         
-        rapports_termines = rapports.filter(statut__in=['VALIDE', 'TERMINE']).count()
         return int((rapports_termines / total_rapports) * 100)
     
     def get_montant_restant_a_facturer(self):
@@ -386,20 +455,15 @@ def pre_save_affaire(sender, instance, **kwargs):
         if not hasattr(instance, 'createur') or not instance.createur:
             instance.createur = instance.created_by
     
-    # Vérifier le changement de statut si c'est une mise à jour
-    if instance.pk:
-        try:
-            old_instance = Affaire.objects.get(pk=instance.pk)
-            
-            # Si le statut a changé mais qu'on n'a pas utilisé changer_statut()
-            if old_instance.statut != instance.statut and not hasattr(instance, '_old_statut'):
-                instance._old_statut = old_instance.statut
-                
-                # Mettre à jour la date de fin réelle si nécessaire
-                if instance.statut == 'TERMINEE' and not instance.date_fin_reelle:
-                    instance.date_fin_reelle = now()
-        except Affaire.DoesNotExist:
-            pass
+    # Passage à VALIDE : jeton de cette validation (voir planifier_initialisation)
+    if instance.statut == 'VALIDE' and instance.previous('statut') != 'VALIDE':
+        instance._validation_token = uuid.uuid4().hex
+
+    # Changement de statut sans passer par changer_statut() : statut chargé suivi, sans relecture
+    if instance.previous('statut') is not None and 'statut' in instance.changed_fields():
+        # Mettre à jour la date de fin réelle si nécessaire
+        if instance.statut == 'TERMINEE' and not instance.date_fin_reelle:
+            instance.date_fin_reelle = now()
 
 
 @receiver(post_save, sender=Affaire)
@@ -410,10 +474,9 @@ def post_save_affaire(sender, instance, created, **kwargs):
     """
     # Vérifier si l'affaire vient d'être créée avec statut VALIDE
     if created and instance.statut == 'VALIDE':
-        # Appeler initialiser_projet en dehors de la transaction courante
-        transaction.on_commit(lambda: instance.initialiser_projet())
+        # Mise en file dans la transaction courante : visible des workers après son commit
+        instance.planifier_initialisation()
     
-    # Vérifier si le statut vient de passer à VALIDE (sans utiliser changer_statut)
-    elif hasattr(instance, '_old_statut') and instance._old_statut != 'VALIDE' and instance.statut == 'VALIDE':
-        # Appeler initialiser_projet en dehors de la transaction courante
-        transaction.on_commit(lambda: instance.initialiser_projet())
\ No newline at end of file
+    # Vérifier si le statut vient de passer à VALIDE
+    elif instance.statut == 'VALIDE' and instance.previous('statut') not in (None, 'VALIDE'):
+        instance.planifier_initialisation()
\ No newline at end of file
@@ -27,8 +27,8 @@ class AffairePermission(permissions.BasePermission):
         if view.action == 'create':
             return request.user.has_perm('affaires_app.add_affaire')
         
-        # Pour modifier un statut, l'utilisateur doit avoir la permission
-        if view.action == 'change_statut':
+        # Pour modifier un statut (une affaire ou un lot), l'utilisateur doit avoir la permission
+        if view.action in ('change_statut', 'bulk_status'):
             return request.user.has_perm('affaires_app.change_statut_affaire')
         
         # Pour générer une facture
@@ -6,6 +6,7 @@ from factures_app.models import Facture
 
 from .models import Affaire
 from document.models import Rapport, Formation
+from document.status_history import HistoryListSerializer, StatusChangeSerializer
 from offres_app.models import Offre
 from offres_app.serializers import OffreSerializer, ClientLightSerializer
 
@@ -33,7 +34,7 @@ class RapportSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'produit', 'produit_nom', 'produit_category', 
             'statut', 'statut_display', 'has_formation',
-            'date_creation', 'date_modification'
+            'date_creation'
         ]
     
     def get_has_formation(self, obj):
@@ -84,6 +85,12 @@ class AffaireSerializer(serializers.ModelSerializer):
             'progression', 'en_retard',
             'date_creation', 'date_modification'
         ]
+        # Relations lues par get_responsable_nom et get_progression
+        select_related = ['responsable']
+        prefetch_related = ['rapports']
+        # ?historique=N : dernières transitions de statut de chaque ligne, en une requête par page
+        list_serializer_class = HistoryListSerializer
+        history_serializer = StatusChangeSerializer
     
     def get_responsable_nom(self, obj):
         """Retourne le nom complet du responsable."""
@@ -173,7 +180,7 @@ class AffaireCreateSerializer(serializers.ModelSerializer):
         
         # Si l'affaire est créée avec le statut VALIDE, on initialise automatiquement
         if instance.statut == 'VALIDE':
-            instance.initialiser_projet()
+            instance.planifier_initialisation()
         
         return instance
 
@@ -188,18 +195,8 @@ class ChangeStatutSerializer(serializers.Serializer):
         affaire = self.context['view'].get_object()
         nouveau_statut = data['statut']
         
-        # Définition des transitions autorisées
-        transitions_autorisees = {
-            'BROUILLON': ['VALIDE', 'ANNULEE'],
-            'VALIDE': ['EN_COURS', 'ANNULEE'],
-            'EN_COURS': ['EN_PAUSE', 'TERMINEE', 'ANNULEE'],
-            'EN_PAUSE': ['EN_COURS', 'TERMINEE', 'ANNULEE'],
-            'TERMINEE': ['EN_COURS'],  # Réouverture possible
-            'ANNULEE': ['BROUILLON']  # Réactivation possible
-        }
-        
         # Vérification de la transition
-        if nouveau_statut not in transitions_autorisees.get(affaire.statut, []):
+        if nouveau_statut not in Affaire.TRANSITIONS_AUTORISEES.get(affaire.statut, []):
             raise serializers.ValidationError({
                 'statut': f"Transition de '{affaire.statut}' vers '{nouveau_statut}' non autorisée."
             })
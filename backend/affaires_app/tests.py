@@ -1,3 +1,142 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from document.fixtures import DocumentFixturesMixin
+from document.jobs import work
+from document.models import Category, DocumentDailyStat, DocumentIndex, Formation, Job, Product, Rapport
+from factures_app.models import Facture
+from offres_app.models import OffreProduit
+from .models import Affaire
+
+
+class AffaireInitialisationTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('init', superuser=True, client_nom='Client init')
+        formation = Category.objects.create(code='FOR', name='Formation', entity=self.entity)
+        self.produits = [
+            Product.objects.create(code=f'P{i}', name=f'Produit {i}', category=formation if i % 3 == 0 else self.category)
+            for i in range(12)
+        ]
+
+    def _affaire(self, produits):
+        offre = self.create_offre(produit_principal=produits[0], createur=self.user, montant=100)
+        for produit in produits:
+            OffreProduit.objects.create(offre=offre, produit=produit)
+        offre.changer_statut('GAGNE', user=self.user)
+        return Affaire.objects.get(offre=offre)
+
+    def _initialiser(self, affaire):
+        with CaptureQueriesContext(connection) as queries:
+            affaire.initialiser_projet()
+        return [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+
+    def test_query_count_does_not_grow_with_products(self):
+        # Première affaire : création des compteurs de séquence
+        self._initialiser(self._affaire(self.produits[:3]))
+        petite = self._initialiser(self._affaire(self.produits[:3]))
+        affaire = self._affaire(self.produits)
+        grande = self._initialiser(affaire)
+        self.assertEqual(len(grande), len(petite))
+
+        rapports = Rapport.objects.filter(affaire=affaire)
+        self.assertEqual(rapports.count(), 12)
+        self.assertEqual(Formation.objects.filter(affaire=affaire).count(), 4)
+        self.assertEqual(DocumentIndex.objects.filter(doc_type='RAP').count(), 18)
+        self.assertEqual(DocumentIndex.objects.filter(doc_type='FOR').count(), 6)
+        # Rangs par client (6 rapports des affaires précédentes) et par catégorie
+        self.assertEqual(
+            rapports.get(produit=self.produits[4]).reference,
+            f"KES/RAP/{self.client_obj.c_num}/{affaire.reference}/7/P4/11/{affaire.sequence_number:04d}"
+        )
+
+        facture = Facture.objects.get(affaire=affaire)
+        self.assertEqual(facture.client, self.client_obj)
+        self.assertEqual(facture.montant_ttc, affaire.montant_total * Decimal('1.1925'))
+        self.assertTrue(facture.reference.endswith(f"/{affaire.reference}/P0/3/{facture.sequence_number:04d}"))
+        self.assertEqual(
+            DocumentDailyStat.objects.get(doc_type='FAC', statut='BROUILLON').count, 3
+        )
+
+    def test_initialisation_is_idempotent(self):
+        affaire = self._affaire(self.produits[:6])
+        self._initialiser(affaire)
+        Formation.objects.filter(affaire=affaire).first().delete()
+
+        rapports = affaire.cree_rapports()
+        self.assertEqual(len(rapports), 6)
+        self.assertEqual(Rapport.objects.filter(affaire=affaire).count(), 6)
+        self.assertEqual(Formation.objects.filter(affaire=affaire).count(), 2)
+        self.assertIsNone(affaire.cree_facture_initiale())
+
+    def test_validation_initialises_project_with_default_settings(self):
+        # Sans worker déployé (JOBS_ASYNC = False), la validation crée rapports et facture
+        affaire = self._affaire(self.produits[:3])
+        affaire.changer_statut('VALIDE', user=self.user)
+        self.assertEqual(Rapport.objects.filter(affaire=affaire).count(), 3)
+        self.assertTrue(Facture.objects.filter(affaire=affaire).exists())
+        self.assertEqual(Job.objects.get(name='affaires.initialiser_projet').statut, 'DONE')
+
+    @override_settings(JOBS_ASYNC=True)
+    def test_validation_enqueues_project_initialisation(self):
+        affaire = self._affaire(self.produits[1:2])
+
+        affaire.changer_statut('VALIDE', user=self.user)
+        # changer_statut() et le signal post_save : une seule tâche
+        queued = Job.objects.get(name='affaires.initialiser_projet')
+        self.assertEqual(queued.args, [affaire.pk])
+        self.assertFalse(Rapport.objects.filter(affaire=affaire).exists())
+
+        work(threading.Event(), burst=True)
+        self.assertEqual(Rapport.objects.filter(affaire=affaire).count(), 1)
+        response = self.api.get(f'/api/jobs/{queued.pk}/')
+        self.assertEqual(response.json()['statut'], 'DONE')
+        self.assertEqual(response.json()['result'], {'rapports': 1})
+
+    @override_settings(JOBS_ASYNC=True)
+    def test_each_validation_is_initialised_once(self):
+        affaire = self._affaire(self.produits[:3])
+        jobs = Job.objects.filter(name='affaires.initialiser_projet', args=[affaire.pk])
+        affaire.changer_statut('VALIDE', user=self.user)
+        self.assertEqual(jobs.count(), 1)
+
+        # Réactivation : ANNULEE -> BROUILLON -> VALIDE
+        jobs.update(statut='DONE')
+        affaire.changer_statut('ANNULEE', user=self.user)
+        affaire.changer_statut('BROUILLON', user=self.user)
+        affaire.changer_statut('VALIDE', user=self.user)
+        self.assertEqual(jobs.count(), 2)
+        self.assertEqual(jobs.filter(statut='PENDING').count(), 1)
+
+    def test_sub_lists(self):
+        affaire = self._affaire(self.produits[:3])
+        affaire.initialiser_projet()
+
+        response = self.api.get(f'/api/affaires/{affaire.pk}/rapports/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(row['produit'] for row in response.json()), [produit.pk for produit in self.produits[:3]]
+        )
+        self.assertEqual([row['has_formation'] for row in response.json() if row['produit'] == self.produits[0].pk], [True])
+
+        response = self.api.get(f'/api/affaires/{affaire.pk}/factures/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()], [Facture.objects.get(affaire=affaire).pk])
+
+    def test_bulk_status_respects_transitions(self):
+        affaires = [self._affaire(self.produits[1:2]) for _ in range(2)]
+        affaires[0].changer_statut('VALIDE')
+        affaires[0].changer_statut('EN_COURS')
+
+        response = self.api.post(
+            '/api/affaires/bulk_status/', {'ids': [a.pk for a in affaires], 'statut': 'TERMINEE'}, format='json'
+        )
+        self.assertEqual(response.json()['modifies'], 1)
+        terminee = Affaire.objects.get(pk=affaires[0].pk)
+        self.assertEqual(terminee.statut, 'TERMINEE')
+        self.assertIsNotNone(terminee.date_fin_reelle)
+        self.assertEqual(Affaire.objects.get(pk=affaires[1].pk).statut, 'BROUILLON')
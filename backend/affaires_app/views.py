@@ -11,11 +11,16 @@ from api import user
 from api.user.models import User
 from api.user.serializers import UserSerializer
 from document.utils import log_user_action
+from factures_app.models import Facture
 from offres_app.models import Offre
 from offres_app.serializers import OffreSerializer
 
 from .models import Affaire
+from document.bulk_status import BulkStatusMixin
 from document.models import Rapport, Formation
+from document.pagination import PaginatedActionMixin
+from document.query_plan import QueryPlanMixin
+from document.status_durations import status_duration_stats
 from .serializers import (
     AffaireSerializer, 
     AffaireDetailSerializer, 
@@ -29,16 +34,18 @@ from .filters import AffaireFilter
 from .permissions import AffairePermission
 
 
-class AffaireViewSet(viewsets.ModelViewSet):
+class AffaireViewSet(QueryPlanMixin, PaginatedActionMixin, BulkStatusMixin, viewsets.ModelViewSet):
     """
     ViewSet pour la gestion des affaires.
     Fournit les opérations CRUD standard ainsi que des actions personnalisées.
     """
     queryset = Affaire.objects.all()
+    # L'export CSV parcourt la liste avec les mêmes relations que le sérialiseur
+    planned_actions = QueryPlanMixin.planned_actions + ('export_csv',)
     permission_classes = [IsAuthenticated, AffairePermission]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = AffaireFilter
-    search_fields = ['reference', 'offre__client__nom']
+    search_fields = ['reference', 'client__nom']
     ordering_fields = ['date_creation', 'date_debut', 'date_fin_prevue', 'montant_total', 'statut']
     ordering = ['-date_creation']
 
@@ -93,6 +100,11 @@ class AffaireViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def get_bulk_status_queryset(self, statut):
+        """Changement groupé : seules les affaires dont la transition est autorisée"""
+        sources = [source for source, cibles in Affaire.TRANSITIONS_AUTORISEES.items() if statut in cibles]
+        return super().get_bulk_status_queryset(statut).filter(statut__in=sources)
+
     @action(detail=True, methods=['get'])
     def rapports(self, request, pk=None):
         """
@@ -100,8 +112,7 @@ class AffaireViewSet(viewsets.ModelViewSet):
         """
         affaire = self.get_object()
         rapports = Rapport.objects.filter(affaire=affaire)
-        serializer = RapportSerializer(rapports, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(rapports, RapportSerializer)
     
     @action(detail=True, methods=['get'])
     def initData(self, request, pk=None):
@@ -126,8 +137,7 @@ class AffaireViewSet(viewsets.ModelViewSet):
         """
         affaire = self.get_object()
         factures = Facture.objects.filter(affaire=affaire)
-        serializer = FactureSerializer(factures, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(factures, FactureSerializer)
     
     @action(detail=True, methods=['post'])
     def generer_facture(self, request, pk=None):
@@ -231,6 +241,15 @@ class AffaireViewSet(viewsets.ModelViewSet):
         }
 
         return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def durees_statuts(self, request):
+        """
+        Durées passées par les affaires dans chaque statut (nombre, moyenne,
+        p50/p90/p95 en heures), par statut, entité et produit. Filtres :
+        date_debut, date_fin, entity, produit, statut.
+        """
+        return Response(status_duration_stats('affaires_app.Affaire', request.query_params))
     
     @action(detail=False, methods=['get'])
     def export_csv(self, request):
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ClientConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'client'
+
+    def ready(self):
+        from .kpi import connect_signals
+        connect_signals()
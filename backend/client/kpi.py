@@ -0,0 +1,205 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.utils.timezone import now
+
+# Durée de validité maximale d'un instantané, filet de sécurité pour les
+# écritures qui ne passent pas par les signaux (QuerySet.update())
+KPI_MAX_AGE = timedelta(seconds=getattr(settings, 'CLIENT_KPI_MAX_AGE', 3600))
+
+# Modèles rattachés directement au client, pour invalider l'instantané à chaque écriture
+KPI_SOURCES = (
+    'opportunites_app.Opportunite',
+    'offres_app.Offre',
+    'affaires_app.Affaire',
+    'factures_app.Facture',
+    'client.Contact',
+    'client.Site',
+    'document.Formation',
+    'document.Rapport',
+)
+
+
+def _par_client(model, chemin, client_ids, **agregats):
+    """Une requête groupée par client avec agrégation conditionnelle"""
+    lignes = apps.get_model(model).objects.filter(**{f"{chemin}__in": client_ids}).order_by().values(
+        chemin
+    ).annotate(**agregats)
+    return {ligne[chemin]: ligne for ligne in lignes}
+
+
+def _nombre(model, chemin='client'):
+    """Sous-requête corrélée : nombre d'objets de `model` rattachés au client"""
+    return Coalesce(Subquery(
+        apps.get_model(model).objects.filter(**{chemin: OuterRef('pk')}).order_by().values(chemin).annotate(
+            n=Count('pk')
+        ).values('n'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def compute_client_kpis(client_ids):
+    """
+    Calcule les indicateurs de plusieurs clients en cinq requêtes, quel que
+    soit leur nombre.
+
+    Returns:
+        dict: id client -> indicateurs (format de /api/clients/{id}/statistiques/)
+    """
+    from .models import Client
+
+    client_ids = list(client_ids)
+    opportunites = _par_client(
+        'opportunites_app.Opportunite', 'client', client_ids,
+        total=Count('pk'),
+        gagnees=Count('pk', filter=Q(statut='GAGNEE')),
+        perdues=Count('pk', filter=Q(statut='PERDUE')),
+        valeur_totale=Sum('montant_estime'),
+    )
+    offres = _par_client(
+        'offres_app.Offre', 'client', client_ids,
+        total=Count('pk'),
+        gagnees=Count('pk', filter=Q(statut='GAGNE')),
+        perdues=Count('pk', filter=Q(statut='PERDU')),
+        valeur_totale=Sum('montant'),
+    )
+    affaires = _par_client(
+        'affaires_app.Affaire', 'client', client_ids,
+        total=Count('pk'),
+        en_cours=Count('pk', filter=Q(statut='EN_COURS')),
+        terminees=Count('pk', filter=Q(statut='TERMINEE')),
+        annulees=Count('pk', filter=Q(statut='ANNULEE')),
+    )
+    factures = _par_client(
+        'factures_app.Facture', 'client', client_ids,
+        total=Count('pk'),
+        valeur_totale=Sum('montant_ttc'),
+        montant_paye=Sum('montant_paye'),
+    )
+    compteurs = Client.objects.filter(pk__in=client_ids).annotate(
+        nb_contacts=_nombre('client.Contact'),
+        nb_sites=_nombre('client.Site'),
+        nb_formations=_nombre('document.Formation'),
+        nb_rapports=_nombre('document.Rapport'),
+    ).values_list('pk', 'nb_contacts', 'nb_sites', 'nb_formations', 'nb_rapports')
+
+    resultats = {}
+    for client_id, nb_contacts, nb_sites, nb_formations, nb_rapports in compteurs:
+        opp = opportunites.get(client_id, {})
+        off = offres.get(client_id, {})
+        aff = affaires.get(client_id, {})
+        fac = factures.get(client_id, {})
+        resultats[client_id] = {
+            'opportunites': {
+                'total': opp.get('total', 0),
+                'gagnees': opp.get('gagnees', 0),
+                'perdues': opp.get('perdues', 0),
+                'en_cours': opp.get('total', 0) - opp.get('gagnees', 0) - opp.get('perdues', 0),
+                'valeur_totale': float(opp.get('valeur_totale') or 0),
+            },
+            'offres': {
+                'total': off.get('total', 0),
+                'gagnees': off.get('gagnees', 0),
+                'perdues': off.get('perdues', 0),
+                'en_cours': off.get('total', 0) - off.get('gagnees', 0) - off.get('perdues', 0),
+                'valeur_totale': float(off.get('valeur_totale') or 0),
+            },
+            'affaires': {
+                'total': aff.get('total', 0),
+                'en_cours': aff.get('en_cours', 0),
+                'terminees': aff.get('terminees', 0),
+                'annulees': aff.get('annulees', 0),
+            },
+            'factures': {
+                'total': fac.get('total', 0),
+                'valeur_totale': float(fac.get('valeur_totale') or 0),
+                'montant_paye': float(fac.get('montant_paye') or 0),
+            },
+            'contacts': nb_contacts,
+            'sites': nb_sites,
+            'formations': nb_formations,
+            'rapports': nb_rapports,
+        }
+    return resultats
+
+
+def refresh_client_kpis(client_ids):
+    """Recalcule et enregistre les instantanés de plusieurs clients"""
+    from .models import ClientKpiSnapshot
+
+    calcule_le = now()
+    snapshots = [
+        ClientKpiSnapshot(client_id=client_id, donnees=donnees, calcule_le=calcule_le)
+        for client_id, donnees in compute_client_kpis(client_ids).items()
+    ]
+    ClientKpiSnapshot.objects.bulk_create(
+        snapshots, update_conflicts=True, unique_fields=['client'], update_fields=['donnees', 'calcule_le']
+    )
+    return snapshots
+
+
+def get_client_kpis(client_id):
+    """
+    Indicateurs d'un client : une lecture de l'instantané, recalculé seulement
+    s'il a été invalidé ou s'il est trop ancien.
+
+    Returns:
+        ClientKpiSnapshot
+    """
+    from .models import ClientKpiSnapshot
+
+    snapshot = ClientKpiSnapshot.objects.filter(client_id=client_id).first()
+    if snapshot is None or snapshot.calcule_le < now() - KPI_MAX_AGE:
+        snapshots = refresh_client_kpis([client_id])
+        snapshot = snapshots[0] if snapshots else None
+    return snapshot
+
+
+def invalidate_snapshots(client_ids):
+    """Supprime les instantanés de clients"""
+    from .models import ClientKpiSnapshot
+
+    ClientKpiSnapshot.objects.filter(client_id__in=[pk for pk in client_ids if pk is not None]).delete()
+
+
+def invalidate_client_kpis(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    client_ids = {instance.client_id}
+    # Document réattribué : le client d'origine (suivi par FieldTrackerMixin) perd un document
+    if hasattr(instance, 'previous'):
+        client_ids.add(instance.previous('client'))
+    invalidate_snapshots(client_ids)
+
+
+def invalidate_created(sender, instances, **kwargs):
+    """Documents créés en masse (bulk_created) : une suppression des instantanés des clients concernés"""
+    if sender._meta.label in KPI_SOURCES:
+        invalidate_snapshots({instance.client_id for instance in instances})
+
+
+def invalidate_bulk_status(sender, pks, **kwargs):
+    """Changement de statut groupé : une suppression des instantanés des clients concernés"""
+    from .models import ClientKpiSnapshot
+
+    if sender._meta.label in KPI_SOURCES:
+        ClientKpiSnapshot.objects.filter(
+            client__in=sender.objects.filter(pk__in=pks).values('client_id')
+        ).delete()
+
+
+def connect_signals():
+    """Invalide l'instantané d'un client à chaque écriture sur l'un de ses documents"""
+    from document.bulk_status import bulk_status_changed
+    from document.sequences import bulk_created
+
+    bulk_status_changed.connect(invalidate_bulk_status, dispatch_uid='client_kpi_bulk_status')
+    bulk_created.connect(invalidate_created, dispatch_uid='client_kpi_bulk_created')
+    for label in KPI_SOURCES:
+        model = apps.get_model(label)
+        post_save.connect(invalidate_client_kpis, sender=model, dispatch_uid=f'client_kpi_save_{label}')
+        post_delete.connect(invalidate_client_kpis, sender=model, dispatch_uid=f'client_kpi_delete_{label}')
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0011_alter_client_created_by_alter_client_updated_by_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientKpiSnapshot',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='kpi_snapshot', serialize=False, to='client.client')),
+                ('donnees', models.JSONField(default=dict)),
+                ('calcule_le', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Indicateurs client',
+                'verbose_name_plural': 'Indicateurs clients',
+            },
+        ),
+    ]
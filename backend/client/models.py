@@ -6,6 +6,8 @@ from django.utils.timezone import now
 from django.conf import settings
 from django.db import models
 
+from document.sequences import allocate_sequences, next_sequence, year_period
+
 class AuditableMixin(models.Model):
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -123,12 +125,34 @@ class Client(AuditableMixin, models.Model):
 
     def save(self, *args, **kwargs):
         if not self.c_num:
-            last_client = Client.objects.filter(
-                created_at__year=now().year
-            ).count() + 1
-            self.c_num = f"c{str(now().year)[-2:]}{now().month:02d}{now().day:02d}{last_client:04d}"
+            last_client = next_sequence(
+                'CLI',
+                period=year_period(),
+                initial=lambda: Client.objects.filter(created_at__year=now().year).count()
+            )
+            self.c_num = self._formater_c_num(last_client)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def _formater_c_num(numero):
+        return f"c{str(now().year)[-2:]}{now().month:02d}{now().day:02d}{numero:04d}"
+
+    @classmethod
+    def generer_references_en_masse(cls, clients):
+        """
+        Attribue les numéros client (c_num) à des clients non sauvegardés,
+        en vue d'un bulk_create : un seul bloc réservé pour toute la liste.
+        """
+        clients = [client for client in clients if not client.c_num]
+        numeros = allocate_sequences(
+            'CLI',
+            [{'period': year_period()} for _ in clients],
+            initial=lambda scope: Client.objects.filter(created_at__year=now().year).count()
+        )
+        for client, numero in zip(clients, numeros):
+            client.c_num = cls._formater_c_num(numero)
+        return clients
+
 class Site(AuditableMixin, models.Model):
     nom = models.CharField(max_length=255)
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='sites')
@@ -153,10 +177,12 @@ class Site(AuditableMixin, models.Model):
     )
     def save(self, *args, **kwargs):
         if not self.s_num:
-            last_site = Site.objects.filter(
-                client=self.client,
-                created_at__year=now().year
-            ).count() + 1
+            last_site = next_sequence(
+                'SIT',
+                client=self.client_id,
+                period=year_period(),
+                initial=lambda: Site.objects.filter(client=self.client_id, created_at__year=now().year).count()
+            )
             self.s_num = f"{self.client.c_num}{last_site:04d}"
         super().save(*args, **kwargs)
 
@@ -231,4 +257,21 @@ class Contact(models.Model):
 
     class Meta:
         verbose_name = "Contact"
-        verbose_name_plural = "Contacts"
\ No newline at end of file
+        verbose_name_plural = "Contacts"
+
+class ClientKpiSnapshot(models.Model):
+    """
+    Indicateurs d'un client (opportunités, offres, affaires, factures, contacts,
+    sites, formations, rapports) calculés par client.kpi et conservés jusqu'à
+    la prochaine écriture sur un document du client.
+    """
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, primary_key=True, related_name='kpi_snapshot')
+    donnees = models.JSONField(default=dict)
+    calcule_le = models.DateTimeField(default=now)
+
+    class Meta:
+        verbose_name = "Indicateurs client"
+        verbose_name_plural = "Indicateurs clients"
+
+    def __str__(self):
+        return f"Indicateurs {self.client_id} ({self.calcule_le:%d/%m/%Y %H:%M})"
@@ -1,3 +1,134 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from affaires_app.models import Affaire
+from document.denormalization import backfill_client_entity
+from document.fixtures import DocumentFixturesMixin
+from document.models import DocumentIndex
+from factures_app.models import Facture
+from offres_app.models import Offre
+from proformas_app.models import Proforma
+from .kpi import compute_client_kpis
+from .models import Client, ClientKpiSnapshot, Contact, Site
+
+
+class ClientReferenceTest(TestCase):
+
+    def test_bulk_references_follow_unit_saves(self):
+        premier = Client.objects.create(nom='Client unitaire')
+        clients = Client.generer_references_en_masse([Client(nom=f'Client {i}') for i in range(5)])
+        Client.objects.bulk_create(clients)
+        dernier = Client.objects.create(nom='Client unitaire')
+
+        numeros = sorted(int(c_num[-4:]) for c_num in Client.objects.values_list('c_num', flat=True))
+        self.assertEqual(numeros, list(range(1, 8)))
+        self.assertEqual((int(premier.c_num[-4:]), int(dernier.c_num[-4:])), (1, 7))
+
+
+class ClientKpiTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('kpi', client_nom='Client KPI')
+        Site.objects.create(nom='Site KPI', client=self.client_obj)
+        Contact.objects.create(nom='Contact KPI', client=self.client_obj)
+
+    def _offre(self, montant, statut='BROUILLON'):
+        offre = self.create_offre(montant=montant)
+        if statut != 'BROUILLON':
+            offre.statut = statut
+            offre.save()
+        return offre
+
+    def test_kpis_use_a_constant_number_of_queries(self):
+        self._offre(100)
+        self._offre(300, 'GAGNE')
+        autre = Client.objects.create(nom='Autre client')
+
+        with CaptureQueriesContext(connection) as queries:
+            kpis = compute_client_kpis([self.client_obj.pk, autre.pk])
+        self.assertEqual(len(queries), 5)
+
+        self.assertEqual(kpis[self.client_obj.pk]['offres'], {
+            'total': 2, 'gagnees': 1, 'perdues': 0, 'en_cours': 1, 'valeur_totale': 400.0
+        })
+        # L'offre gagnée a créé une affaire, rattachée au client par l'offre
+        self.assertEqual(kpis[self.client_obj.pk]['affaires']['total'], 1)
+        self.assertEqual(kpis[self.client_obj.pk]['contacts'], 1)
+        self.assertEqual(kpis[self.client_obj.pk]['sites'], 1)
+        self.assertEqual(kpis[autre.pk]['offres']['total'], 0)
+
+    def test_snapshot_is_read_then_invalidated_by_writes(self):
+        self._offre(100)
+        url = f'/api/clients/{self.client_obj.pk}/statistiques/'
+        self.assertEqual(self.api.get(url).json()['offres']['total'], 1)
+        self.assertTrue(ClientKpiSnapshot.objects.filter(client=self.client_obj).exists())
+
+        # Lecture suivante : client + instantané, sans recalcul
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get(url)
+        self.assertFalse(any('offres_app_offre' in query['sql'] for query in queries.captured_queries))
+
+        self._offre(50)
+        self.assertFalse(ClientKpiSnapshot.objects.filter(client=self.client_obj).exists())
+        self.assertEqual(self.api.get(url).json()['offres']['total'], 2)
+
+    def test_reassignment_invalidates_both_clients(self):
+        offre = self._offre(100)
+        autre = Client.objects.create(nom='Autre client')
+        for client in (self.client_obj, autre):
+            self.api.get(f'/api/clients/{client.pk}/statistiques/')
+
+        offre = Offre.objects.get(pk=offre.pk)
+        offre.client = autre
+        offre.save()
+        self.assertFalse(ClientKpiSnapshot.objects.exists())
+        self.assertEqual(self.api.get(f'/api/clients/{self.client_obj.pk}/statistiques/').json()['offres']['total'], 0)
+        self.assertEqual(self.api.get(f'/api/clients/{autre.pk}/statistiques/').json()['offres']['total'], 1)
+
+
+class ClientEntityDenormalizationTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('denorm', client_nom='Client A')
+        self.autre = Client.objects.create(nom='Client B')
+
+        self.offre = self.create_offre(montant=100)
+        self.offre.statut = 'GAGNE'
+        self.offre.save()
+        self.affaire = self.offre.affaire
+        self.facture = Facture.objects.create(affaire=self.affaire, montant_ht=100)
+
+    def _rattachements(self):
+        return {
+            model.__name__: model.objects.values_list('client_id', 'entity_id').get()
+            for model in (Affaire, Proforma, Facture)
+        }
+
+    def test_documents_copy_client_and_entity_of_the_offer(self):
+        attendu = (self.client_obj.pk, self.entity.pk)
+        self.assertEqual(self._rattachements(), {'Affaire': attendu, 'Proforma': attendu, 'Facture': attendu})
+
+        with CaptureQueriesContext(connection) as queries:
+            list(Facture.objects.filter(client=self.client_obj))
+        self.assertNotIn('JOIN', queries.captured_queries[0]['sql'])
+
+    def test_offer_reassignment_is_propagated(self):
+        self.offre.client = self.autre
+        self.offre.save()
+
+        attendu = (self.autre.pk, self.entity.pk)
+        self.assertEqual(self._rattachements(), {'Affaire': attendu, 'Proforma': attendu, 'Facture': attendu})
+        self.assertEqual(DocumentIndex.objects.get(doc_type='FAC', object_id=self.facture.pk).client_id, self.autre.pk)
+
+        self.assertEqual(self.api.get(f'/api/clients/{self.client_obj.pk}/factures/').json(), [])
+        self.assertEqual(self.api.get(f'/api/clients/{self.autre.pk}/factures/').json()[0]['id'], self.facture.pk)
+
+    def test_backfill_restores_missing_columns_in_batches(self):
+        Affaire.objects.update(client=None, entity=None)
+        Facture.objects.update(client=None, entity=None)
+
+        self.assertEqual(backfill_client_entity('affaires_app.Affaire', batch_size=1), 1)
+        self.assertEqual(backfill_client_entity('factures_app.Facture', batch_size=1), 1)
+        attendu = (self.client_obj.pk, self.entity.pk)
+        self.assertEqual(self._rattachements(), {'Affaire': attendu, 'Proforma': attendu, 'Facture': attendu})
@@ -3,11 +3,10 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Sum, Q
-from django.utils.timezone import now
 from datetime import timedelta
 from factures_app.models import Facture
 
+from .kpi import get_client_kpis
 from .models import Pays, Region, Ville, Client, Site, Contact
 from document.models import (
     Rapport, 
@@ -15,6 +14,9 @@ from document.models import (
 )
 from rest_framework import viewsets
 
+from document.pagination import PaginatedActionMixin
+from document.query_plan import QueryPlanMixin
+
 from .serializers import (
     ClientDetailSerializer, ClientWithContactsDetailSerializer, ClientWithContactsListSerializer, 
     ContactDetailedSerializer, PaysListSerializer, PaysDetailSerializer, PaysEditSerializer,
@@ -22,7 +24,7 @@ from .serializers import (
     VilleListSerializer, VilleDetailSerializer, VilleEditSerializer,
     ClientListSerializer, ClientEditSerializer,
     SiteListSerializer, SiteDetailSerializer, SiteEditSerializer,
-    ContactListSerializer, ContactDetailSerializer, ContactEditSerializer
+    ContactListSerializer, ContactDetailSerializer, ContactEditSerializer, ContactSerializer
 )
 
 from document.serializers import (
@@ -35,7 +37,7 @@ from offres_app.models import Offre
 from affaires_app.models import Affaire
 from opportunites_app.models import Opportunite
 from opportunites_app.serializers import OpportuniteSerializer
-class PaysViewSet(viewsets.ModelViewSet):
+class PaysViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Pays.objects.all()
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['nom', 'code_iso']
@@ -48,7 +50,7 @@ class PaysViewSet(viewsets.ModelViewSet):
             return PaysEditSerializer
         return PaysDetailSerializer
 
-class RegionViewSet(viewsets.ModelViewSet):
+class RegionViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Region.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['pays']
@@ -62,7 +64,7 @@ class RegionViewSet(viewsets.ModelViewSet):
             return RegionEditSerializer
         return RegionDetailSerializer
 
-class VilleViewSet(viewsets.ModelViewSet):
+class VilleViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Ville.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['region', 'region__pays']
@@ -76,8 +78,9 @@ class VilleViewSet(viewsets.ModelViewSet):
             return VilleEditSerializer
         return VilleDetailSerializer
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Client.objects.filter()
+    planned_actions = QueryPlanMixin.planned_actions + ('with_contacts_detail',)
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['ville', 'agreer', 'agreement_fournisseur', 'secteur_activite']
     search_fields = ['nom', 'c_num', 'email', 'telephone', 'matricule']
@@ -110,14 +113,13 @@ class ClientViewSet(viewsets.ModelViewSet):
     def with_contacts(self, request):
         """Retourne la liste des clients avec leurs contacts."""
         queryset = self.filter_queryset(self.get_queryset().prefetch_related('contacts'))
-        serializer = ClientWithContactsListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(queryset, ClientWithContactsListSerializer)
     
     @action(detail=True, methods=['get'])
     def with_contacts_detail(self, request, pk=None):
         """Retourne les détails d'un client avec ses contacts."""
         client = self.get_object()
-        serializer = ClientWithContactsDetailSerializer(client)
+        serializer = self.get_serializer(client)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
@@ -125,126 +127,68 @@ class ClientViewSet(viewsets.ModelViewSet):
         """Retourne les sites d'un client."""
         client = self.get_object()
         sites = Site.objects.filter(client=client)
-        serializer = SiteListSerializer(sites, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(sites, SiteListSerializer)
     
     @action(detail=True, methods=['get'])
     def contacts(self, request, pk=None):
         """Retourne les contacts d'un client."""
         client = self.get_object()
         contacts = Contact.objects.filter(client=client)
-        serializer = ContactListSerializer(contacts, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(contacts, ContactListSerializer)
     
     @action(detail=True, methods=['get'])
     def opportunites(self, request, pk=None):
         """Retourne les opportunités d'un client."""
         client = self.get_object()
         opportunites = Opportunite.objects.filter(client=client)
-        serializer = OpportuniteSerializer(opportunites, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(opportunites, OpportuniteSerializer)
     
     @action(detail=True, methods=['get'])
     def offres(self, request, pk=None):
         """Retourne les offres d'un client."""
         client = self.get_object()
         offres = Offre.objects.filter(client=client)
-        serializer = OffreListSerializer(offres, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(offres, OffreListSerializer)
     
     @action(detail=True, methods=['get'])
     def affaires(self, request, pk=None):
         """Retourne les affaires d'un client."""
         client = self.get_object()
-        offres = Offre.objects.filter(client=client)
-        # Use a flat list to collect all affaires
-        affaires = Affaire.objects.filter(offre__in=offres)
-        serializer = AffaireListSerializer(affaires, many=True)
-        return Response(serializer.data)
+        affaires = Affaire.objects.filter(client=client)
+        return self.paginated_response(affaires, AffaireListSerializer)
     
     @action(detail=True, methods=['get'])
     def factures(self, request, pk=None):
         """Retourne les factures d'un client."""
         client = self.get_object()
-        # Get all offres for this client
-        offres = Offre.objects.filter(client=client)
-        # Get all affaires related to these offres
-        affaires = Affaire.objects.filter(offre__in=offres)
-        # Get all factures related to these affaires
-        factures = Facture.objects.filter(affaire__in=affaires)
-        serializer = FactureListSerializer(factures, many=True)
-        return Response(serializer.data)
+        factures = Facture.objects.filter(client=client)
+        return self.paginated_response(factures, FactureListSerializer)
     
     @action(detail=True, methods=['get'])
     def formations(self, request, pk=None):
         """Retourne les formations d'un client."""
         client = self.get_object()
         formations = Formation.objects.filter(client=client)
-        serializer = FormationListSerializer(formations, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(formations, FormationListSerializer)
     
     @action(detail=True, methods=['get'])
     def rapports(self, request, pk=None):
         """Retourne les rapports d'un client."""
         client = self.get_object()
         rapports = Rapport.objects.filter(client=client)
-        serializer = RapportListSerializer(rapports, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(rapports, RapportListSerializer)
     
     @action(detail=True, methods=['get'])
     def statistiques(self, request, pk=None):
-        """Retourne les statistiques d'un client."""
+        """
+        Retourne les statistiques d'un client, lues dans son instantané
+        d'indicateurs (recalculé après toute écriture sur ses documents).
+        """
         client = self.get_object()
-        
-        # Statistiques des opportunités
-        opportunites_stats = {
-            'total': Opportunite.objects.filter(client=client).count(),
-            'gagnees': Opportunite.objects.filter(client=client, statut='GAGNEE').count(),
-            'perdues': Opportunite.objects.filter(client=client, statut='PERDUE').count(),
-            'en_cours': Opportunite.objects.filter(client=client).exclude(
-                statut__in=['GAGNEE', 'PERDUE']).count(),
-            'valeur_totale': Opportunite.objects.filter(client=client).aggregate(
-                Sum('montant_estime'))['montant_estime__sum'] or 0,
-        }
-        
-        # Statistiques des offres
-        offres_stats = {
-            'total': Offre.objects.filter(client=client).count(),
-            'gagnees': Offre.objects.filter(client=client, statut='GAGNE').count(),
-            'perdues': Offre.objects.filter(client=client, statut='PERDU').count(),
-            'en_cours': Offre.objects.filter(client=client).exclude(
-                statut__in=['GAGNE', 'PERDU']).count(),
-            'valeur_totale': Offre.objects.filter(client=client).aggregate(
-                Sum('montant'))['montant__sum'] or 0,
-        }
-        
-        # Statistiques des affaires
-        affaires_stats = {
-            'total': Affaire.objects.filter(client=client).count(),
-            'en_cours': Affaire.objects.filter(client=client, statut='EN_COURS').count(),
-            'terminees': Affaire.objects.filter(client=client, statut='TERMINEE').count(),
-            'annulees': Affaire.objects.filter(client=client, statut='ANNULEE').count(),
-        }
-        
-        # Statistiques des factures
-        factures_stats = {
-            'total': Facture.objects.filter(client=client).count(),
-            'valeur_totale': Offre.objects.filter(client=client, statut='GAGNE').aggregate(
-                Sum('montant'))['montant__sum'] or 0,
-        }
-        
-        return Response({
-            'opportunites': opportunites_stats,
-            'offres': offres_stats,
-            'affaires': affaires_stats,
-            'factures': factures_stats,
-            'contacts': Contact.objects.filter(client=client).count(),
-            'sites': Site.objects.filter(client=client).count(),
-            'formations': Formation.objects.filter(client=client).count(),
-            'rapports': Rapport.objects.filter(client=client).count(),
-        })
+        snapshot = get_client_kpis(client.pk)
+        return Response({**snapshot.donnees, 'calcule_le': snapshot.calcule_le})
 
-class SiteViewSet(viewsets.ModelViewSet):
+class SiteViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Site.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'ville']
@@ -275,10 +219,9 @@ class SiteViewSet(viewsets.ModelViewSet):
         """Retourne les contacts associés à un site."""
         site = self.get_object()
         contacts = Contact.objects.filter(site=site)
-        serializer = ContactListSerializer(contacts, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(contacts, ContactListSerializer)
 
-class ContactViewSet(viewsets.ModelViewSet):
+class ContactViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Contact.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'service', 'relance', 'ville']
@@ -310,26 +253,23 @@ class ContactViewSet(viewsets.ModelViewSet):
     def detailed(self, request):
         """Retourne la liste des contacts avec des informations détaillées."""
         queryset = self.filter_queryset(self.get_queryset().select_related('client', 'site', 'ville'))
-        serializer = ContactDetailedSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(queryset, ContactDetailedSerializer)
     
     @action(detail=True, methods=['get'])
     def opportunites(self, request, pk=None):
         """Retourne les opportunités associées à un contact."""
         contact = self.get_object()
         opportunites = Opportunite.objects.filter(contact=contact)
-        serializer = OpportuniteListSerializer(opportunites, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(opportunites, OpportuniteSerializer)
     
     @action(detail=True, methods=['get'])
     def offres(self, request, pk=None):
         """Retourne les offres associées à un contact."""
         contact = self.get_object()
         offres = Offre.objects.filter(contact=contact)
-        serializer = OffreListSerializer(offres, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(offres, OffreListSerializer)
     
-class ContactDetailedViewSet(viewsets.ReadOnlyModelViewSet):
+class ContactDetailedViewSet(QueryPlanMixin, viewsets.ReadOnlyModelViewSet):
    serializer_class = ContactDetailedSerializer
    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
    
@@ -345,7 +285,7 @@ class ContactDetailedViewSet(viewsets.ReadOnlyModelViewSet):
    def get_queryset(self):
        return Contact.objects.all()
    
-class ClientWithContactsViewSet(viewsets.ModelViewSet):
+class ClientWithContactsViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Client.objects.prefetch_related('contacts').all()
     filterset_fields = ['ville', 'agreer', 'agreement_fournisseur', 'secteur_activite']
     search_fields = ['nom', 'c_num', 'email', 'telephone', 'matricule']
@@ -362,8 +302,7 @@ class ClientWithContactsViewSet(viewsets.ModelViewSet):
     def contacts(self, request, pk=None):
         client = self.get_object()
         contacts = client.contacts.all()
-        serializer = ContactSerializer(contacts, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(contacts, ContactSerializer)
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courrier', '0004_alter_courrier_client'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courrierhistory',
+            index=models.Index(fields=['courrier', '-date_action'], name='courrierhistory_courrier_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courrier', '0005_courrierhistory_courrier_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='courrierhistory',
+            name='date_action',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
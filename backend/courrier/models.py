@@ -1,50 +1,66 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.utils import timezone
 from django.conf import settings
 
+from document.audit import audit_writer
+from document.sequences import allocate_sequences, bulk_create_with_references, month_period, next_sequence
+from document.tracking import FieldTrackerMixin
 
-def generate_reference(prefix, doc_type, client_ref, direction='OUT'):
+
+def _sequence_scope(prefix, doc_type, direction):
+    return f"{prefix}-{direction[:3].upper()}-{doc_type}"
+
+
+def _derniere_sequence(scope):
+    """
+    Dernier numéro utilisé dans le mois pour une portée, lu depuis les références
+    existantes. Appelé une seule fois, à la création du compteur de la portée.
+    """
+    today = timezone.now()
+    references = Courrier.objects.filter(
+        reference__startswith=f"{scope}-",
+        date_creation__year=today.year,
+        date_creation__month=today.month
+    ).values_list('reference', flat=True)
+
+    sequences = [0]
+    for reference in references:
+        try:
+            sequences.append(int(reference.split('-')[-1]))
+        except (ValueError, IndexError):
+            continue
+    return max(sequences)
+
+
+def format_reference(prefix, doc_type, client_ref, direction, sequence):
     """
-    Génère une référence unique pour un document.
     Format : [PREFIX]-[DIRECTION]-[TYPE]-[DATE]-[CLIENT_REF]-[SEQUENCE]
     """
     # Date au format YYMMDD
     date_str = timezone.now().strftime("%y%m%d")
-    
-    # Direction (IN/OUT)
-    dir_code = direction[:3].upper()
-    
-    # Générer la référence de base
-    base_ref = f"{prefix}-{dir_code}-{doc_type}-{date_str}-{client_ref}"
-    
-    # Obtenir l'année et le mois actuels pour les filtres
-    current_year = timezone.now().year
-    current_month = timezone.now().month
-    
-    # Filtrer par type de document, entité, et période (mois en cours)
-    # Cela permet une numérotation par mois et par type
-    last_ref = Courrier.objects.filter(
-        reference__startswith=f"{prefix}-{dir_code}-{doc_type}",
-        date_creation__year=current_year,
-        date_creation__month=current_month
-    ).order_by('-reference').first()
-    
-    sequence = 1  # Commence à 1
-    if last_ref:
-        # Extraire le numéro de séquence et l'incrémenter
-        try:
-            last_sequence = int(last_ref.reference.split('-')[-1])
-            sequence = last_sequence + 1
-        except (ValueError, IndexError):
-            # En cas d'erreur dans le parsing, garder sequence = 1
-            pass
-    
-    # Formater le numéro de séquence avec des zéros à gauche
-    sequence_str = f"{sequence:03d}"
-    
-    # Retourner la référence complète
-    return f"{base_ref}-{sequence_str}"
-class Courrier(models.Model):
+    return f"{_sequence_scope(prefix, doc_type, direction)}-{date_str}-{client_ref}-{sequence:03d}"
+
+
+def generate_reference(prefix, doc_type, client_ref, direction='OUT'):
+    """
+    Génère une référence unique pour un document.
+    Format : [PREFIX]-[DIRECTION]-[TYPE]-[DATE]-[CLIENT_REF]-[SEQUENCE]
+
+    La séquence provient d'un compteur mensuel par (entité, direction, type),
+    incrémenté atomiquement : pas de scan des références existantes.
+    """
+    scope = _sequence_scope(prefix, doc_type, direction)
+    sequence = next_sequence(
+        'CRR',
+        scope=scope,
+        period=month_period(),
+        initial=lambda: _derniere_sequence(scope)
+    )
+    return format_reference(prefix, doc_type, client_ref, direction, sequence)
+
+
+class Courrier(FieldTrackerMixin, models.Model):
     DIRECTION_CHOICES = [
         ('IN', 'Entrant'),
         ('OUT', 'Sortant'),
@@ -98,10 +114,73 @@ class Courrier(models.Model):
             self.reference = generate_reference(
                 self.entite.code, 
                 self.doc_type, 
-                self.client.c_num if hasattr(self.client, 'c_num') else str(self.client.id),
+                self.client_ref,
                 self.direction
             )
         super().save(*args, **kwargs)
+
+    @property
+    def client_ref(self):
+        return self.client.c_num or str(self.client_id)
+
+    @classmethod
+    def generer_references_en_masse(cls, courriers):
+        """
+        Attribue les références à des courriers non sauvegardés : un bloc de
+        numéros est réservé par (entité, direction, type) présent dans le lot.
+        """
+        from client.models import Client
+        from document.models import Entity
+
+        courriers = [courrier for courrier in courriers if not courrier.reference]
+        if not courriers:
+            return courriers
+
+        entites = Entity.objects.in_bulk({c.entite_id for c in courriers})
+        clients = Client.objects.in_bulk({c.client_id for c in courriers})
+        for courrier in courriers:
+            courrier.entite = entites[courrier.entite_id]
+            courrier.client = clients[courrier.client_id]
+
+        period = month_period()
+        sequences = allocate_sequences(
+            'CRR',
+            [
+                {'scope': _sequence_scope(c.entite.code, c.doc_type, c.direction), 'period': period}
+                for c in courriers
+            ],
+            initial=lambda scope: _derniere_sequence(scope['scope'])
+        )
+        for courrier, sequence in zip(courriers, sequences):
+            courrier.reference = format_reference(
+                courrier.entite.code, courrier.doc_type, courrier.client_ref, courrier.direction, sequence
+            )
+        return courriers
+
+    @classmethod
+    @transaction.atomic
+    def enregistrer_lot(cls, courriers, user=None):
+        """
+        Enregistre un lot de courriers (ex: réception du courrier du matin) :
+        réservation des références, un INSERT groupé pour les courriers et un
+        pour leur historique de création.
+        """
+        courriers = list(courriers)
+        for courrier in courriers:
+            if user and not courrier.created_by_id:
+                courrier.created_by = user
+        courriers = bulk_create_with_references(cls, courriers)
+
+        CourrierHistory.objects.bulk_create([
+            CourrierHistory(
+                courrier=courrier,
+                action='CREATE',
+                user=courrier.created_by,
+                details=f"Création du courrier {courrier.reference}"
+            )
+            for courrier in courriers
+        ])
+        return courriers
     
     def __str__(self):
         return self.reference
@@ -144,8 +223,29 @@ class Courrier(models.Model):
         self.statut = 'ARCHIVED'
         self.save(update_fields=['statut'])
 
+    @classmethod
+    def prefetch_history(cls, objects, limit=None):
+        """
+        Précharge l'historique d'une liste de courriers en une requête,
+        limité aux `limit` dernières actions de chacun (voir document.status_history)
+        """
+        from document.status_history import PREFETCHED_ATTR
+
+        history = CourrierHistory.objects.select_related('user').order_by('-date_action', '-pk')
+        prefetch_related_objects(
+            objects,
+            Prefetch('historique', queryset=history[:limit] if limit else history, to_attr=PREFETCHED_ATTR),
+        )
+
     def get_history(self):
-        """Récupérer l'historique des actions sur ce courrier"""
+        """
+        Récupérer l'historique des actions sur ce courrier.
+        Après prefetch_history(), retourne la liste préchargée sans requête.
+        """
+        from document.status_history import PREFETCHED_ATTR
+
+        if hasattr(self, PREFETCHED_ATTR):
+            return getattr(self, PREFETCHED_ATTR)[::-1]
         return CourrierHistory.objects.filter(courrier=self).order_by('date_action')
 
     @property
@@ -172,7 +272,8 @@ class CourrierHistory(models.Model):
     
     courrier = models.ForeignKey(Courrier, on_delete=models.CASCADE, related_name='historique')
     action = models.CharField(max_length=10, choices=ACTION_CHOICES)
-    date_action = models.DateTimeField(auto_now_add=True)
+    # Heure de l'action, pas de l'écriture différée (voir document.audit)
+    date_action = models.DateTimeField(default=timezone.now, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     details = models.TextField(blank=True, null=True)
     
@@ -180,27 +281,31 @@ class CourrierHistory(models.Model):
         verbose_name = "Historique de courrier"
         verbose_name_plural = "Historiques de courriers"
         ordering = ['-date_action']
+        indexes = [
+            models.Index(fields=['courrier', '-date_action'], name='courrierhistory_courrier_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_action_display()} - {self.courrier.reference}"
     
     
-from django.db.models.signals import post_save, post_init
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 @receiver(post_save, sender=Courrier)
 def create_courrier_history(sender, instance, created, **kwargs):
     """Crée une entrée d'historique à chaque création ou modification de courrier"""
     if created:
-        CourrierHistory.objects.create(
+        audit_writer.write(CourrierHistory(
             courrier=instance,
             action='CREATE',
             user=instance.created_by,
             details=f"Création du courrier {instance.reference}"
-        )
+        ))
     else:
         # Détecte si le statut a changé pour créer l'historique approprié
-        if hasattr(instance, '_original_statut') and instance._original_statut != instance.statut:
+        ancien_statut = instance.previous('statut')
+        if ancien_statut is not None and ancien_statut != instance.statut:
             action_map = {
                 'SENT': 'SEND',
                 'RECEIVED': 'RECEIVE',
@@ -209,21 +314,17 @@ def create_courrier_history(sender, instance, created, **kwargs):
             }
             
             if instance.statut in action_map:
-                CourrierHistory.objects.create(
+                audit_writer.write(CourrierHistory(
                     courrier=instance,
                     action=action_map[instance.statut],
                     user=instance.handled_by or instance.created_by,
-                    details=f"Statut changé de {instance._original_statut} à {instance.statut}"
-                )
+                    details=f"Statut changé de {ancien_statut} à {instance.statut}"
+                ))
         else:
-            CourrierHistory.objects.create(
+            champs = ', '.join(instance.field_diff())
+            audit_writer.write(CourrierHistory(
                 courrier=instance,
                 action='EDIT',
                 user=instance.handled_by or instance.created_by,
-                details="Modification du courrier"
-            )
-
-@receiver(post_init, sender=Courrier)
-def store_original_status(sender, instance, **kwargs):
-    """Stocke le statut original pour détecter les changements"""
-    instance._original_statut = instance.statut if instance.pk else None
\ No newline at end of file
+                details=f"Modification du courrier : {champs}" if champs else "Modification du courrier"
+            ))
@@ -2,6 +2,7 @@ from rest_framework import serializers
 
 from client.models import Client
 from document.models import Entity
+from document.status_history import HistoryListSerializer
 from .models import Courrier, CourrierHistory
 from document.serializers import EntityListSerializer
 
@@ -43,6 +44,20 @@ class ClientListSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['c_num']
 
+class CourrierHistorySerializer(serializers.ModelSerializer):
+    """Serializer pour l'historique des courriers"""
+    courrier_reference = serializers.CharField(source='courrier.reference', read_only=True)
+    action_display = serializers.CharField(source='get_action_display', read_only=True)
+    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    
+    class Meta:
+        model = CourrierHistory
+        fields = [
+            'id', 'courrier', 'courrier_reference', 'action', 
+            'action_display', 'date_action', 'user', 'user_name', 'details'
+        ]
+
+
 class CourrierListSerializer(serializers.ModelSerializer):
     """Serializer pour la liste des courriers (version légère)"""
     entite_nom = serializers.CharField(source='entite.nom', read_only=True)
@@ -62,6 +77,9 @@ class CourrierListSerializer(serializers.ModelSerializer):
             'date_envoi', 'date_reception', 'fichier', 'est_urgent',
             'created_by_name', 'is_overdue'
         ]
+        # ?historique=N : dernières actions de chaque courrier, en une requête par page
+        list_serializer_class = HistoryListSerializer
+        history_serializer = CourrierHistorySerializer
 
 
 class CourrierSerializer(serializers.ModelSerializer):
@@ -96,17 +114,3 @@ class CourrierSerializer(serializers.ModelSerializer):
             'created_by', 'handled_by', 'is_overdue'
         ]
         read_only_fields = ['reference', 'date_creation', 'created_by', 'handled_by']
-
-
-class CourrierHistorySerializer(serializers.ModelSerializer):
-    """Serializer pour l'historique des courriers"""
-    courrier_reference = serializers.CharField(source='courrier.reference', read_only=True)
-    action_display = serializers.CharField(source='get_action_display', read_only=True)
-    user_name = serializers.CharField(source='user.get_full_name', read_only=True)
-    
-    class Meta:
-        model = CourrierHistory
-        fields = [
-            'id', 'courrier', 'courrier_reference', 'action', 
-            'action_display', 'date_action', 'user', 'user_name', 'details'
-        ]
\ No newline at end of file
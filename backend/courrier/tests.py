@@ -1,3 +1,90 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from client.models import Client
+from document.models import AuditLog, Entity
+from .models import Courrier, CourrierHistory
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class CourrierReferenceTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='courrier', email='courrier@example.com', password='pass')
+        self.entite = Entity.objects.create(code='KES', name='KES')
+        self.client_obj = Client.objects.create(nom='Client courrier')
+
+    def _courrier(self, **kwargs):
+        kwargs.setdefault('doc_type', 'LTR')
+        kwargs.setdefault('direction', 'IN')
+        return Courrier(entite=self.entite, client=self.client_obj, created_by=self.user, **kwargs)
+
+    def test_sequence_par_direction_et_type(self):
+        premier = self._courrier()
+        premier.save()
+        second = self._courrier()
+        second.save()
+        sortant = self._courrier(direction='OUT')
+        sortant.save()
+
+        self.assertTrue(premier.reference.endswith('-001'))
+        self.assertTrue(second.reference.endswith('-002'))
+        self.assertTrue(sortant.reference.startswith('KES-OUT-LTR-'))
+        self.assertTrue(sortant.reference.endswith('-001'))
+
+    def test_enregistrer_lot(self):
+        self._courrier().save()
+        courriers = Courrier.enregistrer_lot(
+            [self._courrier() for _ in range(3)] + [self._courrier(doc_type='FCT')]
+        )
+
+        self.assertEqual(
+            [c.reference.rsplit('-', 1)[-1] for c in courriers],
+            ['002', '003', '004', '001']
+        )
+        self.assertEqual(CourrierHistory.objects.filter(action='CREATE').count(), 5)
+
+    def test_historique_changement_de_statut(self):
+        courrier = self._courrier()
+        courrier.save()
+
+        courrier = Courrier.objects.get(pk=courrier.pk)
+        courrier.statut = 'SENT'
+        courrier.save()
+        # Statut inchangé depuis la dernière sauvegarde : simple modification
+        courrier.save()
+
+        self.assertEqual(
+            list(CourrierHistory.objects.order_by('pk').values_list('action', flat=True)),
+            ['CREATE', 'SEND', 'EDIT']
+        )
+
+    def test_historique_precharge_par_page(self):
+        courriers = [self._courrier() for _ in range(3)]
+        for courrier in courriers:
+            courrier.save()
+            courrier.statut = 'SENT'
+            courrier.save()
+
+        courriers = list(Courrier.objects.all())
+        with self.assertNumQueries(1):
+            Courrier.prefetch_history(courriers, limit=1)
+            derniers = [[h.action for h in courrier.get_history()] for courrier in courriers]
+        self.assertEqual(derniers, [['SEND']] * 3)
+
+    def test_modification_journalisee_par_champ(self):
+        courrier = self._courrier(objet='Objet initial')
+        courrier.save()
+
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.patch(f'/api/courriers/{courrier.pk}/', {'objet': 'Objet corrigé'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        log = AuditLog.objects.get(action='UPDATE', object_id=str(courrier.pk))
+        self.assertEqual(log.changes, {'objet': ['Objet initial', 'Objet corrigé']})
+        self.assertEqual(log.user, self.user)
+        self.assertEqual(
+            CourrierHistory.objects.filter(action='EDIT').get().details, "Modification du courrier : objet"
+        )
@@ -5,12 +5,15 @@ from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
 
+from document.pagination import PaginatedActionMixin
+from document.query_plan import QueryPlanMixin
+
 from .models import Courrier, CourrierHistory
 from .serializers import CourrierSerializer, CourrierListSerializer, CourrierHistorySerializer
 from .filters import CourrierFilter
 
 
-class CourrierViewSet(viewsets.ModelViewSet):
+class CourrierViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les opérations CRUD sur les courriers.
     """
@@ -29,6 +32,18 @@ class CourrierViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Enregistrer un lot de courriers (ex: réception du courrier du matin)"""
+        serializer = CourrierSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        courriers = Courrier.enregistrer_lot(
+            [Courrier(**data) for data in serializer.validated_data],
+            user=request.user
+        )
+        return Response(CourrierListSerializer(courriers, many=True).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def mark_as_sent(self, request, pk=None):
         """Marquer un courrier comme envoyé"""
@@ -84,8 +99,7 @@ class CourrierViewSet(viewsets.ModelViewSet):
         """Obtenir l'historique d'un courrier"""
         courrier = self.get_object()
         history = courrier.get_history()
-        serializer = CourrierHistorySerializer(history, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(history, CourrierHistorySerializer)
 
     @action(detail=False, methods=['get'])
     def stats(self, request):
@@ -121,7 +135,7 @@ class CourrierViewSet(viewsets.ModelViewSet):
         })
 
 
-class CourrierHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CourrierHistoryViewSet(QueryPlanMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet pour l'historique des courriers (lecture seule).
     """
@@ -1,20 +1,37 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Prefetch
-from collections import OrderedDict
-from document.mod import AttestationFormationSerializer, FormationDetailSerializer
-from document.models import Affaire, AttestationFormation, Client, Entity, Facture, Formation, Offre, Participant, Product, Proforma, Rapport, Site
-from document.serializers import AffaireSerializer, FactureSerializer, OffreSerializer, ProformaSerializer, RapportSerializer
-
-from rest_framework.response import Response
-from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+import json
 from collections import OrderedDict
 from datetime import datetime
+
+from django.db import models
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.utils.dateparse import parse_datetime as django_parse_datetime
 from django.utils.timezone import make_aware, get_current_timezone
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import generics, status
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from affaires_app.models import Affaire
+from affaires_app.serializers import AffaireSerializer
+from document.models import AttestationFormation, DocumentIndex, Formation, Rapport
+from document.serializers import (
+    AttestationFormationListSerializer, DocumentIndexSerializer, FormationDetailSerializer,
+    RapportListSerializer
+)
+from factures_app.models import Facture
+from factures_app.serializers import FactureSerializer
+from offres_app.models import Offre
+from offres_app.serializers import OffreSerializer
+from proformas_app.models import Proforma
+from proformas_app.serializers import ProformaSerializer
+
+
 def parse_datetime(date_str):
     """
     Parse une chaîne de date dans plusieurs formats possibles.
@@ -59,99 +76,186 @@ def parse_datetime(date_str):
     except (ValueError, IndexError):
         return None
     
+def ndjson_line(data):
+    """Encode un enregistrement sur une ligne NDJSON"""
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Rendu NDJSON (un objet JSON par ligne), sélectionné par ?format=ndjson ou
+    l'en-tête Accept: application/x-ndjson.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return ndjson_line(data).encode(self.charset)
+
+
 class DocumentAggregatorView(APIView):
     permission_classes = [IsAuthenticated]
-    
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
+    # Nombre de lignes lues par requête SQL en mode streaming
+    chunk_size = 500
+
+    # Chemins ORM des filtres communs pour chaque type de document
+    filter_paths = {
+        'offres': {'client': 'client', 'entity': 'entity', 'date': 'date_creation'},
+        'affaires': {'client': 'client', 'entity': 'entity', 'date': 'date_creation'},
+        'proformas': {'client': 'client', 'entity': 'entity', 'date': 'date_creation'},
+        'factures': {'client': 'client', 'entity': 'entity', 'date': 'date_creation'},
+        'rapports': {'client': 'client', 'entity': 'entity', 'date': 'date_creation'},
+        'formations': {'client': 'client', 'entity': 'affaire__entity', 'date': 'date_debut'},
+        'attestations': {'client': 'client', 'entity': 'entity', 'date': 'date_creation'},
+    }
+
+    # Suffixes des filtres de date et lookup correspondant (au jour près)
+    date_bounds = (('_after', 'date__gte'), ('_before', 'date__lte'), ('', 'date'))
+
+    def get_sources(self):
+        """
+        Requêtes et sérialiseurs par type de document, dans l'ordre de la réponse.
+        """
+        return OrderedDict([
+            ('offres', (
+                Offre.objects.select_related(
+                    'client__ville__region__pays', 'entity', 'contact',
+                    'produit_principal__category', 'user', 'createur'
+                ).prefetch_related('produits__category'),
+                OffreSerializer
+            )),
+            ('affaires', (
+                Affaire.objects.select_related('offre__client', 'responsable'),
+                AffaireSerializer
+            )),
+            ('proformas', (
+                Proforma.objects.select_related('offre__client', 'offre__entity'),
+                ProformaSerializer
+            )),
+            ('factures', (
+                Facture.objects.select_related(
+                    'client__ville__region__pays', 'affaire__offre__client', 'affaire__offre__entity',
+                    'affaire__responsable'
+                ),
+                FactureSerializer
+            )),
+            ('rapports', (
+                Rapport.objects.select_related('affaire__offre', 'affaire__client', 'produit__category'),
+                RapportListSerializer
+            )),
+            ('formations', (
+                Formation.objects.prefetch_related('participants', 'attestations'),
+                FormationDetailSerializer
+            )),
+            ('attestations', (
+                AttestationFormation.objects.select_related('participant', 'formation'),
+                AttestationFormationListSerializer
+            )),
+        ])
+
+    def parse_filters(self, params):
+        """
+        Lit les paramètres de filtre une seule fois par requête.
+
+        Paramètres reconnus : client (id ou c_num), entity (id ou code), statut,
+        et pour tout champ date (date_creation, date_debut...) ou l'alias `date`
+        (date principale du type) : <champ>, <champ>_after, <champ>_before.
+        Les dates invalides sont ignorées.
+
+        Returns:
+            list[tuple]: (nom, lookup, valeur) pour chaque filtre reconnu
+        """
+        filters = []
+        for key, value in params.items():
+            if key == api_settings.URL_FORMAT_OVERRIDE or value in ('', None):
+                continue
+
+            if key == 'client':
+                filters.append(('client', '' if value.isdigit() else 'c_num', value))
+            elif key == 'entity':
+                filters.append(('entity', '' if value.isdigit() else 'code', value))
+            elif key == 'statut':
+                filters.append(('statut', 'iexact', value))
+            elif 'date' in key:
+                for suffix, lookup in self.date_bounds:
+                    if key.endswith(suffix):
+                        parsed = parse_datetime(value)
+                        if parsed:
+                            filters.append((key[:len(key) - len(suffix)], lookup, parsed.date()))
+                        break
+        return filters
+
+    def build_query(self, doc_type, model, filters):
+        """
+        Compile les filtres en un objet Q pour un type de document. Un filtre
+        portant sur un champ que le type ne possède pas ne s'applique pas à ce type.
+        """
+        paths = self.filter_paths[doc_type]
+        fields = model._meta.get_fields()
+        field_names = {field.name for field in fields}
+        date_fields = {field.name for field in fields if isinstance(field, models.DateField)}
+
+        query = Q()
+        for name, lookup, value in filters:
+            if name in ('client', 'entity'):
+                path = paths[name]
+            elif name == 'statut':
+                if name not in field_names:
+                    continue
+                path = name
+            else:
+                path = paths['date'] if name == 'date' else name
+                if path not in date_fields:
+                    continue
+            query &= Q(**{f"{path}__{lookup}" if lookup else path: value})
+        return query
+
+    def filter_sources(self, sources, params):
+        """Applique les filtres de la requête en SQL, avant toute sérialisation"""
+        filters = self.parse_filters(params)
+        if not filters:
+            return sources
+        return OrderedDict(
+            (doc_type, (queryset.filter(self.build_query(doc_type, queryset.model, filters)), serializer_class))
+            for doc_type, (queryset, serializer_class) in sources.items()
+        )
+
+    def get_metadata(self, sources):
+        """Comptages calculés en SQL (COUNT), sans charger les documents"""
+        documents_par_type = OrderedDict(
+            (doc_type, queryset.count()) for doc_type, (queryset, _) in sources.items()
+        )
+        return {
+            'total_documents': sum(documents_par_type.values()),
+            'documents_par_type': documents_par_type
+        }
+
     def get(self, request):
-        try:
-            # Récupérer tous les documents avec leurs relations
-            offres = Offre.objects.select_related(
-                'client',
-                'proforma',
-                'entity'
-            ).prefetch_related(
-                'produit',
-                'sites'
-            )
+        sources = self.filter_sources(self.get_sources(), request.query_params.dict())
 
-            affaires = Affaire.objects.select_related(
-                'offre__client',
-                'offre__entity',
-                'facture'
-            ).prefetch_related(
-                'rapports__site',
-                'rapports__produit',
-                'formations__participants',
-                'attestations__participant'
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            response = StreamingHttpResponse(
+                self.stream_documents(sources),
+                content_type=NDJSONRenderer.media_type
             )
+            response['Cache-Control'] = 'no-cache'
+            return response
 
+        try:
             # Initialiser le dictionnaire de réponse
             response_data = OrderedDict({
-                'documents': {
-                    'offres': [],
-                    'affaires': [],
-                    'proformas': [],
-                    'factures': [],
-                    'rapports': [],
-                    'formations': [],
-                    'attestations': []
-                },
-                'metadata': {
-                    'total_documents': 0,
-                    'documents_par_type': {}
-                }
+                'documents': OrderedDict(
+                    (doc_type, serializer_class(queryset, many=True).data)
+                    for doc_type, (queryset, serializer_class) in sources.items()
+                ),
+                'metadata': self.get_metadata(sources)
             })
 
-            # Sérialiser les offres
-            for offre in offres:
-                offre_data = OffreSerializer(offre).data
-                response_data['documents']['offres'].append(offre_data)
-
-            # Sérialiser les affaires et leurs documents associés
-            for affaire in affaires:
-                affaire_data = AffaireSerializer(affaire).data
-                response_data['documents']['affaires'].append(affaire_data)
-                
-                # Ajouter les proformas
-                if hasattr(affaire.offre, 'proforma'):
-                    proforma_data = ProformaSerializer(affaire.offre.proforma).data
-                    response_data['documents']['proformas'].append(proforma_data)
-                
-                # Ajouter la facture
-                if hasattr(affaire, 'facture'):
-                    facture_data = FactureSerializer(affaire.facture).data
-                    response_data['documents']['factures'].append(facture_data)
-                
-                # Ajouter les rapports
-                rapports_data = RapportSerializer(affaire.rapports.all(), many=True).data
-                response_data['documents']['rapports'].extend(rapports_data)
-                
-                # Ajouter les formations
-                formations_data = FormationDetailSerializer(affaire.formations.all(), many=True).data
-                response_data['documents']['formations'].extend(formations_data)
-                
-                # Ajouter les attestations
-                attestations_data = AttestationFormationSerializer(affaire.attestations.all(), many=True).data
-                response_data['documents']['attestations'].extend(attestations_data)
-
-            # Calculer les métadonnées
-            for doc_type, docs in response_data['documents'].items():
-                response_data['metadata']['documents_par_type'][doc_type] = len(docs)
-                response_data['metadata']['total_documents'] += len(docs)
-
-            # Ajouter des filtres si spécifiés dans la requête
-            filters = request.query_params.dict()
-            if filters:
-                filtered_data = self.apply_filters(response_data['documents'], filters)
-                response_data['documents'] = filtered_data
-                # Recalculer les métadonnées pour les données filtrées
-                response_data['metadata'] = {
-                    'total_documents': sum(len(docs) for docs in filtered_data.values()),
-                    'documents_par_type': {
-                        doc_type: len(docs) for doc_type, docs in filtered_data.items()
-                    }
-                }
-
             return Response(response_data)
 
         except Exception as e:
@@ -160,43 +264,41 @@ class DocumentAggregatorView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def apply_filters(self, documents, filters):
+    def stream_documents(self, sources):
         """
-        Applique les filtres spécifiés aux documents.
+        Génère la réponse NDJSON : une ligne de métadonnées puis une ligne par
+        document. Les documents sont lus par paquets de chunk_size avec
+        .iterator(), la mémoire reste constante quel que soit leur nombre.
         """
-        filtered_docs = OrderedDict()
-        
-        for doc_type, docs in documents.items():
-            filtered_docs[doc_type] = []
-            
-            for doc in docs:
-                match = True
-                for key, value in filters.items():
-                    # Gestion des filtres de date
-                    if 'date' in key.lower():
-                        try:
-                            doc_date = parse_datetime(doc.get(key, ''))
-                            filter_date = parse_datetime(value)
-                            if doc_date and filter_date:
-                                if doc_date.date() != filter_date.date():
-                                    match = False
-                                    break
-                        except:
-                            continue
-                    # Filtres de texte standard
-                    elif key in doc and str(doc[key]).lower() != str(value).lower():
-                        match = False
-                        break
-                
-                if match:
-                    filtered_docs[doc_type].append(doc)
-                    
-        return filtered_docs
-
-# Ajoutez cette configuration des URLs
-from django.urls import path
-
-urlpatterns = [
-    path('documents/', DocumentAggregatorView.as_view(), name='document-aggregator'),
-    # ... vos autres URLs ...
-]
\ No newline at end of file
+        yield ndjson_line({'type': 'metadata', **self.get_metadata(sources)})
+
+        for doc_type, (queryset, serializer_class) in sources.items():
+            for document in queryset.iterator(chunk_size=self.chunk_size):
+                yield ndjson_line({'type': doc_type, 'document': serializer_class(document).data})
+
+
+class DocumentFeedPagination(CursorPagination):
+    """
+    Pagination par curseur (keyset) sur (date_creation, id), toujours active :
+    chaque page est une lecture de plage sur l'index docindex_feed_idx, quelle
+    que soit sa position.
+    """
+    ordering = ('-date_creation', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class DocumentFeedView(generics.ListAPIView):
+    """
+    Flux trié de tous les types de documents, lu depuis DocumentIndex.
+    Filtres : doc_type, client, entity, statut.
+
+    Paginé par curseur sur (date_creation, id) (voir DocumentFeedPagination).
+    """
+    permission_classes = [IsAuthenticated]
+    queryset = DocumentIndex.objects.select_related('client', 'entity')
+    serializer_class = DocumentIndexSerializer
+    pagination_class = DocumentFeedPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['doc_type', 'client', 'entity', 'statut']
@@ -6,7 +6,7 @@ from api.user.models import User
 from .models import (
     ContentType, Entity, Category, Product, 
     Rapport, Formation, Participant, AttestationFormation,
-     AuditLog, UserActionLog
+     AuditLog, UserActionLog, Job, Notification
 )
 
 @admin.register(UserActionLog)
@@ -53,6 +53,24 @@ class AuditLogAdmin(admin.ModelAdmin):
    def has_delete_permission(self, request, obj=None):
        return False
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+   list_display = ['created_at', 'name', 'statut', 'priority', 'attempts', 'run_at', 'finished_at']
+   list_filter = ['statut', 'name']
+   search_fields = ['name', 'idempotency_key']
+   readonly_fields = ['created_at', 'created_by', 'locked_by', 'locked_until', 'result', 'last_error', 'finished_at']
+   date_hierarchy = 'created_at'
+
+   def has_add_permission(self, request):
+       return False
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+   list_display = ['date_creation', 'destinataire', 'type', 'message', 'echeance', 'lue']
+   list_filter = ['type', 'lue', 'entity']
+   search_fields = ['message', 'destinataire__username']
+   date_hierarchy = 'date_creation'
+
 @admin.register(User)
 class CustomUserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'departement', 'is_staff', 'is_active')
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class DocumentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'document'
+
+    def ready(self):
+        from . import audit, changes, indexing, realtime, relances, rollups
+        audit.connect_signals()
+        changes.connect_signals()
+        indexing.connect_signals()
+        realtime.connect_signals()
+        relances.connect_signals()
+        rollups.connect_signals()
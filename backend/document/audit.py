@@ -0,0 +1,323 @@
+"""
+Écriture groupée du journal d'audit (UserActionLog, AuditLog, CourrierHistory).
+
+Les entrées sont construites dans la requête puis mises en file après le
+commit de sa transaction. Un thread d'arrière-plan les insère par
+bulk_create, dès que `AUDIT_LOG_BATCH_SIZE` entrées sont en attente ou toutes
+les `AUDIT_LOG_FLUSH_INTERVAL` secondes. Un lot qui ne peut pas être inséré
+est recopié dans le fichier de secours `AUDIT_LOG_FALLBACK` (JSON lines),
+rejoué par la commande replay_audit_fallback.
+
+Chaque entrée mise en file est aussi ajoutée à un journal disque propre au
+processus (audit_fallback.pending-<pid>-<n>.jsonl, à côté du fichier de
+secours), supprimé une fois le lot inséré. Si le processus meurt avant le
+vidage (crash, SIGKILL), le journal reste : le thread d'écriture du
+processus suivant, ou replay_audit_fallback, réinsère les journaux des
+processus arrêtés. Une entrée peut alors être écrite deux fois (arrêt entre
+l'insertion et la suppression du journal), jamais perdue.
+
+Avec AUDIT_LOG_ASYNC = False, chaque entrée est enregistrée immédiatement,
+comme auparavant : les tests qui relisent le journal l'activent par
+override_settings.
+
+Chaque modification d'un modèle suivi (FieldTrackerMixin) produit une entrée
+AuditLog 'UPDATE' dont `changes` ne contient que les colonnes modifiées :
+{"montant": [1000.0, 1200.0]}. AuditLog.objects.filter(changes__has_key='montant')
+répond à « qui a modifié le montant ».
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models.signals import post_save
+
+from .middleware import current_user
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def fallback_path():
+    return Path(_setting('AUDIT_LOG_FALLBACK', Path(settings.BASE_DIR) / 'logs' / 'audit_fallback.jsonl'))
+
+
+def _dump(entry):
+    """Entrée -> ligne JSON : modèle et valeurs des colonnes"""
+    fields = {field.attname: getattr(entry, field.attname) for field in entry._meta.concrete_fields if not field.primary_key}
+    return json.dumps({'model': entry._meta.label, 'fields': fields}, cls=DjangoJSONEncoder)
+
+
+def _load(line):
+    data = json.loads(line)
+    model = apps.get_model(data['model'])
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    return model(**{
+        name: value if value is None else fields[name].to_python(value)
+        for name, value in data['fields'].items()
+    })
+
+
+def _insert(entries):
+    """
+    Insère des entrées, un bulk_create par modèle.
+
+    Returns:
+        list: entrées non insérées
+    """
+    by_model = defaultdict(list)
+    for entry in entries:
+        by_model[type(entry)].append(entry)
+
+    failed = []
+    for model, objs in by_model.items():
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(objs, batch_size=500)
+        except DatabaseError:
+            logger.exception("Journal d'audit : échec de l'insertion de %d entrées %s", len(objs), model._meta.label)
+            failed.extend(objs)
+    return failed
+
+
+def _journal_prefix():
+    path = fallback_path()
+    return path.with_name(f'{path.stem}.pending-')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditWriter:
+    """File d'attente des entrées d'audit, vidée par lots depuis un thread"""
+
+    _instances = itertools.count()
+
+    def __init__(self, background=True):
+        self.background = background
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._number = next(self._instances)
+        self._journal = None
+
+    def write(self, entry):
+        """Enregistre une entrée d'audit (non sauvegardée) : immédiatement en mode synchrone, sinon par lot"""
+        if not _setting('AUDIT_LOG_ASYNC', True):
+            entry.save()
+            return entry
+        # Une entrée d'une transaction annulée n'est jamais écrite
+        transaction.on_commit(lambda: self._enqueue(entry))
+        return entry
+
+    def _enqueue(self, entry):
+        with self._lock:
+            self._append_journal(entry)
+            self._buffer.append(entry)
+            full = len(self._buffer) >= _setting('AUDIT_LOG_BATCH_SIZE', 200)
+        if self.background:
+            self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # Redémarré après un fork (workers gunicorn) : le thread du parent n'existe pas dans l'enfant
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _journal_path(self):
+        return Path(f'{_journal_prefix()}{os.getpid()}-{self._number}.jsonl')
+
+    def _append_journal(self, entry):
+        """Copie disque de l'entrée en attente, appelé sous le verrou"""
+        try:
+            if self._journal is None or self._journal[0] != os.getpid():
+                path = self._journal_path()
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._journal = (os.getpid(), path.open('a', encoding='utf-8'))
+            handle = self._journal[1]
+            handle.write(_dump(entry) + '\n')
+            handle.flush()
+        except OSError:
+            logger.exception("Journal d'audit : échec de l'écriture du journal disque")
+
+    def _detach_journal(self):
+        """
+        Met de côté le journal des entrées en cours de vidage, appelé sous le
+        verrou : les entrées suivantes partent dans un nouveau journal.
+
+        Returns:
+            Path: journal à supprimer après l'insertion, ou None
+        """
+        if self._journal is None or self._journal[0] != os.getpid():
+            return None
+        self._journal[1].close()
+        self._journal = None
+        path = self._journal_path()
+        flushing = path.with_name(path.name + '.flush')
+        try:
+            path.replace(flushing)
+        except OSError:
+            logger.exception("Journal d'audit : échec de la rotation du journal disque")
+            return None
+        return flushing
+
+    def _run(self):
+        try:
+            recover_journals()
+        except Exception:
+            logger.exception("Journal d'audit : échec de la reprise des journaux en attente")
+        while True:
+            self._wakeup.wait(_setting('AUDIT_LOG_FLUSH_INTERVAL', 2.0))
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Journal d'audit : échec du vidage de la file")
+
+    def pending(self):
+        return len(self._buffer)
+
+    def flush(self):
+        """
+        Insère les entrées en attente ; celles qui échouent vont au fichier de secours.
+
+        Returns:
+            int: nombre d'entrées traitées
+        """
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+            journal = self._detach_journal()
+        if entries:
+            failed = _insert(entries)
+            if failed:
+                write_fallback(failed)
+        if journal is not None:
+            journal.unlink(missing_ok=True)
+        return len(entries)
+
+
+def write_fallback(entries):
+    path = fallback_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('a', encoding='utf-8') as fallback:
+        for entry in entries:
+            fallback.write(_dump(entry) + '\n')
+
+
+def recover_journals():
+    """
+    Réinsère les entrées restées dans les journaux disque des processus
+    arrêtés avant leur vidage. Celles qui échouent vont au fichier de secours.
+
+    Returns:
+        int: nombre d'entrées reprises
+    """
+    prefix = _journal_prefix()
+    recovered = 0
+    for journal in prefix.parent.glob(f'{prefix.name}*'):
+        pid = journal.name[len(prefix.name):].split('-')[0]
+        if '.recover-' in journal.name or not pid.isdigit() or _alive(int(pid)):
+            continue
+        # Renommé avant lecture : un seul processus reprend chaque journal
+        claimed = journal.with_name(f'{journal.name}.recover-{os.getpid()}')
+        try:
+            journal.replace(claimed)
+        except FileNotFoundError:
+            continue
+        with claimed.open(encoding='utf-8') as lines:
+            entries = [_load(line) for line in lines if line.strip()]
+        failed = _insert(entries)
+        if failed:
+            write_fallback(failed)
+        claimed.unlink()
+        recovered += len(entries)
+    return recovered
+
+
+def replay_fallback():
+    """
+    Réinsère les entrées du fichier de secours, après avoir repris les
+    journaux des processus arrêtés. Celles qui échouent encore y sont réécrites.
+
+    Returns:
+        tuple: (entrées insérées, entrées restantes)
+    """
+    recover_journals()
+    path = fallback_path()
+    if not path.exists():
+        return 0, 0
+    # Les écritures concurrentes repartent dans un nouveau fichier
+    replaying = path.with_name(path.name + '.replay')
+    path.replace(replaying)
+    with replaying.open(encoding='utf-8') as fallback:
+        entries = [_load(line) for line in fallback if line.strip()]
+
+    failed = _insert(entries)
+    if failed:
+        write_fallback(failed)
+    replaying.unlink()
+    return len(entries) - len(failed), len(failed)
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.flush)
+
+
+def audit_changes(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Journalise les colonnes modifiées par une mise à jour (voir FieldTrackerMixin.field_diff)"""
+    if created or raw:
+        return
+    diff = instance.field_diff()
+    if update_fields is not None:
+        diff = {name: values for name, values in diff.items() if name in update_fields}
+    if not diff:
+        return
+
+    from django.contrib.contenttypes.models import ContentType
+    from .models import AuditLog
+
+    audit_writer.write(AuditLog(
+        user=current_user(),
+        action='UPDATE',
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=str(instance.pk),
+        # La référence évite les requêtes de certains __str__ (ex: Affaire -> client)
+        object_repr=(getattr(instance, 'reference', None) or str(instance))[:200],
+        changes=diff,
+    ))
+
+
+def connect_signals():
+    from .tracking import FieldTrackerMixin
+
+    for model in apps.get_models():
+        if issubclass(model, FieldTrackerMixin) and model.audited_fields:
+            post_save.connect(audit_changes, sender=model, dispatch_uid=f'audit_changes_{model._meta.label_lower}')
@@ -0,0 +1,261 @@
+"""
+Banc de mesure des endpoints de l'API : nombre de requêtes SQL, temps SQL et
+temps total pour chaque route GET (liste, détail, @action) de KES_DocGen/urls.py,
+comparés à une référence versionnée (benchmark_baseline.json), enregistrée
+sur un jeu de DEFAULT_SCALE * 10 clients : à cette taille, une route dont le
+nombre de requêtes croît avec les données se voit dans la référence.
+
+Utilisé par document.tests.EndpointBenchmarkTest et par la commande
+`python manage.py benchmark_endpoints`.
+"""
+import json
+import logging
+import random
+import re
+import threading
+from decimal import Decimal
+from pathlib import Path
+from time import perf_counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver
+
+from .jobs import work
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+# Seuls les paramètres d'URL que l'on sait renseigner sont mesurés
+SUPPORTED_KWARGS = {'pk'}
+
+# Routes non mesurées, avec la raison
+EXCLUDED_ROUTES = {
+    'api/affaires/{pk}/export_pdf/': "nécessite reportlab, absent des dépendances",
+}
+
+# Taille par défaut du jeu de données (10 clients par unité)
+DEFAULT_SCALE = 10
+
+
+def seed_dataset(scale=1, seed=42):
+    """
+    Crée un jeu de données déterministe : 10 * scale clients avec sites,
+    contacts, opportunités, offres et courriers. Une offre sur trois est gagnée
+    (affaire, proforma) et une affaire sur deux validée (rapports, formations,
+    facture, créés par la file de tâches).
+
+    Returns:
+        User: l'utilisateur utilisé pour les appels
+    """
+    from affaires_app.models import Affaire
+    from api.user.models import User
+    from client.models import Client, Contact, Pays, Region, Site, Ville
+    from courrier.models import Courrier
+    from offres_app.models import Offre
+    from opportunites_app.models import Opportunite
+    from .models import Category, Entity, Product
+
+    rng = random.Random(seed)
+
+    user = User.objects.create_user('benchmark', 'benchmark@example.com', 'benchmark')
+    pays = Pays.objects.create(nom='Cameroun', code_iso='CMR')
+    region = Region.objects.create(nom='Littoral', pays=pays)
+    villes = [Ville.objects.create(nom=nom, region=region) for nom in ('Douala', 'Edea')]
+
+    produits = []
+    for entity_code in ('KES', 'KIP'):
+        entity = Entity.objects.create(code=entity_code, name=f"{entity_code} benchmark")
+        for category_code in ('INS', 'FOR'):
+            category = Category.objects.create(code=category_code, name=category_code, entity=entity)
+            for i in range(3):
+                produits.append(Product.objects.create(
+                    code=f"{entity_code}{category_code}{i}", name=f"Produit {category_code} {i}", category=category
+                ))
+
+    courriers = []
+    offres_gagnees = []
+    for i in range(10 * scale):
+        client = Client.objects.create(
+            nom=f"Client {i:04d}", email=f"client{i}@example.com", ville=rng.choice(villes), is_client=True
+        )
+        site = Site.objects.create(nom=f"Site {i:04d}", client=client, ville=client.ville)
+        contacts = [
+            Contact.objects.create(nom=f"Contact {i}-{j}", client=client, site=site, ville=client.ville)
+            for j in range(2)
+        ]
+
+        produit = rng.choice(produits)
+        entity = produit.category.entity
+        opportunite = Opportunite.objects.create(
+            entity=entity, client=client, contact=contacts[0], produit_principal=produit,
+            created_by=user, responsable=user, montant=Decimal(0),
+            montant_estime=Decimal(rng.randint(1, 50) * 1000)
+        )
+        opportunite.produits.add(produit)
+
+        for j in range(3):
+            offre = Offre.objects.create(
+                client=client, contact=contacts[j % 2], entity=entity, produit_principal=produit,
+                user=user, montant=Decimal(rng.randint(1, 100) * 1000)
+            )
+            offre.produits.add(produit, *rng.sample([p for p in produits if p.category.entity == entity], 2))
+            if j == 0:
+                offres_gagnees.append(offre)
+
+        courriers.extend(
+            Courrier(entite=entity, client=client, doc_type=rng.choice(['LTR', 'FCT', 'DVS']), direction=direction)
+            for direction in ('IN', 'OUT')
+        )
+
+    Courrier.enregistrer_lot(courriers, user=user)
+
+    for k, offre in enumerate(offres_gagnees):
+        offre.statut = 'GAGNE'
+        offre.save()
+        if k % 2 == 0:
+            Affaire.objects.get(offre=offre).changer_statut('VALIDE', user=user)
+
+    # Initialisations des affaires validées mises en file : exécutées ici, sans worker
+    work(threading.Event(), burst=True)
+    return user
+
+
+def _route_pattern(pattern):
+    """Convertit un motif d'URL (regex ou path()) en gabarit '{kwarg}'"""
+    route = str(pattern).lstrip('^').rstrip('$').replace('\\', '')
+    route = re.sub(r'\(\?P<(\w+)>[^)]*\)', r'{\1}', route)
+    return re.sub(r'<(?:\w+:)?(\w+)>', r'{\1}', route)
+
+
+def _iter_patterns(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _iter_patterns(pattern.url_patterns, prefix + _route_pattern(pattern.pattern))
+        else:
+            yield prefix + _route_pattern(pattern.pattern), pattern
+
+
+def _view_model(view_class):
+    queryset = getattr(view_class, 'queryset', None)
+    return queryset.model if queryset is not None else None
+
+
+def discover_routes(prefix='api/'):
+    """
+    Liste les routes GET de l'API : (gabarit, modèle pour {pk} ou None).
+    Les suffixes de format et les paramètres autres que pk sont ignorés.
+    """
+    routes = {}
+    for route, pattern in _iter_patterns(get_resolver().url_patterns):
+        view_class = getattr(pattern.callback, 'cls', None)
+        if not route.startswith(prefix) or view_class is None or (pattern.name or '').endswith('api-root'):
+            continue
+
+        actions = getattr(pattern.callback, 'actions', None)
+        if actions is not None:
+            if 'get' not in actions:
+                continue
+        elif not hasattr(view_class, 'get'):
+            continue
+
+        if route in EXCLUDED_ROUTES:
+            continue
+
+        kwargs = set(re.findall(r'{(\w+)}', route))
+        if not kwargs <= SUPPORTED_KWARGS:
+            continue
+
+        model = _view_model(view_class) if kwargs else None
+        if kwargs and model is None:
+            continue
+        routes.setdefault(route, model)
+    return routes
+
+
+def measure(client, url):
+    """Appelle une URL et retourne statut, requêtes, temps SQL et temps total (ms)"""
+    with CaptureQueriesContext(connection) as queries:
+        start = perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        wall = perf_counter() - start
+
+    return {
+        'status': response.status_code,
+        'queries': len(queries),
+        'sql_ms': round(sum(float(query['time']) for query in queries.captured_queries) * 1000, 2),
+        'wall_ms': round(wall * 1000, 2),
+    }
+
+
+def run_benchmark(client, routes=None):
+    """
+    Mesure chaque route sur les données présentes en base.
+
+    Returns:
+        dict: gabarit de route -> mesures
+    """
+    routes = discover_routes() if routes is None else routes
+    results = {}
+
+    # Les erreurs 500 sont enregistrées dans les résultats, pas dans les logs
+    request_logger = logging.getLogger('django.request')
+    previous_level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+    raise_exceptions = getattr(client, 'raise_request_exception', True)
+    client.raise_request_exception = False
+    try:
+        for route, model in sorted(routes.items(), key=lambda item: item[0]):
+            url = '/' + route
+            if model is not None:
+                pk = model._default_manager.order_by('pk').values_list('pk', flat=True).first()
+                if pk is None:
+                    continue
+                url = url.replace('{pk}', str(pk))
+            results[route] = measure(client, url)
+    finally:
+        client.raise_request_exception = raise_exceptions
+        request_logger.setLevel(previous_level)
+    return results
+
+
+def compare_to_baseline(results, baseline, time_factor=None, time_slack_ms=50):
+    """
+    Compare des mesures à la référence.
+
+    Toute erreur serveur (5xx) est une régression, y compris sur une route
+    absente de la référence ou déjà en erreur dans celle-ci. Une route régresse
+    aussi si elle fait plus de requêtes, ou (si time_factor est donné) si son
+    temps total dépasse time_factor * référence + time_slack_ms.
+
+    Returns:
+        list[str]: description des régressions
+    """
+    regressions = []
+    for route, current in sorted(results.items()):
+        reference = baseline.get(route)
+        if current['status'] >= 500:
+            previous = reference['status'] if reference is not None else '-'
+            regressions.append(f"{route}: statut {previous} -> {current['status']}")
+        if reference is None:
+            continue
+        if current['queries'] > reference['queries']:
+            regressions.append(f"{route}: {reference['queries']} -> {current['queries']} requêtes")
+        if time_factor and current['wall_ms'] > reference['wall_ms'] * time_factor + time_slack_ms:
+            regressions.append(f"{route}: {reference['wall_ms']} -> {current['wall_ms']} ms")
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {'scale': None, 'routes': {}}
+    with path.open(encoding='utf-8') as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results, scale, path=BASELINE_PATH):
+    with Path(path).open('w', encoding='utf-8') as baseline_file:
+        json.dump({'scale': scale, 'routes': results}, baseline_file, indent=2, sort_keys=True, ensure_ascii=False)
+        baseline_file.write('\n')
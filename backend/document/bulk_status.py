@@ -0,0 +1,70 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from django.dispatch import Signal
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+# Envoyé par StatusTrackingModel.bulk_set_status() après l'UPDATE groupé,
+# qui ne déclenche pas post_save : sender=modèle, pks=ids modifiés, statut=nouveau statut
+bulk_status_changed = Signal()
+
+
+class JSONSet(models.Func):
+    """
+    Affecte une clé d'un champ JSON objet, en SQL : `champ[cle] = valeur`
+    pour toutes les lignes d'un UPDATE, sans lire les valeurs existantes.
+    """
+    output_field = models.JSONField()
+
+    def __init__(self, field, key, value):
+        self.key = key
+        self.value = value
+        super().__init__(models.F(field))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # SQLite et MySQL
+        column, params = compiler.compile(self.source_expressions[0])
+        return f"JSON_SET(COALESCE({column}, '{{}}'), %s, %s)", (*params, f'$."{self.key}"', self.value)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        column, params = compiler.compile(self.source_expressions[0])
+        return (
+            f"(COALESCE({column}, '{{}}'::jsonb) || jsonb_build_object(%s::text, %s::text))",
+            (*params, self.key, self.value),
+        )
+
+
+class BulkStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    statut = serializers.CharField()
+    commentaire = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class BulkStatusMixin:
+    """
+    Action de liste POST bulk_status/ pour les viewsets de modèles à statut :
+    {"ids": [...], "statut": "PERDU", "commentaire": "..."}. Les objets hors
+    du queryset de la vue (filtres compris) ou déjà au statut sont ignorés.
+    """
+
+    def get_bulk_status_queryset(self, statut):
+        """Objets pouvant passer à `statut` (à restreindre par exemple aux transitions autorisées)"""
+        return self.filter_queryset(self.get_queryset())
+
+    @action(detail=False, methods=['post'])
+    def bulk_status(self, request):
+        serializer = BulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        statut = serializer.validated_data['statut']
+
+        queryset = self.get_bulk_status_queryset(statut).filter(pk__in=ids)
+        try:
+            modifies = queryset.model.bulk_set_status(
+                queryset, statut, user=request.user, commentaire=serializer.validated_data['commentaire']
+            )
+        except DjangoValidationError as exc:
+            return Response({'statut': exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'statut': statut, 'modifies': modifies, 'ignores': len(ids) - modifies})
@@ -0,0 +1,207 @@
+"""
+Flux des modifications des documents, diffusé sur WebSocket (ws/changes/).
+
+Chaque création, modification ou suppression d'un modèle de FEED_MODELS
+ajoute une ligne ChangeEvent dans la transaction de la modification :
+modèle, identifiant, champs modifiés, et un numéro de séquence croissant
+(la clé primaire). Après le commit, les événements sont envoyés au groupe
+`changes` ; le navigateur met à jour ses listes sans les recharger :
+
+    {"seq": 1042, "model": "offres_app.Offre", "pk": 12, "action": "U", "fields": ["statut"]}
+
+Le numéro de séquence sert aussi de version : la version d'un objet est la
+séquence de son dernier événement, un événement plus ancien que la version
+en cache est ignoré. Après une reconnexion, le client reprend à partir du
+dernier numéro reçu (`?since=1042`) ; si les événements manquants ont été
+purgés (CHANGE_FEED_RETENTION_DAYS) ou sont trop nombreux, il reçoit
+`{"type": "reset"}` et recharge ses listes.
+
+La clé primaire ne sert de séquence que si les événements sont validés dans
+l'ordre de leur numéro : c'est le cas avec SQLite, qui n'admet qu'une
+transaction d'écriture à la fois. Avec une base à écritures concurrentes
+(PostgreSQL), une transaction plus lente peut valider un numéro inférieur à
+un événement déjà diffusé, et un client qui reprend après ce dernier ne la
+verrait jamais : il faudrait alors une séquence attribuée au commit, ou
+rejouer une marge avant `since` en dédupliquant côté client.
+
+Les écritures groupées qui ne déclenchent pas post_save enregistrent leurs
+événements par record_changes() : créations en masse (signal bulk_created),
+changements de statut groupés (bulk_status_changed) et bulk_update.
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+CHANGES_GROUP = 'changes'
+
+FEED_MODELS = (
+    'offres_app.Offre',
+    'proformas_app.Proforma',
+    'affaires_app.Affaire',
+    'factures_app.Facture',
+    'opportunites_app.Opportunite',
+    'courrier.Courrier',
+    'client.Client',
+)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _is_feed_model(model):
+    return model._meta.label in FEED_MODELS
+
+
+def serialize(event):
+    """Événement -> message compact envoyé au navigateur"""
+    from django.contrib.contenttypes.models import ContentType
+
+    return {
+        'seq': event.pk,
+        'model': ContentType.objects.get_for_id(event.content_type_id).model_class()._meta.label,
+        'pk': event.object_id,
+        'action': event.action,
+        'fields': event.fields,
+    }
+
+
+def push_changes(events):
+    """Diffuse des événements au groupe `changes`, en un message"""
+    from .realtime import publish
+
+    if events:
+        publish({'type': 'changes', 'events': [serialize(event) for event in events]}, groups=[CHANGES_GROUP])
+
+
+def record_changes(model, objects, action='U', fields=None):
+    """
+    Enregistre les événements d'une écriture groupée, en une insertion, et
+    les diffuse après le commit.
+
+    Args:
+        model: Modèle modifié
+        objects: Instances, ou identifiants (l'entité n'est alors pas renseignée)
+        action (str): 'C', 'U' ou 'D'
+        fields (list): Champs modifiés, None si inconnus
+    """
+    objects = list(objects)
+    if not objects or not _is_feed_model(model):
+        return []
+    from django.contrib.contenttypes.models import ContentType
+
+    from .models import ChangeEvent
+
+    content_type = ContentType.objects.get_for_model(model)
+    now = timezone.now()
+    events = ChangeEvent.objects.bulk_create([
+        ChangeEvent(
+            content_type=content_type,
+            object_id=getattr(obj, 'pk', obj),
+            action=action,
+            fields=sorted(fields) if fields is not None else None,
+            entity_id=getattr(obj, 'entity_id', None),
+            timestamp=now,
+        )
+        for obj in objects
+    ], batch_size=500)
+    transaction.on_commit(lambda: push_changes(events))
+    return events
+
+
+def changed_fields(instance, created, update_fields):
+    """Champs écrits par une sauvegarde : suivis par FieldTrackerMixin, ou ceux de update_fields"""
+    if created:
+        return None
+    if hasattr(instance, 'field_diff'):
+        names = set(instance.field_diff())
+        if update_fields is not None:
+            names &= set(update_fields)
+        return names
+    return set(update_fields) if update_fields is not None else None
+
+
+def record_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    fields = changed_fields(instance, created, update_fields)
+    if fields is not None and not fields:
+        # Sauvegarde sans modification
+        return
+    record_changes(sender, [instance], 'C' if created else 'U', fields)
+
+
+def record_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance], 'D')
+
+
+def record_status_change(sender, pks, statut, **kwargs):
+    record_changes(sender, pks, 'U', ['statut'])
+
+
+def record_created(sender, instances, **kwargs):
+    record_changes(sender, instances, 'C')
+
+
+def events_since(seq, limit=None):
+    """
+    Événements postérieurs à `seq`, dans l'ordre (numérotation validée dans
+    l'ordre : voir la note sur SQLite en tête du module).
+
+    Returns:
+        list | None: None si la reprise est impossible (événements purgés
+        depuis, séquence inconnue, ou plus de `limit` événements manquants) :
+        le client doit alors recharger ses listes
+    """
+    from .models import ChangeEvent
+
+    if limit is None:
+        limit = _setting('CHANGE_FEED_REPLAY_LIMIT', 1000)
+    bounds = ChangeEvent.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return [] if not seq else None
+    if seq < bounds['first'] - 1 or seq > bounds['last']:
+        return None
+    rows = list(ChangeEvent.objects.filter(pk__gt=seq).order_by('pk')[:limit + 1])
+    if len(rows) > limit:
+        return None
+    return rows
+
+
+def last_seq():
+    from .models import ChangeEvent
+
+    return ChangeEvent.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def purge_change_feed(days=None):
+    """
+    Supprime les événements plus anciens que CHANGE_FEED_RETENTION_DAYS jours.
+    Le dernier événement est conservé : il marque la séquence courante.
+    """
+    from .models import ChangeEvent
+
+    if days is None:
+        days = _setting('CHANGE_FEED_RETENTION_DAYS', 7)
+    deleted, _ = ChangeEvent.objects.filter(
+        timestamp__lt=timezone.now() - timedelta(days=days), pk__lt=last_seq()
+    ).delete()
+    return deleted
+
+
+def connect_signals():
+    """Branche le flux des modifications sur les modèles de FEED_MODELS"""
+    from .bulk_status import bulk_status_changed
+    from .sequences import bulk_created
+
+    bulk_status_changed.connect(record_status_change, dispatch_uid='document_changes_bulk_status')
+    bulk_created.connect(record_created, dispatch_uid='document_changes_bulk_created')
+    for label in FEED_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(record_save, sender=model, dispatch_uid=f'document_changes_save_{label}')
+        post_delete.connect(record_delete, sender=model, dispatch_uid=f'document_changes_delete_{label}')
@@ -1,35 +1,216 @@
-from channels.generic.websocket import AsyncWebsocketConsumer
+import asyncio
 import json
+from collections import OrderedDict
+from itertools import count
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .changes import CHANGES_GROUP, events_since, serialize
+from .realtime import BROADCAST_GROUP, department_group, entity_group, user_group, visible_entities
+
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Notifications d'un navigateur (voir document.realtime).
+
+    La connexion rejoint le groupe de son utilisateur et de son département,
+    et ceux des entités demandées par `{"action": "subscribe", "entities": [...]}`,
+    parmi celles que l'utilisateur peut voir (realtime.visible_entities).
+    Les événements reçus sont mis en attente puis envoyés en une trame toutes
+    les NOTIFICATIONS_COALESCE_INTERVAL secondes :
+
+        {"message": {...}}                      un seul événement
+        {"messages": [...], "dropped": 0}       plusieurs événements
+
+    La file d'attente est bornée à NOTIFICATIONS_MAX_PENDING événements : au-delà,
+    les plus anciens sont abandonnés et comptés dans `dropped` (le client doit
+    alors recharger ses données).
+    """
+
+    def setup_buffer(self):
+        self.groups_joined = set()
+        self.pending = OrderedDict()
+        self.dropped = 0
+        self.sequence = count()
+        self.flush_task = None
+        self.coalesce_interval = getattr(settings, 'NOTIFICATIONS_COALESCE_INTERVAL', 0.5)
+        self.max_pending = getattr(settings, 'NOTIFICATIONS_MAX_PENDING', 100)
+
     async def connect(self):
-        await self.channel_layer.group_add(
-            "notifications",
-            self.channel_name
-        )
+        self.setup_buffer()
+        user = self.scope.get('user')
+        groups = [BROADCAST_GROUP]
+        if user is not None and user.is_authenticated:
+            groups += [user_group(user.pk), department_group(user.departement)]
+        for group in groups:
+            await self.join(group)
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            "notifications",
-            self.channel_name
-        )
-
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-
-        await self.channel_layer.group_send(
-            "notifications",
-            {
-                'type': 'notification_message',
-                'message': message
-            }
-        )
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        for group in list(self.groups_joined):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.groups_joined.clear()
+
+    async def join(self, group):
+        if group not in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+            self.groups_joined.add(group)
+
+    async def leave(self, group):
+        if group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            self.groups_joined.discard(group)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Commandes du client : les messages ne sont plus relayés aux autres connexions
+        try:
+            data = json.loads(text_data or '')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await self.send(text_data=json.dumps({'error': "Message JSON attendu"}))
+            return
+
+        action = data.get('action')
+        if action == 'ping':
+            await self.send(text_data=json.dumps({'action': 'pong'}))
+        elif action in ('subscribe', 'unsubscribe'):
+            user = self.scope.get('user')
+            if user is None or not user.is_authenticated:
+                await self.send(text_data=json.dumps({'error': "Authentification requise"}))
+                return
+            entities = await self.allowed_entities(user, data.get('entities'))
+            for entity_id in entities:
+                if action == 'subscribe':
+                    await self.join(entity_group(entity_id))
+                else:
+                    await self.leave(entity_group(entity_id))
+            await self.send(text_data=json.dumps({'action': action, 'entities': entities}))
+        else:
+            await self.send(text_data=json.dumps({'error': f"Action inconnue : {action}"}))
+
+    @database_sync_to_async
+    def allowed_entities(self, user, ids):
+        """Entités demandées qui existent et que l'utilisateur peut voir"""
+        if not isinstance(ids, list):
+            return []
+        ids = [pk for pk in ids if isinstance(pk, int)][:50]
+        return sorted(visible_entities(user).filter(pk__in=ids).values_list('pk', flat=True))
+
+    async def notification_message(self, event):
+        # Même clé : l'événement le plus récent remplace celui en attente
+        key = event.get('key') or next(self.sequence)
+        self.pending.pop(key, None)
+        self.pending[key] = event['message']
+        while len(self.pending) > self.max_pending:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+
+        if self.coalesce_interval <= 0:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        try:
+            await asyncio.sleep(self.coalesce_interval)
+            self.flush_task = None
+            await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        if not self.pending:
+            return
+        messages = list(self.pending.values())
+        dropped, self.pending, self.dropped = self.dropped, OrderedDict(), 0
+        if len(messages) == 1 and not dropped:
+            payload = {'message': messages[0]}
+        else:
+            payload = {'messages': messages, 'dropped': dropped}
+        await self.send(text_data=json.dumps(payload, default=str))
+
+
+class ChangeFeedConsumer(NotificationConsumer):
+    """
+    Flux des modifications des documents (voir document.changes), réservé aux
+    utilisateurs authentifiés. Avec `?since=<seq>` (ou `{"action": "resume",
+    "since": <seq>}`), les événements manqués sont d'abord rejoués, puis les
+    événements en direct suivent, regroupés comme les notifications :
+
+        {"message": {"type": "changes", "events": [{"seq": ..., "model": ..., "pk": ..., "action": ..., "fields": [...]}]}}
+        {"message": {"type": "reset"}}      reprise impossible : recharger les listes
+
+    Si des événements sont abandonnés (`dropped`), le client reprend à partir
+    du dernier numéro reçu.
+    """
+
+    async def connect(self):
+        self.setup_buffer()
+        self.replayed = 0
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        await self.join(CHANGES_GROUP)
+        await self.accept()
+
+        since = parse_qs(self.scope.get('query_string', b'').decode()).get('since')
+        if since:
+            await self.resume(since[0])
+
+    async def resume(self, since):
+        try:
+            since = int(since)
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({'error': "Numéro de séquence invalide"}))
+            return
+        events = await self.missed_events(since)
+        if events is None:
+            payload = {'type': 'reset'}
+        else:
+            payload = {'type': 'changes', 'events': events}
+            if events:
+                # Les événements en direct déjà rejoués ne sont pas renvoyés
+                self.replayed = max(self.replayed, events[-1]['seq'])
+                for key, message in list(self.pending.items()):
+                    if message.get('type') == 'changes':
+                        self.pending.pop(key)
+                        message = self.not_replayed(message)
+                        if message is not None:
+                            self.pending[key] = message
+        await self.send(text_data=json.dumps({'message': payload}))
+
+    @database_sync_to_async
+    def missed_events(self, since):
+        events = events_since(since)
+        return None if events is None else [serialize(event) for event in events]
+
+    def not_replayed(self, message):
+        events = [change for change in message['events'] if change['seq'] > self.replayed]
+        return dict(message, events=events) if events else None
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '')
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and data.get('action') == 'resume':
+            await self.resume(data.get('since'))
+            return
+        await super().receive(text_data, bytes_data)
 
     async def notification_message(self, event):
         message = event['message']
+        if message.get('type') == 'changes' and self.replayed:
+            message = self.not_replayed(message)
+            if message is None:
+                return
+            event = dict(event, message=message)
+        await super().notification_message(event)
 
-        await self.send(text_data=json.dumps({
-            'message': message
-        }))
\ No newline at end of file
@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+
+
+# Modèle portant client/entité dénormalisés -> chemin inverse depuis l'offre
+DENORMALIZED_MODELS = {
+    'affaires_app.Affaire': 'affaire',
+    'proformas_app.Proforma': 'proforma',
+    'factures_app.Facture': 'affaire__facture',
+}
+
+
+def backfill_client_entity(label, batch_size=1000):
+    """
+    Recopie client et entité de l'offre sur les documents d'un modèle, par
+    tranches de clés primaires : un UPDATE avec sous-requête et une transaction
+    par tranche, pour ne pas verrouiller toute la table. Les migrations qui
+    ajoutent ces champs portent leur propre copie de ce remplissage.
+
+    Returns:
+        int: nombre de lignes mises à jour
+    """
+    model = apps.get_model(label)
+    offres = apps.get_model('offres_app', 'Offre').objects.filter(
+        **{DENORMALIZED_MODELS[label]: OuterRef('pk')}
+    )
+    last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    updated = 0
+    for start in range(0, last_pk, batch_size):
+        with transaction.atomic():
+            updated += model.objects.filter(pk__gt=start, pk__lte=start + batch_size).update(
+                client=Subquery(offres.values('client_id')[:1]),
+                entity=Subquery(offres.values('entity_id')[:1]),
+            )
+    return updated
+
@@ -0,0 +1,42 @@
+"""
+Données de base partagées par les tests des applications : utilisateur,
+entité KES, catégorie et produit, client, et client API authentifié.
+
+    class OffreTest(DocumentFixturesMixin, TestCase):
+        def setUp(self):
+            self.create_fixtures('offres')
+            self.offre = self.create_offre(montant=100)
+"""
+from rest_framework.test import APIClient
+
+from api.user.models import User
+from client.models import Client
+from offres_app.models import Offre
+from .models import Category, Entity, Product
+
+
+class DocumentFixturesMixin:
+    """
+    Crée self.user, self.entity, self.category, self.produit, self.client_obj
+    et self.api (authentifié comme self.user).
+    """
+
+    def create_fixtures(self, username='test', superuser=False, client_nom='Client test',
+                        category=('INS', 'Inspection'), produit=('VTE1', 'Produit')):
+        create_user = User.objects.create_superuser if superuser else User.objects.create_user
+        self.user = create_user(username, f'{username}@example.com', 'pass')
+        self.entity = Entity.objects.create(code='KES', name='KES')
+        self.category = Category.objects.create(code=category[0], name=category[1], entity=self.entity)
+        self.produit = Product.objects.create(code=produit[0], name=produit[1], category=self.category)
+        self.client_obj = Client.objects.create(nom=client_nom)
+
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_offre(self, save=True, **kwargs):
+        """Offre du client et du produit de base ; save=False la renvoie sans l'enregistrer"""
+        kwargs.setdefault('client', self.client_obj)
+        kwargs.setdefault('entity', self.entity)
+        kwargs.setdefault('produit_principal', self.produit)
+        kwargs.setdefault('user', self.user)
+        return Offre.objects.create(**kwargs) if save else Offre(**kwargs)
@@ -0,0 +1,126 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+
+def _document_values(document):
+    """Documents portant leur client et leur entité (dénormalisés pour proformas, affaires et factures)"""
+    return {
+        'reference': document.reference or '',
+        'client_id': document.client_id,
+        'entity_id': document.entity_id,
+        'statut': document.statut,
+        'date_creation': document.date_creation,
+    }
+
+
+def _formation_values(formation):
+    return {
+        'reference': formation.titre,
+        'client_id': formation.client_id,
+        'entity_id': formation.affaire.entity_id,
+        'statut': '',
+        'date_creation': formation.created_at,
+    }
+
+
+# Modèle indexé -> (type de document, extraction des valeurs, relations à charger)
+INDEXED_MODELS = {
+    'offres_app.Offre': ('OFF', _document_values, []),
+    'proformas_app.Proforma': ('PRO', _document_values, []),
+    'affaires_app.Affaire': ('AFF', _document_values, []),
+    'factures_app.Facture': ('FAC', _document_values, []),
+    'document.Rapport': ('RAP', _document_values, []),
+    'document.Formation': ('FOR', _formation_values, ['affaire']),
+    'document.AttestationFormation': ('ATT', _document_values, []),
+}
+
+INDEX_FIELDS = ['reference', 'client', 'entity', 'statut', 'date_creation']
+
+
+def _index_entry(instance):
+    from .models import DocumentIndex
+
+    doc_type, values, _ = INDEXED_MODELS[instance._meta.label]
+    return DocumentIndex(doc_type=doc_type, object_id=instance.pk, **values(instance))
+
+
+def index_documents(instances, batch_size=500):
+    """
+    Indexe (ou réindexe) des documents en une requête par lot.
+    """
+    from .models import DocumentIndex
+
+    entries = [_index_entry(instance) for instance in instances if instance.pk]
+    return DocumentIndex.objects.bulk_create(
+        entries,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['doc_type', 'object_id'],
+        update_fields=INDEX_FIELDS,
+    )
+
+
+def rebuild_document_index(batch_size=500):
+    """
+    Reconstruit entièrement l'index, par exemple après des modifications faites
+    avec QuerySet.update(). Retourne le nombre de documents indexés par type.
+    """
+    from .models import DocumentIndex
+
+    counts = {}
+    with transaction.atomic():
+        DocumentIndex.objects.all().delete()
+        for label, (doc_type, _, related) in INDEXED_MODELS.items():
+            queryset = apps.get_model(label).objects.select_related(*related).order_by()
+            batch = []
+            counts[doc_type] = 0
+            for instance in queryset.iterator(chunk_size=batch_size):
+                batch.append(instance)
+                if len(batch) == batch_size:
+                    counts[doc_type] += len(index_documents(batch, batch_size))
+                    batch = []
+            counts[doc_type] += len(index_documents(batch, batch_size))
+    return counts
+
+
+def update_document_index(sender, instance, raw=False, **kwargs):
+    # Chargement de fixtures : les relations ne sont pas garanties, voir rebuild_document_index()
+    if raw:
+        return
+    index_documents([instance])
+
+
+def index_created(sender, instances, **kwargs):
+    """Documents créés en masse (bulk_created) : indexés en une requête"""
+    if sender._meta.label in INDEXED_MODELS:
+        index_documents(instances)
+
+
+def remove_from_document_index(sender, instance, **kwargs):
+    from .models import DocumentIndex
+
+    doc_type = INDEXED_MODELS[instance._meta.label][0]
+    DocumentIndex.objects.filter(doc_type=doc_type, object_id=instance.pk).delete()
+
+
+def update_index_status(sender, pks, statut, **kwargs):
+    """Changement de statut groupé : un UPDATE de l'index"""
+    from .models import DocumentIndex
+
+    if sender._meta.label in INDEXED_MODELS:
+        doc_type = INDEXED_MODELS[sender._meta.label][0]
+        DocumentIndex.objects.filter(doc_type=doc_type, object_id__in=pks).update(statut=statut)
+
+
+def connect_signals():
+    """Branche la synchronisation de l'index sur les modèles indexés"""
+    from .bulk_status import bulk_status_changed
+    from .sequences import bulk_created
+
+    bulk_status_changed.connect(update_index_status, dispatch_uid='document_index_bulk_status')
+    bulk_created.connect(index_created, dispatch_uid='document_index_bulk_created')
+    for label in INDEXED_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(update_document_index, sender=model, dispatch_uid=f'document_index_save_{label}')
+        post_delete.connect(remove_from_document_index, sender=model, dispatch_uid=f'document_index_delete_{label}')
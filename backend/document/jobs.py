@@ -0,0 +1,240 @@
+"""
+File de tâches d'arrière-plan stockée dans la base, sans broker externe.
+
+    @job('affaires.initialiser_projet')
+    def initialiser_projet(affaire_id): ...
+
+    enqueue('affaires.initialiser_projet', affaire.pk, key=f'initialiser_projet:{affaire.pk}')
+
+La mise en file insère une ligne Job dans la transaction de la requête :
+la tâche n'est visible des workers (commande run_workers) qu'après son
+commit, et disparaît avec son annulation. Les workers prennent les tâches
+par priorité décroissante puis par date, avec un UPDATE conditionnel qui
+garantit qu'une tâche n'est prise que par un seul worker. Une tâche prise
+reste réservée `timeout` secondes (délai de visibilité) : au-delà, le
+worker est considéré comme perdu et la tâche est reprise. Une tâche en
+échec est retentée après un délai exponentiel, jusqu'à `max_attempts`
+tentatives.
+
+Les fonctions des tâches sont déclarées dans les modules `tasks` des
+applications, importés à la première exécution. Avec JOBS_ASYNC = False,
+la tâche est exécutée dès sa mise en file.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .middleware import current_user
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Nom de tâche -> fonction
+REGISTRY = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def job(name, max_attempts=None, timeout=None, priority=0):
+    """Déclare une fonction comme tâche ; les valeurs par défaut s'appliquent à ses mises en file"""
+    def decorator(func):
+        func.job_name = name
+        func.job_options = {'max_attempts': max_attempts, 'timeout': timeout, 'priority': priority}
+        REGISTRY[name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    if name not in REGISTRY:
+        autodiscover_modules('tasks')
+    return REGISTRY[name]
+
+
+def enqueue(name, *args, priority=None, key=None, delay=None, max_attempts=None, timeout=None, **kwargs):
+    """
+    Met une tâche en file et retourne sa ligne Job.
+
+    Args:
+        name (str): Nom déclaré par @job
+        priority (int): Priorité (la plus haute d'abord)
+        key (str): Clé d'idempotence ; si une tâche porte déjà cette clé, elle
+            est retournée telle quelle (et remise en file si elle avait échoué)
+        delay (timedelta | int): Report de la première exécution (secondes)
+        max_attempts (int): Nombre maximal de tentatives
+        timeout (int): Délai de visibilité en secondes
+
+    Les arguments doivent être sérialisables en JSON (identifiants plutôt qu'objets).
+    """
+    options = get_task(name).job_options
+    if isinstance(delay, (int, float)):
+        delay = timedelta(seconds=delay)
+    values = {
+        'name': name,
+        'args': list(args),
+        'kwargs': kwargs,
+        'priority': priority if priority is not None else options['priority'],
+        'max_attempts': max_attempts or options['max_attempts'] or _setting('JOBS_MAX_ATTEMPTS', 3),
+        'timeout': timeout or options['timeout'] or _setting('JOBS_VISIBILITY_TIMEOUT', 300),
+        'run_at': timezone.now() + (delay or timedelta()),
+        'created_by': current_user(),
+    }
+
+    if key is None:
+        queued = Job.objects.create(**values)
+    else:
+        try:
+            with transaction.atomic():
+                queued = Job.objects.create(idempotency_key=key, **values)
+        except IntegrityError:
+            queued = Job.objects.get(idempotency_key=key)
+            if queued.statut == 'FAILED':
+                rearmed = Job.objects.filter(pk=queued.pk, statut='FAILED').update(
+                    statut='PENDING', attempts=0, run_at=values['run_at'], last_error='', finished_at=None
+                )
+                if rearmed:
+                    queued.refresh_from_db()
+            return queued
+
+    if not _setting('JOBS_ASYNC', False):
+        run_job(queued)
+        queued.refresh_from_db()
+    return queued
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim(worker, names=None, candidates=10):
+    """
+    Réserve la prochaine tâche disponible pour `worker`, ou None.
+
+    Disponibles : les tâches en attente dont la date est passée, et les
+    tâches en cours dont le délai de visibilité a expiré. La réservation est
+    un UPDATE conditionnel sur l'état lu : si un autre worker l'a prise entre
+    temps, aucune ligne n'est modifiée et le candidat suivant est essayé.
+    """
+    now = timezone.now()
+    available = Job.objects.filter(
+        Q(statut='PENDING', run_at__lte=now)
+        | Q(statut='RUNNING', locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+    if names:
+        available = available.filter(name__in=names)
+
+    for pk, statut, locked_until, timeout in available.order_by('-priority', 'run_at', 'pk').values_list(
+        'pk', 'statut', 'locked_until', 'timeout'
+    )[:candidates]:
+        claimed = Job.objects.filter(pk=pk, statut=statut, locked_until=locked_until).update(
+            statut='RUNNING',
+            attempts=F('attempts') + 1,
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=timeout),
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def fail_expired():
+    """Tâches en cours dont le délai a expiré après la dernière tentative : marquées en échec"""
+    return Job.objects.filter(
+        statut='RUNNING', locked_until__lt=timezone.now(), attempts__gte=F('max_attempts')
+    ).update(statut='FAILED', last_error="Délai de visibilité dépassé", finished_at=timezone.now())
+
+
+def backoff(attempts):
+    """Délai avant la tentative suivante : JOBS_RETRY_BACKOFF * 2^(tentatives - 1), plafonné"""
+    base = _setting('JOBS_RETRY_BACKOFF', 10)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), _setting('JOBS_RETRY_BACKOFF_MAX', 3600)))
+
+
+def run_job(queued, worker=None):
+    """
+    Exécute une tâche réservée (ou, en mode synchrone, tout juste créée) et
+    enregistre son résultat, ou son erreur et la date de la tentative suivante.
+    Les écritures finales sont conditionnées à `locked_by` : un worker dont la
+    réservation a expiré et été reprise n'écrase pas l'état de la tâche.
+
+    Returns:
+        bool: True si la tâche a réussi
+    """
+    if worker is None:
+        worker = worker_id()
+        Job.objects.filter(pk=queued.pk).update(
+            statut='RUNNING', attempts=F('attempts') + 1, locked_by=worker,
+            locked_until=timezone.now() + timedelta(seconds=queued.timeout)
+        )
+        queued.refresh_from_db()
+    mine = Job.objects.filter(pk=queued.pk, locked_by=worker, statut='RUNNING')
+
+    try:
+        with transaction.atomic():
+            result = get_task(queued.name)(*queued.args, **queued.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Tâche %s #%s : échec de la tentative %s/%s", queued.name, queued.pk, queued.attempts, queued.max_attempts)
+        if queued.attempts < queued.max_attempts:
+            mine.update(
+                statut='PENDING', run_at=timezone.now() + backoff(queued.attempts),
+                locked_until=None, locked_by='', last_error=error
+            )
+        else:
+            mine.update(statut='FAILED', locked_until=None, last_error=error, finished_at=timezone.now())
+        return False
+
+    try:
+        mine.update(statut='DONE', locked_until=None, result=result, last_error='', finished_at=timezone.now())
+    except TypeError:
+        # Résultat non sérialisable : seule la réussite est enregistrée
+        mine.update(statut='DONE', locked_until=None, result=None, last_error='', finished_at=timezone.now())
+    return True
+
+
+def work(stop, names=None, poll_interval=None, max_jobs=None, burst=False):
+    """
+    Boucle d'un worker : prend et exécute les tâches jusqu'à `stop` (Event),
+    `max_jobs` tâches, ou, en mode `burst`, jusqu'à ce que la file soit vide.
+
+    Returns:
+        int: nombre de tâches exécutées
+    """
+    poll_interval = poll_interval if poll_interval is not None else _setting('JOBS_POLL_INTERVAL', 1.0)
+    worker = worker_id()
+    done = 0
+    while not stop.is_set() and (max_jobs is None or done < max_jobs):
+        close_old_connections()
+        try:
+            queued = claim(worker, names)
+            if queued is None:
+                fail_expired()
+        except DatabaseError:
+            # Base verrouillée ou indisponible : nouvel essai, même en mode burst
+            logger.exception("Worker %s : lecture de la file impossible", worker)
+            stop.wait(poll_interval)
+            continue
+        if queued is None:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        try:
+            run_job(queued, worker)
+        except DatabaseError:
+            # État non enregistré : la tâche sera reprise à l'expiration de sa réservation
+            logger.exception("Worker %s : état de la tâche #%s non enregistré", worker, queued.pk)
+        done += 1
+    close_old_connections()
+    return done
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from document.changes import purge_change_feed
+from document.retention import ARCHIVED_MODELS, archive_rows, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive les journaux (actions, audit, historique des courriers) plus anciens que la durée "
+        "de rétention dans des fichiers mensuels compressés, puis les supprime par tranches. "
+        "L'historique des statuts, lu par les analyses, est conservé en base"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="Durée de rétention en jours (AUDIT_RETENTION_DAYS par défaut)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Nombre de lignes par transaction")
+
+    def handle(self, *args, **options):
+        before = retention_cutoff(options['days'])
+        total = 0
+        for label in ARCHIVED_MODELS:
+            count = archive_rows(label, before=before, batch_size=options['batch_size'])
+            self.stdout.write(f"  {label}: {count}")
+            total += count
+        self.stdout.write(self.style.SUCCESS(f"{total} lignes archivées (antérieures au {before:%Y-%m-%d})"))
+
+        # Flux des modifications : rejoué aux clients, pas archivé
+        self.stdout.write(f"{purge_change_feed()} événements du flux des modifications supprimés")
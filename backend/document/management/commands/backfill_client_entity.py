@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from document.denormalization import DENORMALIZED_MODELS, backfill_client_entity
+
+
+class Command(BaseCommand):
+    help = (
+        "Recopie le client et l'entité de l'offre sur les affaires, proformas et factures "
+        "(colonnes dénormalisées), par tranches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Nombre de lignes par transaction")
+
+    def handle(self, *args, **options):
+        total = 0
+        for label in DENORMALIZED_MODELS:
+            count = backfill_client_entity(label, batch_size=options['batch_size'])
+            self.stdout.write(f"  {label}: {count}")
+            total += count
+        self.stdout.write(self.style.SUCCESS(f"{total} documents mis à jour"))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from rest_framework.test import APIClient
+
+from document.benchmarks import (
+    BASELINE_PATH, DEFAULT_SCALE, compare_to_baseline, load_baseline, run_benchmark, save_baseline, seed_dataset
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure requêtes SQL et temps de réponse de chaque endpoint GET de l'API "
+        "sur une base de test peuplée, et compare à la référence"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=int, default=DEFAULT_SCALE, help="Taille du jeu de données (10 clients par unité)"
+        )
+        parser.add_argument('--baseline', default=str(BASELINE_PATH))
+        parser.add_argument('--update-baseline', action='store_true', help="Enregistre les mesures comme référence")
+        parser.add_argument(
+            '--time-factor', type=float, default=None,
+            help="Échoue aussi si une route dépasse ce multiple de son temps de référence"
+        )
+
+    def handle(self, *args, **options):
+        # Comme le lanceur de tests : DEBUG=False (la page d'erreur de debug exécute des requêtes)
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # Base de test en mémoire : pas d'écriture du journal depuis un autre thread
+            with override_settings(AUDIT_LOG_ASYNC=False):
+                user = seed_dataset(scale=options['scale'])
+                client = APIClient()
+                client.force_authenticate(user)
+                results = run_benchmark(client)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for route, measures in sorted(results.items()):
+            self.stdout.write(
+                f"{route:<50} {measures['status']:>4} {measures['queries']:>5} requêtes "
+                f"{measures['sql_ms']:>8} ms SQL {measures['wall_ms']:>8} ms"
+            )
+
+        if options['update_baseline']:
+            save_baseline(results, options['scale'], options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Référence mise à jour : {len(results)} routes"))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        regressions = compare_to_baseline(results, baseline['routes'], time_factor=options['time_factor'])
+        if regressions:
+            raise CommandError("Régressions détectées :\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} routes, aucune régression"))
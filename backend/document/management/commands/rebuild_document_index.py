@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from document.indexing import rebuild_document_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index unifié des documents (DocumentIndex)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Reconstruction de l'index des documents...")
+        counts = rebuild_document_index(batch_size=options['batch_size'])
+        for doc_type, count in counts.items():
+            self.stdout.write(f"  {doc_type}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"{sum(counts.values())} documents indexés"))
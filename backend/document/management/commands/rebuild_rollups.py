@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from document.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les agrégats journaliers des statistiques (DocumentDailyStat)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Reconstruction des agrégats journaliers...")
+        counts = rebuild_rollups(batch_size=options['batch_size'])
+        for doc_type, count in counts.items():
+            self.stdout.write(f"  {doc_type}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"{sum(counts.values())} lignes d'agrégats"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from document.audit import fallback_path, replay_fallback
+
+
+class Command(BaseCommand):
+    help = "Réinsère les entrées d'audit recopiées dans le fichier de secours après un échec d'écriture"
+
+    def handle(self, *args, **options):
+        inserted, remaining = replay_fallback()
+        self.stdout.write(self.style.SUCCESS(f"{inserted} entrées d'audit réinsérées"))
+        if remaining:
+            self.stdout.write(self.style.WARNING(f"{remaining} entrées restent dans {fallback_path()}"))
@@ -0,0 +1,40 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from document.relances import RelanceScheduler, process_due, rebuild_relance_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Planificateur des relances (offres, proformas, opportunités) : dort jusqu'à la prochaine "
+        "échéance de la file RelanceQueue, puis crée les notifications et avance les relances par lots"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Reconstruire la file depuis les tables des documents")
+        parser.add_argument('--once', action='store_true', help="Traiter les relances échues puis s'arrêter")
+        parser.add_argument('--max-sleep', type=float, default=None, help="Attente maximale entre deux passages (secondes)")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            counts = rebuild_relance_queue()
+            for label, count in counts.items():
+                self.stdout.write(f"  {label}: {count}")
+            self.stdout.write(self.style.SUCCESS(f"{sum(counts.values())} relances planifiées"))
+
+        if options['once']:
+            self.stdout.write(self.style.SUCCESS(f"{process_due()} notifications de relance créées"))
+            return
+
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write("Arrêt du planificateur...")
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+        self.stdout.write("Planificateur des relances démarré")
+        RelanceScheduler(max_sleep=options['max_sleep']).run(stop)
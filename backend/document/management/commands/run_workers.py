@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from document.jobs import work
+
+
+def _process_worker(stop, names, poll_interval, burst):
+    # Processus fils : connexions propres, arrêt piloté par le parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    connections.close_all()
+    work(stop, names=names, poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les tâches d'arrière-plan mises en file dans la base (document.jobs) "
+        "avec un groupe de threads ou de processus"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Nombre de workers (1 avec SQLite)")
+        parser.add_argument('--processes', action='store_true', help="Un processus par worker au lieu d'un thread")
+        parser.add_argument('--task', action='append', dest='names', help="Ne traiter que cette tâche (répétable)")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Attente entre deux lectures d'une file vide (secondes)")
+        parser.add_argument('--burst', action='store_true', help="S'arrêter quand la file est vide")
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        if connection.vendor == 'sqlite' and concurrency > 1:
+            # SQLite n'admet qu'un écrivain à la fois : des workers parallèles se
+            # bloquent mutuellement sur la table des tâches
+            self.stderr.write("SQLite : un seul worker (--concurrency ignoré)")
+            concurrency = 1
+        worker_args = (options['names'], options['poll_interval'], options['burst'])
+
+        if options['processes']:
+            stop = multiprocessing.Event()
+            # Les fils ne doivent pas hériter des connexions du parent
+            connections.close_all()
+            workers = [
+                multiprocessing.Process(target=_process_worker, args=(stop, *worker_args), name=f'job-worker-{i}')
+                for i in range(concurrency)
+            ]
+        else:
+            stop = threading.Event()
+            workers = [
+                threading.Thread(
+                    target=work, args=(stop,), kwargs=dict(zip(('names', 'poll_interval', 'burst'), worker_args)),
+                    name=f'job-worker-{i}'
+                )
+                for i in range(concurrency)
+            ]
+
+        def shutdown(signum, frame):
+            self.stdout.write("Arrêt demandé : fin des tâches en cours...")
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        mode = 'processus' if options['processes'] else 'threads'
+        self.stdout.write(f"{concurrency} workers ({mode}) démarrés")
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS("Workers arrêtés"))
@@ -0,0 +1,65 @@
+from contextvars import ContextVar
+
+_current_request = ContextVar('current_request', default=None)
+
+
+def current_user():
+    """
+    Utilisateur de la requête en cours, None hors requête ou s'il est anonyme.
+    Lu au moment de l'appel : l'authentification DRF (JWT), faite dans la vue,
+    est alors déjà reportée sur la requête Django.
+    """
+    request = _current_request.get()
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+class CurrentRequestMiddleware:
+    """Rend la requête en cours accessible aux signaux (journal d'audit des modifications)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+class JWTAuthMiddleware:
+    """
+    Authentifie les WebSocket par le jeton d'accès JWT de l'API, passé dans
+    l'URL (`ws/notifications/?token=...`) : les navigateurs ne peuvent pas
+    envoyer d'en-tête Authorization. Sans jeton valide, l'utilisateur de la
+    session (AuthMiddlewareStack) est conservé.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        from urllib.parse import parse_qs
+
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            user = await _user_from_token(token[0])
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await self.inner(scope, receive, send)
+
+
+async def _user_from_token(token):
+    from channels.db import database_sync_to_async
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+    authentication = JWTAuthentication()
+    try:
+        validated = authentication.get_validated_token(token)
+        return await database_sync_to_async(authentication.get_user)(validated)
+    except (InvalidToken, TokenError):
+        return None
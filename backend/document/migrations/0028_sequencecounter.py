@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0027_useractionlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=10)),
+                ('entity_pk', models.PositiveIntegerField(default=0)),
+                ('client_pk', models.PositiveIntegerField(default=0)),
+                ('scope', models.CharField(blank=True, default='', max_length=30)),
+                ('period', models.CharField(blank=True, default='', max_length=7)),
+                ('value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Compteur de séquence',
+                'verbose_name_plural': 'Compteurs de séquence',
+                'constraints': [models.UniqueConstraint(fields=('doc_type', 'entity_pk', 'client_pk', 'scope', 'period'), name='unique_sequence_counter_scope')],
+            },
+        ),
+    ]
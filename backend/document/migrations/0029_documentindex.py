@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0011_alter_client_created_by_alter_client_updated_by_and_more'),
+        ('document', '0028_sequencecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('OFF', 'Offre'), ('PRO', 'Proforma'), ('AFF', 'Affaire'), ('FAC', 'Facture'), ('RAP', 'Rapport'), ('FOR', 'Formation'), ('ATT', 'Attestation de formation')], max_length=3)),
+                ('object_id', models.PositiveIntegerField()),
+                ('reference', models.CharField(blank=True, default='', max_length=255)),
+                ('statut', models.CharField(blank=True, default='', max_length=20)),
+                ('date_creation', models.DateTimeField()),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='documents_index', to='client.client')),
+                ('entity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='documents_index', to='document.entity')),
+            ],
+            options={
+                'verbose_name': 'Index de document',
+                'verbose_name_plural': 'Index des documents',
+                'ordering': ['-date_creation', '-id'],
+                'indexes': [models.Index(fields=['-date_creation', '-id'], name='docindex_feed_idx'), models.Index(fields=['doc_type', '-date_creation'], name='docindex_type_idx'), models.Index(fields=['client', '-date_creation'], name='docindex_client_idx'), models.Index(fields=['entity', '-date_creation'], name='docindex_entity_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doc_type', 'object_id'), name='unique_document_index_object')],
+            },
+        ),
+    ]
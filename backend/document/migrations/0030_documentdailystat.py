@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0011_alter_client_created_by_alter_client_updated_by_and_more'),
+        ('document', '0029_documentindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('OFF', 'Offre'), ('PRO', 'Proforma'), ('AFF', 'Affaire'), ('FAC', 'Facture'), ('RAP', 'Rapport'), ('FOR', 'Formation'), ('ATT', 'Attestation de formation')], max_length=3)),
+                ('day', models.DateField()),
+                ('statut', models.CharField(blank=True, default='', max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('montant', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('montant_paye', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='client.client')),
+                ('entity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='document.entity')),
+                ('produit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='document.product')),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+                'ordering': ['doc_type', 'day'],
+                'indexes': [models.Index(fields=['doc_type', 'day'], name='dailystat_type_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doc_type', 'day', 'entity', 'produit', 'client', 'statut'), name='unique_document_daily_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('document', '0030_documentdailystat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='statuschange',
+            index=models.Index(fields=['content_type', 'object_id', '-date_changement'], name='statuschange_object_idx'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Statuts de relance (DELAIS_RELANCE des modèles) à la création de la file
+RELANCE_STATUTS = {
+    ('offres_app', 'Offre'): ['ENVOYE', 'EN_NEGOCIATION'],
+    ('proformas_app', 'Proforma'): ['ENVOYE', 'EN_NEGOCIATION'],
+    ('opportunites_app', 'Opportunite'): ['PROSPECT', 'QUALIFICATION', 'PROPOSITION', 'NEGOCIATION'],
+}
+
+
+def backfill_relance_queue(apps, schema_editor):
+    # File initialisée avec les relances déjà planifiées sur les documents
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    RelanceQueue = apps.get_model('document', 'RelanceQueue')
+    for (app_label, model_name), statuts in RELANCE_STATUTS.items():
+        rows = apps.get_model(app_label, model_name).objects.filter(
+            relance__isnull=False, statut__in=statuts
+        ).values_list('pk', 'relance')
+        if not rows.exists():
+            continue
+        content_type, _ = ContentType.objects.get_or_create(app_label=app_label, model=model_name.lower())
+        RelanceQueue.objects.bulk_create(
+            [RelanceQueue(content_type=content_type, object_id=pk, echeance=date) for pk, date in rows.iterator()],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('document', '0033_job'),
+        ('offres_app', '0012_alter_offre_sequence_number'),
+        ('opportunites_app', '0003_rename_commantaire_opportunite_commentaire'),
+        ('proformas_app', '0002_proforma_relance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('RELANCE', 'Relance')], default='RELANCE', max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('message', models.CharField(max_length=255)),
+                ('echeance', models.DateTimeField(blank=True, null=True)),
+                ('lue', models.BooleanField(default=False)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+                ('destinataire', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications_kes', to=settings.AUTH_USER_MODEL)),
+                ('entity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='document.entity')),
+            ],
+            options={
+                'verbose_name': 'Notification',
+                'verbose_name_plural': 'Notifications',
+                'ordering': ['-date_creation'],
+                'indexes': [models.Index(fields=['destinataire', 'lue', '-date_creation'], name='notification_user_idx'), models.Index(fields=['content_type', 'object_id'], name='notification_object_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelanceQueue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('echeance', models.DateTimeField()),
+                ('modifie_le', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Relance planifiée',
+                'verbose_name_plural': 'Relances planifiées',
+                'indexes': [models.Index(fields=['echeance'], name='relance_echeance_idx'), models.Index(fields=['content_type', 'echeance'], name='relance_type_echeance_idx'), models.Index(fields=['modifie_le'], name='relance_modifie_idx')],
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='unique_relance_object')],
+            },
+        ),
+        migrations.RunPython(backfill_relance_queue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('document', '0034_relance_queue_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('object_id', models.PositiveIntegerField()),
+                ('action', models.CharField(choices=[('C', 'Création'), ('U', 'Modification'), ('D', 'Suppression')], max_length=1)),
+                ('fields', models.JSONField(blank=True, null=True)),
+                ('entity_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Modification',
+                'verbose_name_plural': 'Flux des modifications',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -7,6 +7,8 @@ from django_fsm import FSMField, transition
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from client.models import AuditableMixin, Client, Contact
+from document.sequences import allocate_sequences, month_period, next_sequence
+from document.tracking import FieldTrackerMixin
 
 
 
@@ -68,6 +70,248 @@ class UserActionLog(models.Model):
 
     def __str__(self):
         return f"{self.user} a {self.action_type} {self.content_type} (ID: {self.object_id}) le {self.timestamp}"
+
+
+class SequenceCounter(models.Model):
+    """
+    Compteur de séquence utilisé pour la génération des références.
+    Une ligne par portée (type de document, entité, client, portée libre, période),
+    incrémentée atomiquement par document.sequences.
+    """
+    doc_type = models.CharField(max_length=10)
+    entity_pk = models.PositiveIntegerField(default=0)
+    client_pk = models.PositiveIntegerField(default=0)
+    # Discriminant libre (catégorie, formation, direction...)
+    scope = models.CharField(max_length=30, blank=True, default='')
+    # Période de numérotation ('2025-03' pour un mois, '2025' pour une année, '' sans période)
+    period = models.CharField(max_length=7, blank=True, default='')
+    value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Compteur de séquence"
+        verbose_name_plural = "Compteurs de séquence"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doc_type', 'entity_pk', 'client_pk', 'scope', 'period'],
+                name='unique_sequence_counter_scope'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type} [{self.entity_pk}/{self.client_pk}/{self.scope}/{self.period}] = {self.value}"
+
+
+class DocumentIndex(models.Model):
+    """
+    Index unifié de tous les documents (offres, proformas, affaires, factures,
+    rapports, formations, attestations), tenu à jour par les signaux de
+    document.indexing. Sert le flux trié /api/documents/feed/.
+    """
+    DOC_TYPES = [
+        ('OFF', 'Offre'),
+        ('PRO', 'Proforma'),
+        ('AFF', 'Affaire'),
+        ('FAC', 'Facture'),
+        ('RAP', 'Rapport'),
+        ('FOR', 'Formation'),
+        ('ATT', 'Attestation de formation'),
+    ]
+
+    doc_type = models.CharField(max_length=3, choices=DOC_TYPES)
+    object_id = models.PositiveIntegerField()
+    reference = models.CharField(max_length=255, blank=True, default='')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='documents_index')
+    entity = models.ForeignKey('Entity', on_delete=models.CASCADE, null=True, blank=True, related_name='documents_index')
+    statut = models.CharField(max_length=20, blank=True, default='')
+    date_creation = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Index de document"
+        verbose_name_plural = "Index des documents"
+        ordering = ['-date_creation', '-id']
+        constraints = [
+            models.UniqueConstraint(fields=['doc_type', 'object_id'], name='unique_document_index_object'),
+        ]
+        indexes = [
+            models.Index(fields=['-date_creation', '-id'], name='docindex_feed_idx'),
+            models.Index(fields=['doc_type', '-date_creation'], name='docindex_type_idx'),
+            models.Index(fields=['client', '-date_creation'], name='docindex_client_idx'),
+            models.Index(fields=['entity', '-date_creation'], name='docindex_entity_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type} {self.reference}"
+
+
+class DocumentDailyStat(models.Model):
+    """
+    Agrégats journaliers (nombre, montants) des offres, proformas et factures
+    par entité, produit, client et statut, tenus à jour par document.rollups.
+    Sert les endpoints de statistiques sans parcourir les tables de documents.
+    """
+    doc_type = models.CharField(max_length=3, choices=DocumentIndex.DOC_TYPES)
+    day = models.DateField()
+    entity = models.ForeignKey('Entity', on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats')
+    produit = models.ForeignKey('Product', on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats')
+    statut = models.CharField(max_length=20, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+    montant = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    montant_paye = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Statistique journalière"
+        verbose_name_plural = "Statistiques journalières"
+        ordering = ['doc_type', 'day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doc_type', 'day', 'entity', 'produit', 'client', 'statut'],
+                name='unique_document_daily_stat'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['doc_type', 'day'], name='dailystat_type_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type} {self.day} {self.statut} = {self.count}"
+
+
+class Job(models.Model):
+    """
+    Tâche d'arrière-plan mise en file dans la base (voir document.jobs),
+    exécutée par la commande run_workers.
+    """
+    STATUTS = [
+        ('PENDING', 'En attente'),
+        ('RUNNING', 'En cours'),
+        ('DONE', 'Terminée'),
+        ('FAILED', 'Échouée'),
+    ]
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Les tâches de priorité la plus haute sont prises en premier
+    priority = models.SmallIntegerField(default=0)
+    statut = models.CharField(max_length=10, choices=STATUTS, default='PENDING')
+    # Clé d'idempotence : une seule tâche par clé, une nouvelle mise en file renvoie l'existante
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # Date à partir de laquelle la tâche peut être prise (report des nouvelles tentatives)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Délai de visibilité : passé cette date, une tâche en cours est reprise par un autre worker
+    timeout = models.PositiveIntegerField(default=300)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tâche d'arrière-plan"
+        verbose_name_plural = "Tâches d'arrière-plan"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['statut', '-priority', 'run_at'], name='job_queue_idx'),
+            models.Index(fields=['statut', 'locked_until'], name='job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.statut})"
+
+
+class RelanceQueue(models.Model):
+    """
+    Relances à venir des offres, proformas et opportunités : une ligne par
+    objet en statut de relance, tenue à jour par les signaux de
+    document.relances. Parcourue par échéance par le planificateur.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.PositiveIntegerField()
+    echeance = models.DateTimeField()
+    # Lu par le planificateur pour ne recharger que les lignes modifiées
+    modifie_le = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Relance planifiée"
+        verbose_name_plural = "Relances planifiées"
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='unique_relance_object'),
+        ]
+        indexes = [
+            models.Index(fields=['echeance'], name='relance_echeance_idx'),
+            models.Index(fields=['content_type', 'echeance'], name='relance_type_echeance_idx'),
+            models.Index(fields=['modifie_le'], name='relance_modifie_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type_id}/{self.object_id} le {self.echeance}"
+
+
+class Notification(models.Model):
+    """Notification adressée à un utilisateur (relance à effectuer...)"""
+    TYPES = [
+        ('RELANCE', 'Relance'),
+    ]
+
+    destinataire = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications_kes')
+    entity = models.ForeignKey('Entity', on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    type = models.CharField(max_length=20, choices=TYPES, default='RELANCE')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.PositiveIntegerField()
+    message = models.CharField(max_length=255)
+    echeance = models.DateTimeField(null=True, blank=True)
+    lue = models.BooleanField(default=False)
+    date_creation = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        verbose_name = "Notification"
+        verbose_name_plural = "Notifications"
+        ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['destinataire', 'lue', '-date_creation'], name='notification_user_idx'),
+            models.Index(fields=['content_type', 'object_id'], name='notification_object_idx'),
+        ]
+
+    def __str__(self):
+        return self.message
+
+
+class ChangeEvent(models.Model):
+    """
+    Flux des modifications des documents (voir document.changes) : une ligne
+    par création, modification ou suppression, écrite dans la transaction de
+    la modification. La clé primaire, croissante, sert de numéro de séquence
+    pour la reprise des clients.
+    """
+    ACTIONS = [
+        ('C', 'Création'),
+        ('U', 'Modification'),
+        ('D', 'Suppression'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=1, choices=ACTIONS)
+    # Champs modifiés, None si inconnus (modification complète)
+    fields = models.JSONField(null=True, blank=True)
+    entity_id = models.PositiveIntegerField(null=True, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Modification"
+        verbose_name_plural = "Flux des modifications"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.content_type_id}/{self.object_id}"
+
+
 class Entity(AuditableMixin, models.Model):
     code = models.CharField(
         max_length=3,
@@ -130,6 +374,10 @@ class StatusChange(models.Model):
     
     class Meta:
         ordering = ['-date_changement']
+        indexes = [
+            # Historique d'un objet (ou d'une page d'objets), du plus récent au plus ancien
+            models.Index(fields=['content_type', 'object_id', '-date_changement'], name='statuschange_object_idx'),
+        ]
         verbose_name = "Historique de changement de statut"
         verbose_name_plural = "Historique des changements de statut"
     
@@ -137,10 +385,11 @@ class StatusChange(models.Model):
         return f"{self.ancien_statut} → {self.nouveau_statut} par {self.utilisateur} le {self.date_changement}"
 
 
-class StatusTrackingModel(models.Model):
+class StatusTrackingModel(FieldTrackerMixin, models.Model):
     """
     Classe abstraite pour la gestion des statuts et le suivi des modifications.
     Cette classe peut être étendue par tout modèle nécessitant un suivi des statuts.
+    Le statut chargé est suivi par FieldTrackerMixin (previous('statut')).
     """
     # Statut actuel
     statut = models.CharField(
@@ -255,10 +504,98 @@ class StatusTrackingModel(models.Model):
         
         return True
     
+    # Statuts dont le changement a des effets de bord (création de documents,
+    # initialisation...) : bulk_set_status les applique objet par objet
+    statuts_avec_effets = ()
+
+    @classmethod
+    def valeurs_changement_statut(cls, nouveau_statut, date_statut):
+        """
+        Colonnes à mettre à jour avec le statut lors d'un changement groupé,
+        en expressions SQL (équivalent des ajustements faits objet par objet).
+        """
+        return {}
+
+    @classmethod
+    def bulk_set_status(cls, queryset, nouveau_statut, user=None, commentaire="", metadata=None):
+        """
+        Change le statut de tous les objets d'un queryset : un UPDATE (statut,
+        modificateur et dates_statuts fusionné en SQL) et un bulk_create de
+        l'historique, au lieu de deux requêtes ou plus par objet.
+
+        Les objets déjà au statut sont ignorés. Même validation que set_status().
+        Les statuts de `statuts_avec_effets` passent par changer_statut() objet par objet.
+
+        Returns:
+            int: nombre d'objets modifiés
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from .bulk_status import JSONSet, bulk_status_changed
+
+        model = queryset.model
+        status_choices = [choice[0] for choice in model().get_status_choices()]
+        if nouveau_statut not in status_choices:
+            raise ValidationError(f"Statut invalide. Choix possibles: {', '.join(status_choices)}")
+
+        a_modifier = queryset.exclude(statut=nouveau_statut)
+        if nouveau_statut in model.statuts_avec_effets:
+            modifies = 0
+            for instance in a_modifier:
+                changer_statut = getattr(instance, 'changer_statut', instance.set_status)
+                modifies += bool(changer_statut(nouveau_statut, user=user, commentaire=commentaire, metadata=metadata))
+            return modifies
+
+        date_statut = timezone.now()
+        with transaction.atomic():
+            anciens = list(a_modifier.select_for_update().order_by().values_list('pk', 'statut'))
+            if not anciens:
+                return 0
+            pks = [pk for pk, _ in anciens]
+
+            valeurs = {
+                'statut': nouveau_statut,
+                'date_modification': date_statut,
+                'dates_statuts': JSONSet('dates_statuts', nouveau_statut, date_statut.isoformat()),
+                **model.valeurs_changement_statut(nouveau_statut, date_statut),
+            }
+            if user:
+                valeurs['modificateur'] = user
+            model.objects.filter(pk__in=pks).update(**valeurs)
+
+            content_type = ContentType.objects.get_for_model(model)
+            StatusChange.objects.bulk_create([
+                StatusChange(
+                    content_type=content_type,
+                    object_id=pk,
+                    ancien_statut=ancien_statut,
+                    nouveau_statut=nouveau_statut,
+                    utilisateur=user,
+                    commentaire=commentaire,
+                    metadata=dict(metadata or {}),
+                )
+                for pk, ancien_statut in anciens
+            ], batch_size=500)
+
+            bulk_status_changed.send(sender=model, pks=pks, statut=nouveau_statut)
+        return len(pks)
+
+    @classmethod
+    def prefetch_history(cls, objects, limit=None):
+        """Précharge l'historique de statut d'une liste d'objets en une requête (voir status_history)"""
+        from .status_history import prefetch_status_history
+        prefetch_status_history(objects, limit)
+
     def get_status_history(self):
-        """Récupère l'historique complet des changements de statut pour cet objet"""
+        """
+        Récupère l'historique complet des changements de statut pour cet objet.
+        Après prefetch_history(), retourne la liste préchargée (limitée aux
+        dernières transitions si un nombre a été demandé) sans requête.
+        """
         from django.contrib.contenttypes.models import ContentType
-        
+        from .status_history import PREFETCHED_ATTR
+
+        if hasattr(self, PREFETCHED_ATTR):
+            return getattr(self, PREFETCHED_ATTR)
         content_type = ContentType.objects.get_for_model(self)
         return StatusChange.objects.filter(
             content_type=content_type,
@@ -269,12 +606,20 @@ class StatusTrackingModel(models.Model):
         """Surcharge de la méthode save pour gérer la création initiale du statut"""
         # Si c'est une nouvelle instance (sans ID), enregistrer le statut initial
         is_new = self.pk is None
+        suivi_initial = is_new and hasattr(self, 'createur') and self.createur
+
+        # Initialiser dates_statuts pour le statut initial avant l'INSERT, plutôt
+        # que par une seconde sauvegarde (date_creation n'est fixée qu'à l'INSERT)
+        if suivi_initial:
+            if self.dates_statuts is None:
+                self.dates_statuts = {}
+            self.dates_statuts[self.statut] = timezone.now().isoformat()
         
         # Appeler la méthode save parent
         super().save(*args, **kwargs)
         
         # Pour une nouvelle instance, créer la première entrée dans l'historique
-        if is_new and hasattr(self, 'createur') and self.createur:
+        if suivi_initial:
             from django.contrib.contenttypes.models import ContentType
             
             content_type = ContentType.objects.get_for_model(self)
@@ -286,13 +631,6 @@ class StatusTrackingModel(models.Model):
                 utilisateur=self.createur,
                 commentaire="Création"
             )
-            
-            # Initialiser dates_statuts avec la date de création pour le statut initial
-            if self.dates_statuts is None:
-                self.dates_statuts = {}
-                
-            self.dates_statuts[self.statut] = self.date_creation.isoformat()
-            self.save(update_fields=['dates_statuts'])
 
 
 # Exemple d'utilisation avec le modèle Offre
@@ -311,7 +649,8 @@ class AuditLog(models.Model):
     object_id = models.CharField(max_length=100)
     object_repr = models.CharField(max_length=200)
     changes = models.JSONField(null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Heure de l'action, pas de l'écriture différée (voir document.audit)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-timestamp']
@@ -347,14 +686,16 @@ class Document(models.Model):
     fichier = models.FileField(upload_to='documents/', blank=True, null=True)
 
     def log_action(self, action, user, changes=None):
-        AuditLog.objects.create(
+        from .audit import audit_writer
+
+        audit_writer.write(AuditLog(
             user=user,
             action=action,
             content_type=ContentType.objects.get_for_model(self),
             object_id=str(self.pk),
             object_repr=str(self),
             changes=changes
-        )
+        ))
 
     class Meta:
         abstract = True
@@ -373,20 +714,98 @@ class Rapport(Document):
         if not self.numero:
             self.numero = f"RAP{self.affaire.offre.client.c_num}/{self.produit.code}/{self.pk}"
         if not self.reference:
+            client = self.affaire.offre.client
             if not self.sequence_number:
-                last_sequence = Rapport.objects.filter(
-                    entity=self.entity,
-                    doc_type='RAP',
-                    date_creation__year=now().year,
-                    date_creation__month=now().month
-                ).aggregate(Max('sequence_number'))['sequence_number__max']
-                self.sequence_number = (last_sequence or 0) + 1
-            total_rapports_client = Rapport.objects.filter(client=self.affaire.offre.client).count() + 1
-            total_category_rapports = Rapport.objects.filter(client=self.affaire.offre.client,produit__category=self.produit.category).count() + 1
-            date = self.date_creation or now()
-            self.reference = f"{self.entity.code}/RAP/{self.client.c_num}/{self.affaire.reference}/{total_category_rapports}/{self.produit.code}/{total_rapports_client}/{self.sequence_number:04d}"
+                self.sequence_number = next_sequence(
+                    'RAP',
+                    entity=self.entity_id,
+                    period=month_period(),
+                    initial=lambda: Rapport.objects.filter(
+                        entity=self.entity,
+                        doc_type='RAP',
+                        date_creation__year=now().year,
+                        date_creation__month=now().month
+                    ).aggregate(Max('sequence_number'))['sequence_number__max']
+                )
+            total_rapports_client = next_sequence(
+                'RAP',
+                client=client,
+                initial=lambda: Rapport.objects.filter(client=client).count()
+            )
+            total_category_rapports = next_sequence(
+                'RAP',
+                client=client,
+                scope=f"CAT{self.produit.category_id}",
+                initial=lambda: Rapport.objects.filter(client=client, produit__category=self.produit.category).count()
+            )
+            self.reference = self._formater_reference(total_category_rapports, total_rapports_client)
         super().save(*args, **kwargs)
 
+    def _formater_reference(self, total_category_rapports, total_rapports_client):
+        return f"{self.entity.code}/RAP/{self.client.c_num}/{self.affaire.reference}/{total_category_rapports}/{self.produit.code}/{total_rapports_client}/{self.sequence_number:04d}"
+
+    @classmethod
+    def generer_references_en_masse(cls, rapports):
+        """
+        Attribue numéros, références et numéros de rapport à des rapports non
+        sauvegardés, en vue d'un bulk_create. Les compteurs sont réservés par bloc
+        et les relations non encore chargées lues en une requête par modèle.
+        """
+        from affaires_app.models import Affaire
+
+        rapports = [rapport for rapport in rapports if not rapport.reference]
+        if not rapports:
+            return rapports
+
+        relations = {
+            'affaire': Affaire.objects.select_related('offre__client'),
+            'produit': Product.objects.all(),
+            'entity': Entity.objects.all(),
+            'client': Client.objects.all(),
+        }
+        for name, queryset in relations.items():
+            field = cls._meta.get_field(name)
+            a_charger = [r for r in rapports if not field.is_cached(r)]
+            if a_charger:
+                objets = queryset.in_bulk({getattr(r, field.attname) for r in a_charger})
+                for rapport in a_charger:
+                    setattr(rapport, name, objets[getattr(rapport, field.attname)])
+
+        period = month_period()
+        sans_sequence = [rapport for rapport in rapports if not rapport.sequence_number]
+        sequences = allocate_sequences(
+            'RAP',
+            [{'entity': r.entity_id, 'period': period} for r in sans_sequence],
+            initial=lambda scope: Rapport.objects.filter(
+                entity=scope['entity'],
+                doc_type='RAP',
+                date_creation__year=now().year,
+                date_creation__month=now().month
+            ).aggregate(Max('sequence_number'))['sequence_number__max']
+        )
+        for rapport, sequence in zip(sans_sequence, sequences):
+            rapport.sequence_number = sequence
+
+        totaux_client = allocate_sequences(
+            'RAP',
+            [{'client': r.affaire.offre.client_id} for r in rapports],
+            initial=lambda scope: Rapport.objects.filter(client=scope['client']).count()
+        )
+        totaux_categorie = allocate_sequences(
+            'RAP',
+            [{'client': r.affaire.offre.client_id, 'scope': f"CAT{r.produit.category_id}"} for r in rapports],
+            initial=lambda scope: Rapport.objects.filter(
+                client=scope['client'],
+                produit__category=int(scope['scope'][3:])
+            ).count()
+        )
+
+        for rapport, total_client, total_categorie in zip(rapports, totaux_client, totaux_categorie):
+            if not rapport.numero:
+                rapport.numero = f"RAP{rapport.affaire.offre.client.c_num}/{rapport.produit.code}/{rapport.pk}"
+            rapport.reference = rapport._formater_reference(total_categorie, total_client)
+        return rapports
+
 
 class Formation(AuditableMixin, models.Model):
     titre = models.CharField(max_length=255)
@@ -424,20 +843,81 @@ class AttestationFormation(Document):
     def save(self, *args, **kwargs):
         if not self.reference:
             if not self.sequence_number:
-                last_sequence = AttestationFormation.objects.filter(
-                    entity=self.entity,
-                    client=self.affaire.client,
-                    formation=self.formation,
-                    doc_type='ATT',
-                    date_creation__year=now().year,
-                    date_creation__month=now().month
-                ).aggregate(Max('sequence_number'))['sequence_number__max']
-                self.sequence_number = (last_sequence or 0) + 1
-            total_attestations_client = AttestationFormation.objects.filter(client=self.client).count() + 1
-            date = self.date_creation or now()
-            self.reference = f"{self.entity.code}/ATT/{self.client.c_num}/{str(date.year)[-2:]}{date.month:02d}{date.day:02d}/{self.affaire.reference}/{total_attestations_client}/{self.formation.pk}/{self.participant.pk}/{self.sequence_number:04d}"
+                self.sequence_number = next_sequence(
+                    'ATT',
+                    entity=self.entity_id,
+                    client=self.client_id,
+                    scope=f"FOR{self.formation_id}",
+                    period=month_period(),
+                    initial=lambda: AttestationFormation.objects.filter(
+                        entity=self.entity,
+                        client=self.client,
+                        formation=self.formation,
+                        doc_type='ATT',
+                        date_creation__year=now().year,
+                        date_creation__month=now().month
+                    ).aggregate(Max('sequence_number'))['sequence_number__max']
+                )
+            total_attestations_client = next_sequence(
+                'ATT',
+                client=self.client_id,
+                initial=lambda: AttestationFormation.objects.filter(client=self.client).count()
+            )
+            self.reference = self._formater_reference(total_attestations_client)
         super().save(*args, **kwargs)
 
+    def _formater_reference(self, total_attestations_client):
+        date = self.date_creation or now()
+        return f"{self.entity.code}/ATT/{self.client.c_num}/{str(date.year)[-2:]}{date.month:02d}{date.day:02d}/{self.affaire.reference}/{total_attestations_client}/{self.formation_id}/{self.participant_id}/{self.sequence_number:04d}"
+
+    @classmethod
+    def generer_references_en_masse(cls, attestations):
+        """
+        Attribue numéros et références à des attestations non sauvegardées,
+        en vue d'un bulk_create.
+        """
+        from affaires_app.models import Affaire
+
+        attestations = [attestation for attestation in attestations if not attestation.reference]
+        if not attestations:
+            return attestations
+
+        period = month_period()
+        sans_sequence = [a for a in attestations if not a.sequence_number]
+        sequences = allocate_sequences(
+            'ATT',
+            [
+                {'entity': a.entity_id, 'client': a.client_id, 'scope': f"FOR{a.formation_id}", 'period': period}
+                for a in sans_sequence
+            ],
+            initial=lambda scope: AttestationFormation.objects.filter(
+                entity=scope['entity'],
+                client=scope['client'],
+                formation=int(scope['scope'][3:]),
+                doc_type='ATT',
+                date_creation__year=now().year,
+                date_creation__month=now().month
+            ).aggregate(Max('sequence_number'))['sequence_number__max']
+        )
+        for attestation, sequence in zip(sans_sequence, sequences):
+            attestation.sequence_number = sequence
+
+        totaux = allocate_sequences(
+            'ATT',
+            [{'client': a.client_id} for a in attestations],
+            initial=lambda scope: AttestationFormation.objects.filter(client=scope['client']).count()
+        )
+
+        affaires = Affaire.objects.in_bulk({a.affaire_id for a in attestations})
+        entities = Entity.objects.in_bulk({a.entity_id for a in attestations})
+        clients = Client.objects.in_bulk({a.client_id for a in attestations})
+        for attestation, total in zip(attestations, totaux):
+            attestation.affaire = affaires[attestation.affaire_id]
+            attestation.entity = entities[attestation.entity_id]
+            attestation.client = clients[attestation.client_id]
+            attestation.reference = attestation._formater_reference(total)
+        return attestations
+
 
 class DocumentPermission:
     pass
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .query_plan import optimize_queryset, with_columns
+from .sparse_fields import apply_sparse_fieldset, parse_sparse_params
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Pagination par curseur (keyset) des vues liste. Avec `?page_size=` ou
+    `?cursor=`, la réponse est une page {next, previous, results}. Sans ces
+    paramètres, elle reste un tableau dans l'ordre demandé, comme l'attend le
+    frontend, limité à LIST_MAX_RESULTS lignes : une liste tronquée porte les
+    en-têtes `X-Total-Count` (nombre total de lignes) et, si le tri le permet,
+    `Link: <...>; rel="next"` (adresse de la page suivante).
+
+    L'ordre est celui de la vue (OrderingFilter / attribut `ordering`), à défaut
+    celui du queryset ou du modèle. La position du curseur est portée par le
+    premier champ de tri, qui doit être une colonne non nullable : un
+    `?ordering=` sur une relation, un champ calculé ou nullable est refusé
+    (400) avec un curseur ; un tri par défaut inutilisable retombe sur la clé
+    primaire.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-pk'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.as_array = (
+            self.page_size_query_param not in request.query_params
+            and self.cursor_query_param not in request.query_params
+        )
+        self.total = None
+        self.has_cursor = True
+        fields, requested = self._requested_ordering(request, queryset, view)
+
+        if not self._is_cursor_ordering(queryset.model, fields):
+            if self.as_array:
+                # Tableau dans l'ordre demandé, sans curseur possible pour la suite
+                self.has_cursor = False
+                return self._first_rows(queryset)
+            if requested:
+                raise ValidationError({
+                    'ordering': f"Tri '{fields[0]}' incompatible avec la pagination par curseur "
+                                "(relation, champ calculé ou nullable)"
+                })
+
+        # Les champs du curseur doivent être chargés même avec ?fields=
+        queryset = with_columns(queryset, self.get_ordering(request, queryset, view))
+        page = super().paginate_queryset(queryset, request, view)
+        if self.as_array and self.has_next:
+            self.total = queryset.count()
+        return page
+
+    def _first_rows(self, queryset):
+        limit = self.get_page_size(None)
+        rows = list(queryset[:limit + 1])
+        if len(rows) > limit:
+            self.total = queryset.count()
+        return rows[:limit]
+
+    def get_page_size(self, request):
+        if self.as_array:
+            return getattr(settings, 'LIST_MAX_RESULTS', 1000)
+        return super().get_page_size(request)
+
+    def get_paginated_response(self, data):
+        if not self.as_array:
+            return super().get_paginated_response(data)
+        headers = None
+        if self.total is not None:
+            headers = {'X-Total-Count': str(self.total)}
+            next_link = self.get_next_link() if self.has_cursor else None
+            if next_link:
+                headers['Link'] = f'<{next_link}>; rel="next"'
+        return Response(data, headers=headers)
+
+    def get_ordering(self, request, queryset, view):
+        ordering, _ = self._requested_ordering(request, queryset, view)
+        if not self._is_cursor_ordering(queryset.model, ordering):
+            return (self.ordering,)
+
+        # Départage sur la clé primaire pour un ordre total et stable
+        if ordering[-1].lstrip('-') not in ('pk', queryset.model._meta.pk.name):
+            ordering.append('-pk' if ordering[0].startswith('-') else 'pk')
+        return tuple(ordering)
+
+    def _requested_ordering(self, request, queryset, view):
+        """
+        Returns:
+            tuple: (champs de tri, True s'ils viennent du paramètre ?ordering=)
+        """
+        ordering, requested = None, False
+
+        # Le tri de la vue ne s'applique qu'à son propre modèle (pas aux sous-listes des @action)
+        if view is not None and self._view_model(view) is queryset.model:
+            for backend in getattr(view, 'filter_backends', []):
+                if hasattr(backend, 'get_ordering'):
+                    backend = backend()
+                    ordering = backend.get_ordering(request, queryset, view)
+                    requested = bool(request.query_params.get(getattr(backend, 'ordering_param', 'ordering')))
+                    break
+
+        if not ordering:
+            ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        return [field for field in ordering if isinstance(field, str)], requested
+
+    def _is_cursor_ordering(self, model, ordering):
+        return bool(ordering) and self._is_cursor_field(model, ordering[0])
+
+    def _view_model(self, view):
+        queryset = getattr(view, 'queryset', None)
+        if queryset is None:
+            queryset = view.get_queryset()
+        return queryset.model
+
+    def _is_cursor_field(self, model, ordering_field):
+        name = ordering_field.lstrip('-')
+        if name == 'pk':
+            return True
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return field.concrete and not field.is_relation and not field.null
+
+
+class PaginatedActionMixin:
+    """
+    Pagination des sous-listes exposées par des @action (ex: /clients/{id}/offres/).
+    Les relations lues par le sérialiseur sont chargées en amont (voir query_plan)
+    et les champs à la demande (?fields= / ?expand=) sont pris en compte.
+    """
+
+    def paginated_response(self, queryset, serializer_class):
+        queryset = optimize_queryset(queryset, serializer_class, self.request)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self._sparse(serializer_class(page, many=True)).data)
+        return Response(self._sparse(serializer_class(queryset, many=True)).data)
+
+    def _sparse(self, serializer):
+        sparse = parse_sparse_params(self.request)
+        return serializer if sparse is None else apply_sparse_fieldset(serializer, *sparse)
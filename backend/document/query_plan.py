@@ -0,0 +1,286 @@
+from functools import lru_cache
+
+from rest_framework import serializers
+
+from .sparse_fields import apply_sparse_fieldset, declared_sparse_params, parse_sparse_params
+
+
+# Profondeur maximale d'imbrication explorée dans les sérialiseurs
+MAX_DEPTH = 5
+
+# Plans mis en cache (sérialiseur, modèle, champs à la demande)
+PLAN_CACHE_SIZE = 512
+
+
+def _relations(model):
+    """Relations d'un modèle indexées par nom d'attribut (accesseur pour les relations inverses)"""
+    relations = {}
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        name = field.get_accessor_name() if field.auto_created and not field.concrete else field.name
+        if name:
+            relations[name] = field
+    return relations
+
+
+def _follow(model, attrs):
+    """
+    Suit un chemin d'attributs (source DRF) tant qu'il traverse des relations.
+
+    Returns:
+        tuple: (chemin ORM, modèle atteint, relation multiple traversée)
+    """
+    path, many = [], False
+    for attr in attrs:
+        field = _relations(model).get(attr)
+        if field is None:
+            break
+        path.append(attr)
+        many = many or field.many_to_many or field.one_to_many
+        model = field.related_model
+    return '__'.join(path), model, many
+
+
+def _walk(serializer, model, prefix, in_prefetch, select, prefetch, depth):
+    if depth > MAX_DEPTH:
+        return
+
+    # Relations déclarées par le sérialiseur pour ses SerializerMethodField,
+    # inutiles si ces champs ont été retirés (?fields=)
+    meta = getattr(serializer, 'Meta', None)
+    if not any(_is_computed(field, model) for field in serializer.fields.values()):
+        meta = None
+    for hint, target in (('select_related', prefetch if in_prefetch else select), ('prefetch_related', prefetch)):
+        for path in getattr(meta, hint, ()):
+            target.add(f"{prefix}__{path}" if prefix else path)
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        is_many_related = isinstance(field, serializers.ManyRelatedField)
+        path, related_model, many = _follow(model, field.source.split('.'))
+        if not path:
+            continue
+
+        lookup = f"{prefix}__{path}" if prefix else path
+        many = many or in_prefetch
+
+        if isinstance(nested, serializers.BaseSerializer) and hasattr(nested, 'fields'):
+            (prefetch if many else select).add(lookup)
+            _walk(nested, related_model, lookup, many, select, prefetch, depth + 1)
+        elif is_many_related or many:
+            prefetch.add(lookup)
+        elif len(field.source.split('.')) > 1 or isinstance(field, serializers.StringRelatedField):
+            # Attribut lu à travers une relation (ex: source='client.nom')
+            select.add(lookup)
+        elif isinstance(field, serializers.RelatedField) and not _uses_pk_only(field):
+            select.add(lookup)
+
+
+def _is_computed(field, model):
+    """Champ lu par une méthode ou une propriété plutôt que par une colonne ou une relation"""
+    if field.source == '*':
+        return True
+    name = field.source.split('.')[0]
+    return name not in _relations(model) and _concrete_field(model, name) is None
+
+
+def _uses_pk_only(field):
+    return getattr(field, 'use_pk_only_optimization', lambda: False)()
+
+
+def _columns(serializer, model, prefix, full):
+    """
+    Colonnes lues par le sérialiseur, au format de QuerySet.only().
+    Les relations dont toutes les colonnes sont nécessaires sont ajoutées à `full`.
+
+    Returns:
+        set: chemins, ou None si le sérialiseur lit des attributs calculés
+        (propriétés, SerializerMethodField) qu'on ne sait pas rattacher à des colonnes
+    """
+    columns = set()
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            return None
+
+        attrs = field.source.split('.')
+        path, related_model, many = _follow(model, attrs)
+        lookup = f"{prefix}__{path}" if prefix else path
+
+        if not path:
+            model_field = _concrete_field(model, attrs[0])
+            if model_field is None or len(attrs) > 1:
+                return None
+            columns.add(f"{prefix}__{attrs[0]}" if prefix else attrs[0])
+            continue
+
+        relation = _relations(model)[attrs[0]]
+        if many:
+            # Relations multiples chargées par prefetch_related : la clé primaire suffit
+            continue
+        if not relation.concrete:
+            # Relation inverse (OneToOne) : pas de restriction de colonnes possible
+            return None
+
+        if isinstance(field, serializers.BaseSerializer) and hasattr(field, 'fields') and len(attrs) == 1:
+            sub_columns = _columns(field, related_model, lookup, full)
+            if sub_columns is None:
+                full.add(lookup)
+            else:
+                columns |= sub_columns or {lookup}
+        elif len(attrs) > 1 or not _uses_pk_only(field):
+            full.add(lookup)
+        else:
+            columns.add(lookup)
+    return columns
+
+
+def _concrete_field(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except Exception:
+        return None
+    return field if field.concrete else None
+
+
+def _only(columns, full):
+    """Fusionne colonnes et relations complètes : une relation complète n'a pas de sous-colonnes"""
+    paths = set(full) | set(columns)
+    return tuple(sorted(
+        path for path in paths
+        if not any(path.startswith(f"{relation}__") for relation in full)
+    ))
+
+
+def _serializer_plan(serializer, model, sparse):
+    select, prefetch = set(), set()
+    _walk(serializer, model, '', False, select, prefetch, 0)
+    # Inutile de sélectionner un préfixe déjà couvert par un chemin plus long
+    select = {path for path in select if not any(other.startswith(f"{path}__") for other in select)}
+
+    only = ()
+    if sparse is not None:
+        full = set()
+        columns = _columns(serializer, model, '', full)
+        if columns is not None:
+            only = _only(columns, full)
+    return tuple(sorted(select)), tuple(sorted(prefetch)), only
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def plan_for(serializer_class, model, sparse=None):
+    """
+    Calcule les select_related / prefetch_related nécessaires pour sérialiser
+    `model` avec `serializer_class`, à partir des `source=` et des sérialiseurs
+    imbriqués. Les relations lues par des SerializerMethodField peuvent être
+    déclarées dans `Meta.select_related` / `Meta.prefetch_related`.
+
+    Avec `sparse` = (fields, expand) (voir sparse_fields), le plan porte sur la
+    forme demandée et inclut les colonnes à passer à QuerySet.only().
+    Le plan est calculé une fois par combinaison et mis en cache (les
+    PLAN_CACHE_SIZE dernières) : les paramètres d'une requête doivent d'abord
+    être ramenés aux champs déclarés (declared_sparse_params).
+
+    Returns:
+        tuple: (select_related, prefetch_related) ou, avec `sparse`,
+        (select_related, prefetch_related, only)
+    """
+    try:
+        serializer = serializer_class()
+    except Exception:
+        return ((), (), ()) if sparse is not None else ((), ())
+    if sparse is not None:
+        apply_sparse_fieldset(serializer, *sparse)
+        return _serializer_plan(serializer, model, sparse)
+    return _serializer_plan(serializer, model, None)[:2]
+
+
+def _selected_relations(select_related, prefix=''):
+    """Chemins déjà passés à select_related() sur un queryset"""
+    for name, children in select_related.items():
+        path = f"{prefix}__{name}" if prefix else name
+        yield path
+        yield from _selected_relations(children, path)
+
+
+def with_columns(queryset, fields):
+    """Ajoute des colonnes à un queryset restreint par only() (ex: champs du curseur de pagination)"""
+    names, deferred = queryset.query.deferred_loading
+    if deferred or not names:
+        return queryset
+    pk_name = queryset.model._meta.pk.name
+    extra = {pk_name if field.lstrip('-') == 'pk' else field.lstrip('-') for field in fields}
+    return queryset.only(*names, *extra)
+
+
+def optimize_queryset(queryset, serializer_class, request=None):
+    """
+    Applique le plan de chargement de `serializer_class` au queryset.
+    Si la requête demande des champs à la demande (?fields= / ?expand=),
+    seules les colonnes et jointures nécessaires sont chargées.
+    """
+    if serializer_class is None or queryset._fields is not None:
+        return queryset
+    # Sous-listes d'un autre modèle que celui du sérialiseur : pas de plan applicable
+    serializer_model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    if serializer_model is not None and serializer_model is not queryset.model:
+        return queryset
+
+    sparse = parse_sparse_params(request)
+    if sparse is None:
+        select, prefetch = plan_for(serializer_class, queryset.model)
+    else:
+        select, prefetch, only = plan_for(
+            serializer_class, queryset.model, declared_sparse_params(serializer_class, sparse)
+        )
+
+    if select:
+        queryset = queryset.select_related(*select)
+    # Le plan peut être appliqué deux fois (get_queryset puis filter_queryset)
+    prefetch = [lookup for lookup in prefetch if lookup not in queryset._prefetch_related_lookups]
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+
+    if sparse is not None and only and queryset.query.select_related is not True:
+        # Les jointures posées par la vue (hors plan) doivent rester chargées
+        planned = {'__'.join(path.split('__')[:i + 1]) for path in select for i in range(path.count('__') + 1)}
+        full = set(_selected_relations(queryset.query.select_related or {})) - planned
+        queryset = queryset.only(*_only([path for path in only if path not in full], full))
+    return queryset
+
+
+class QueryPlanMixin:
+    """
+    Charge automatiquement les relations lues par le sérialiseur de l'action
+    courante : un nombre constant de requêtes quelle que soit la taille de la page.
+    Gère aussi les champs à la demande (?fields= / ?expand=) sur les lectures.
+    """
+
+    # Actions qui sérialisent le queryset de la vue avec get_serializer(). Les
+    # autres @action (statistiques, sous-listes...) n'utilisent get_object() que
+    # pour retrouver l'objet : inutile d'y charger les relations du sérialiseur.
+    planned_actions = (None, 'list', 'retrieve')
+
+    def get_queryset(self):
+        return self._optimize(super().get_queryset())
+
+    def filter_queryset(self, queryset):
+        # Couvre aussi les vues qui redéfinissent get_queryset() sans appeler super()
+        return self._optimize(super().filter_queryset(queryset))
+
+    def _optimize(self, queryset):
+        if getattr(self, 'action', None) not in self.planned_actions:
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer_class(), self.request)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        sparse = parse_sparse_params(self.request)
+        if sparse is not None:
+            apply_sparse_fieldset(serializer, *sparse)
+        return serializer
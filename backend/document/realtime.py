@@ -0,0 +1,125 @@
+"""
+Diffusion des événements temps réel sur les WebSocket (document.consumers).
+
+Chaque connexion rejoint des groupes ciblés : celui de son utilisateur, de
+son département, et des entités auxquelles elle s'abonne ; le groupe global
+`notifications` ne reçoit plus que les annonces générales. Les événements
+sont publiés par lots : un envoi par groupe destinataire, quel que soit le
+nombre de documents concernés, et le consommateur regroupe de son côté les
+événements reçus pendant NOTIFICATIONS_COALESCE_INTERVAL en une seule trame.
+
+    publish({'type': 'relances', ...}, users=[user_id])
+"""
+import logging
+import re
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_GROUP = 'notifications'
+
+
+def user_group(user_id):
+    return f'user.{user_id}'
+
+
+def entity_group(entity_id):
+    return f'entity.{entity_id}'
+
+
+def department_group(departement):
+    # Noms de groupe : lettres, chiffres, tirets, points et soulignés uniquement
+    return 'departement.' + re.sub(r'[^0-9A-Za-z_.-]', '_', departement)[:80]
+
+
+def visible_entities(user):
+    """
+    Entités dont un utilisateur peut suivre les événements temps réel.
+
+    Même règle que l'API : les utilisateurs ne sont rattachés à aucune entité
+    (pas de relation User -> Entity) et tout utilisateur actif authentifié lit
+    les documents de toutes les entités ; un événement d'entité ne porte que
+    des références et statuts déjà lisibles par ses listes. Un rattachement
+    des utilisateurs aux entités se filtrerait ici.
+    """
+    from .models import Entity
+
+    if user is None or not user.is_authenticated or not user.is_active:
+        return Entity.objects.none()
+    return Entity.objects.all()
+
+
+def publish(message, users=(), entities=(), departments=(), groups=(), broadcast=False, key=None):
+    """
+    Envoie un événement aux groupes ciblés, un message par groupe.
+
+    Args:
+        message (dict): Événement transmis tel quel au navigateur
+        users, entities, departments: Destinataires (ids, ids, noms)
+        groups: Autres groupes, par leur nom (ex: flux des modifications)
+        broadcast (bool): Envoyer aussi au groupe global
+        key (str): Clé de regroupement : un événement plus récent de même clé
+            remplace le précédent encore en attente côté consommateur
+
+    Returns:
+        int: nombre de groupes destinataires
+    """
+    from channels.layers import get_channel_layer
+
+    groups = {
+        *groups,
+        *(user_group(pk) for pk in users if pk is not None),
+        *(entity_group(pk) for pk in entities if pk is not None),
+        *(department_group(name) for name in departments if name),
+    }
+    if broadcast:
+        groups.add(BROADCAST_GROUP)
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not groups:
+        return 0
+
+    event = {'type': 'notification_message', 'message': message, 'key': key}
+    sent = 0
+    for group in sorted(groups):
+        try:
+            async_to_sync(channel_layer.group_send)(group, event)
+            sent += 1
+        except Exception:
+            logger.exception("Diffusion de l'événement %s au groupe %s impossible", message.get('type'), group)
+    return sent
+
+
+def publish_status_change(sender, pks, statut, **kwargs):
+    """
+    Changement de statut groupé : un événement par entité, portant tous les
+    identifiants, envoyé après la validation de la transaction.
+    """
+    if not pks:
+        return
+    label = sender._meta.label
+    has_entity = any(field.name == 'entity' for field in sender._meta.concrete_fields)
+
+    def send():
+        by_entity = defaultdict(list)
+        if has_entity:
+            for pk, entity_id in sender.objects.filter(pk__in=pks).values_list('pk', 'entity_id'):
+                by_entity[entity_id].append(pk)
+        else:
+            by_entity[None] = list(pks)
+        for entity_id, ids in by_entity.items():
+            publish(
+                {'type': 'statuts', 'model': label, 'statut': statut, 'ids': ids},
+                entities=[entity_id], broadcast=entity_id is None,
+            )
+
+    transaction.on_commit(send)
+
+
+def connect_signals():
+    """Branche la diffusion des changements de statut groupés"""
+    from .bulk_status import bulk_status_changed
+
+    bulk_status_changed.connect(publish_status_change, dispatch_uid='document_realtime_bulk_status')
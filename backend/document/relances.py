@@ -0,0 +1,350 @@
+"""
+Planification des relances des offres, proformas et opportunités.
+
+Chaque objet en statut de relance (clé de son DELAIS_RELANCE) a une ligne
+RelanceQueue portant son échéance, tenue à jour par les signaux. Le
+planificateur (commande run_relances) garde les échéances dans un tas en
+mémoire et dort jusqu'à la plus proche ; il ne relit que les lignes
+modifiées depuis son dernier passage (index sur modifie_le), jamais les
+tables des documents.
+
+À échéance, process_due() traite les relances échues par lots : une
+notification par objet (bulk_create), puis la relance suivante selon les
+règles du modèle (set_relance), écrite par bulk_update, et la file mise à
+jour en un upsert. Un seul planificateur doit tourner à la fois.
+"""
+import heapq
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .changes import record_changes
+
+logger = logging.getLogger(__name__)
+
+# Modèle relancé -> champs du destinataire de la notification, par ordre de préférence
+RELANCE_MODELS = {
+    'offres_app.Offre': ('user', 'createur'),
+    'proformas_app.Proforma': ('created_by',),
+    'opportunites_app.Opportunite': ('responsable', 'created_by'),
+}
+
+# Marge de relecture des lignes modifiées : couvre les transactions validées après leur horodatage
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def echeance(instance):
+    """Échéance de la relance d'un objet, None s'il n'est pas en statut de relance"""
+    if instance.relance is None or instance.statut not in type(instance).DELAIS_RELANCE:
+        return None
+    return instance.relance
+
+
+def schedule(model, echeances):
+    """
+    Met à jour la file pour des objets d'un modèle, {pk: échéance ou None} :
+    un upsert pour les échéances, une suppression pour les relances annulées.
+    """
+    from .models import RelanceQueue
+
+    content_type = ContentType.objects.get_for_model(model)
+    planifiees = [
+        RelanceQueue(content_type=content_type, object_id=pk, echeance=date)
+        for pk, date in echeances.items() if date is not None
+    ]
+    if planifiees:
+        RelanceQueue.objects.bulk_create(
+            planifiees,
+            update_conflicts=True,
+            unique_fields=['content_type', 'object_id'],
+            update_fields=['echeance', 'modifie_le'],
+        )
+    annulees = [pk for pk, date in echeances.items() if date is None]
+    if annulees:
+        RelanceQueue.objects.filter(content_type=content_type, object_id__in=annulees).delete()
+
+
+def relances_dues(model, now=None):
+    """Identifiants des objets d'un modèle dont la relance est échue, lus dans la file"""
+    from .models import RelanceQueue
+
+    return RelanceQueue.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        echeance__lte=now or timezone.now(),
+    ).values('object_id')
+
+
+def rebuild_relance_queue(batch_size=500):
+    """
+    Reconstruit la file à partir des tables des documents (mise en service,
+    ou après des écritures qui ne passent pas par les signaux).
+
+    Returns:
+        dict: nombre de relances planifiées par modèle
+    """
+    from .models import RelanceQueue
+
+    counts = {}
+    with transaction.atomic():
+        RelanceQueue.objects.all().delete()
+        for label in RELANCE_MODELS:
+            model = apps.get_model(label)
+            content_type = ContentType.objects.get_for_model(model)
+            rows = model.objects.filter(
+                relance__isnull=False, statut__in=list(model.DELAIS_RELANCE)
+            ).values_list('pk', 'relance')
+            RelanceQueue.objects.bulk_create(
+                [RelanceQueue(content_type=content_type, object_id=pk, echeance=date) for pk, date in rows.iterator()],
+                batch_size=batch_size,
+            )
+            counts[label] = RelanceQueue.objects.filter(content_type=content_type).count()
+    return counts
+
+
+def _destinataire(instance, fields):
+    for field in fields:
+        user_id = getattr(instance, f'{field}_id', None)
+        if user_id is not None:
+            return user_id
+    return None
+
+
+def _avancer(model, object_ids, now):
+    """
+    Relances échues des objets d'un modèle : notifications à créer, relances
+    suivantes écrites en un UPDATE groupé, file mise à jour.
+    """
+    from .models import Notification
+
+    content_type = ContentType.objects.get_for_model(model)
+    fields = RELANCE_MODELS[model._meta.label]
+    objets = model.objects.in_bulk(object_ids)
+
+    notifications = []
+    avances = []
+    echeances = {pk: None for pk in object_ids if pk not in objets}
+    for pk, instance in objets.items():
+        due = echeance(instance)
+        if due is None or due > now:
+            # Relance annulée ou reportée depuis la mise en file
+            echeances[pk] = due
+            continue
+        notifications.append(Notification(
+            destinataire_id=_destinataire(instance, fields),
+            entity_id=instance.entity_id,
+            type='RELANCE',
+            content_type=content_type,
+            object_id=pk,
+            message=f"Relance à effectuer : {model._meta.verbose_name} {instance.reference or pk}"[:255],
+            echeance=due,
+        ))
+        instance.set_relance()
+        if instance.relance is None or instance.relance <= now:
+            # Relance très en retard : la suivante part de maintenant
+            instance.relance = now + timedelta(days=model.DELAIS_RELANCE[instance.statut])
+        avances.append(instance)
+        echeances[pk] = instance.relance
+
+    # bulk_update ne déclenche pas post_save : la file et le flux des modifications sont mis à jour ici
+    model.objects.bulk_update(avances, ['relance'], batch_size=500)
+    record_changes(model, avances, 'U', ['relance'])
+    schedule(model, echeances)
+    return notifications
+
+
+def push_notifications(notifications):
+    """
+    Diffuse un lot de notifications sur les WebSocket : un message par
+    destinataire (ou par entité sans destinataire), pas par notification
+    """
+    from .realtime import publish
+
+    par_groupe = defaultdict(list)
+    for notification in notifications:
+        cible = ('user', notification.destinataire_id) if notification.destinataire_id else ('entity', notification.entity_id)
+        par_groupe[cible].append({
+            'id': notification.pk,
+            'content_type': notification.content_type_id,
+            'object_id': notification.object_id,
+            'message': notification.message,
+        })
+    for (kind, pk), items in par_groupe.items():
+        message = {'type': 'relances', 'notifications': items}
+        if kind == 'user':
+            publish(message, users=[pk])
+        else:
+            publish(message, entities=[pk], broadcast=pk is None)
+
+
+def process_due(now=None, batch_size=None):
+    """
+    Traite les relances échues à `now`, par lots de `batch_size` lignes de la
+    file (une transaction par lot).
+
+    Returns:
+        int: nombre de notifications créées
+    """
+    from .models import Notification, RelanceQueue
+
+    now = now or timezone.now()
+    batch_size = batch_size or _setting('RELANCE_BATCH_SIZE', 500)
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(RelanceQueue.objects.filter(echeance__lte=now).order_by('echeance', 'pk').values_list(
+                'content_type_id', 'object_id'
+            )[:batch_size])
+            by_type = defaultdict(list)
+            for content_type_id, object_id in rows:
+                by_type[content_type_id].append(object_id)
+
+            notifications = []
+            for content_type_id, object_ids in by_type.items():
+                model = ContentType.objects.get_for_id(content_type_id).model_class()
+                if model is None or model._meta.label not in RELANCE_MODELS:
+                    RelanceQueue.objects.filter(content_type_id=content_type_id, object_id__in=object_ids).delete()
+                    continue
+                notifications.extend(_avancer(model, object_ids, now))
+            Notification.objects.bulk_create(notifications)
+            transaction.on_commit(lambda notifications=notifications: push_notifications(notifications))
+        total += len(notifications)
+        if len(rows) < batch_size:
+            return total
+
+
+class RelanceScheduler:
+    """
+    Tas (heapq) des échéances de la file. Chaque passage relit les seules
+    lignes modifiées depuis le précédent, traite les relances échues et
+    retourne le délai jusqu'à la prochaine échéance, plafonné à `max_sleep`
+    pour prendre en compte les relances créées entre-temps.
+    """
+
+    def __init__(self, max_sleep=None, batch_size=None):
+        self.max_sleep = max_sleep if max_sleep is not None else _setting('RELANCE_MAX_SLEEP', 30)
+        self.batch_size = batch_size
+        self.heap = []
+        # Ligne de la file -> échéance connue ; les entrées du tas qui ne correspondent plus sont ignorées
+        self.planned = {}
+        self.synced_at = None
+
+    def sync(self, now):
+        from .models import RelanceQueue
+
+        rows = RelanceQueue.objects.all()
+        if self.synced_at is not None:
+            rows = rows.filter(modifie_le__gte=self.synced_at - SYNC_OVERLAP)
+        for pk, date in rows.values_list('pk', 'echeance').iterator():
+            if self.planned.get(pk) != date:
+                self.planned[pk] = date
+                heapq.heappush(self.heap, (date, pk))
+        self.synced_at = now
+
+    def _drop_stale(self):
+        while self.heap and self.planned.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_due(self):
+        self._drop_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now):
+        """Retire du tas les échéances passées ; retourne leur nombre"""
+        count = 0
+        while self.next_due() is not None and self.heap[0][0] <= now:
+            date, pk = heapq.heappop(self.heap)
+            del self.planned[pk]
+            count += 1
+        return count
+
+    def run_once(self, now=None):
+        """
+        Un passage du planificateur.
+
+        Returns:
+            tuple: (notifications créées, secondes avant le prochain passage)
+        """
+        now = now or timezone.now()
+        self.sync(now)
+        created = 0
+        prochaine = self.next_due()
+        if prochaine is not None and prochaine <= now:
+            created = process_due(now, self.batch_size)
+            # Retirées du tas une fois traitées : après une erreur, elles restent dues au passage suivant
+            self.pop_due(now)
+        # Relances avancées : relues au prochain passage via modifie_le
+        prochaine = self.next_due()
+        delay = self.max_sleep if prochaine is None else (prochaine - timezone.now()).total_seconds()
+        return created, max(0, min(delay, self.max_sleep))
+
+    def run(self, stop):
+        """Boucle du planificateur jusqu'à `stop` (Event)"""
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                created, delay = self.run_once()
+                if created:
+                    logger.info("Relances : %d notifications créées", created)
+            except DatabaseError:
+                logger.exception("Relances : passage du planificateur impossible")
+                delay = self.max_sleep
+            stop.wait(delay)
+
+
+def update_relance(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'relance', 'statut'} & set(update_fields):
+        return
+    schedule(sender, {instance.pk: echeance(instance)})
+
+
+def remove_relance(sender, instance, **kwargs):
+    schedule(sender, {instance.pk: None})
+
+
+def schedule_created(sender, instances, **kwargs):
+    """Objets créés en masse (bulk_created) : un upsert des échéances"""
+    if sender._meta.label not in RELANCE_MODELS:
+        return
+    echeances = {instance.pk: echeance(instance) for instance in instances}
+    schedule(sender, {pk: date for pk, date in echeances.items() if date is not None})
+
+
+def update_relance_status(sender, pks, statut, **kwargs):
+    """Changement de statut groupé : échéances relues en une requête"""
+    if sender._meta.label not in RELANCE_MODELS:
+        return
+    if statut not in sender.DELAIS_RELANCE:
+        # Plus de relance : suppression sans relecture
+        schedule(sender, dict.fromkeys(pks))
+        return
+    rows = sender.objects.filter(pk__in=pks).values_list('pk', 'relance', 'statut')
+    schedule(sender, {
+        pk: relance if relance is not None and statut in sender.DELAIS_RELANCE else None
+        for pk, relance, statut in rows
+    })
+
+
+def connect_signals():
+    """Branche la tenue de la file sur les modèles relancés"""
+    from .bulk_status import bulk_status_changed
+    from .sequences import bulk_created
+
+    bulk_status_changed.connect(update_relance_status, dispatch_uid='document_relance_bulk_status')
+    bulk_created.connect(schedule_created, dispatch_uid='document_relance_bulk_created')
+    for label in RELANCE_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(update_relance, sender=model, dispatch_uid=f'document_relance_save_{label}')
+        post_delete.connect(remove_relance, sender=model, dispatch_uid=f'document_relance_delete_{label}')
@@ -0,0 +1,182 @@
+"""
+Rétention des journaux (actions, audit, statuts, historique des courriers).
+
+Les lignes plus anciennes que `AUDIT_RETENTION_DAYS` jours sont recopiées
+dans des archives mensuelles compressées, une par modèle et par mois :
+
+    AUDIT_ARCHIVE_DIR/<app.Modele>/<AAAA-MM>.jsonl.gz
+
+puis supprimées par tranches, pour garder les tables et leurs index petits.
+read_history() lit indifféremment la base (lignes récentes) et les archives.
+
+L'historique des statuts n'est pas archivé : les durées par statut
+(status_durations) et l'historique préchargé des listes (status_history) le
+lisent en base, et une transition archivée fausserait leurs périodes.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+
+# Modèle journalisé -> champ date servant à la rétention et au découpage par mois
+RETENTION_MODELS = {
+    'document.UserActionLog': 'timestamp',
+    'document.AuditLog': 'timestamp',
+    'document.StatusChange': 'date_changement',
+    'courrier.CourrierHistory': 'date_action',
+}
+
+# Journaux lus en base par les analyses : jamais archivés (voir en tête du module)
+UNARCHIVED_MODELS = ('document.StatusChange',)
+
+# Journaux traités par archive_rows() et la commande archive_audit_log
+ARCHIVED_MODELS = tuple(label for label in RETENTION_MODELS if label not in UNARCHIVED_MODELS)
+
+
+def archive_dir(label):
+    root = getattr(settings, 'AUDIT_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archives')
+    return Path(root) / label
+
+
+def retention_cutoff(days=None):
+    """Date avant laquelle les lignes sont archivées"""
+    if days is None:
+        days = getattr(settings, 'AUDIT_RETENTION_DAYS', 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def _month(value):
+    return timezone.localtime(value).strftime('%Y-%m')
+
+
+def _append(path, rows):
+    """Ajoute des lignes à une archive ; écrites sur disque avant la suppression en base"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('ab') as raw:
+        # Un membre gzip de plus par tranche : le fichier reste lisible d'un bloc
+        with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+            for row in rows:
+                archive.write((json.dumps(row, cls=DjangoJSONEncoder) + '\n').encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive_rows(label, before=None, batch_size=1000):
+    """
+    Archive puis supprime les lignes d'un modèle antérieures à `before`
+    (par défaut retention_cutoff()), une transaction par tranche.
+
+    Une interruption entre l'écriture d'une tranche et sa suppression laisse
+    des doublons dans l'archive, écartés à la lecture.
+
+    Returns:
+        int: nombre de lignes archivées
+    """
+    if label not in ARCHIVED_MODELS:
+        raise ValueError(f"Le journal {label} n'est pas archivé")
+    model = apps.get_model(label)
+    date_field = RETENTION_MODELS[label]
+    before = before or retention_cutoff()
+    old_rows = model.objects.filter(**{f'{date_field}__lt': before}).order_by('pk')
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(old_rows.values()[:batch_size])
+            if not rows:
+                return archived
+            by_month = {}
+            for row in rows:
+                by_month.setdefault(_month(row[date_field]), []).append(row)
+            for month, month_rows in by_month.items():
+                _append(archive_dir(label) / f'{month}.jsonl.gz', month_rows)
+            model.objects.filter(pk__in=[row[model._meta.pk.attname] for row in rows]).delete()
+        archived += len(rows)
+
+
+def archived_months(label):
+    """Mois archivés d'un modèle, du plus récent au plus ancien"""
+    directory = archive_dir(label)
+    if not directory.exists():
+        return []
+    return sorted((path.name[:7] for path in directory.glob('*.jsonl.gz')), reverse=True)
+
+
+def read_archive(label, month):
+    """Lignes archivées d'un mois, sous forme d'instances non sauvegardées"""
+    model = apps.get_model(label)
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    with gzip.open(archive_dir(label) / f'{month}.jsonl.gz', 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            row = json.loads(line)
+            yield model(**{
+                name: value if value is None else fields[name].to_python(value)
+                for name, value in row.items() if name in fields
+            })
+
+
+# Journaux exposés par l'API -> (modèle, filtres acceptés en paramètre -> colonne)
+JOURNALS = {
+    'actions': ('document.UserActionLog', {'object_id': 'object_id', 'content_type': 'content_type_id', 'user': 'user_id'}),
+    'audit': ('document.AuditLog', {'object_id': 'object_id', 'content_type': 'content_type_id', 'user': 'user_id'}),
+    'statuts': (
+        'document.StatusChange',
+        {'object_id': 'object_id', 'content_type': 'content_type_id', 'utilisateur': 'utilisateur_id'},
+    ),
+    'courriers': ('courrier.CourrierHistory', {'courrier': 'courrier_id', 'user': 'user_id'}),
+}
+
+
+def read_history(label, since=None, until=None, limit=None, champ=None, **filters):
+    """
+    Lignes d'un journal, de la plus récente à la plus ancienne, lues en base
+    puis dans les archives mensuelles si la base ne suffit pas à atteindre
+    `limit`. Les filtres sont des égalités sur des colonnes (attnames :
+    object_id=12, content_type_id=3, courrier_id=5...). Pour AuditLog,
+    `champ` ne retient que les modifications de ce champ.
+
+    Returns:
+        list: instances (celles issues des archives ne sont pas en base)
+    """
+    model = apps.get_model(label)
+    date_field = RETENTION_MODELS[label]
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    expected = {name: fields[name].to_python(value) for name, value in filters.items()}
+
+    queryset = model.objects.filter(**expected).order_by(f'-{date_field}', '-pk')
+    if since:
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    if until:
+        queryset = queryset.filter(**{f'{date_field}__lt': until})
+    if champ:
+        queryset = queryset.filter(changes__has_key=champ)
+    results = list(queryset[:limit] if limit else queryset)
+    seen = {obj.pk for obj in results}
+
+    for month in archived_months(label):
+        if limit and len(results) >= limit:
+            break
+        if (until and month > _month(until)) or (since and month < _month(since)):
+            continue
+        rows = []
+        for obj in read_archive(label, month):
+            date = getattr(obj, date_field)
+            if obj.pk in seen or (since and date < since) or (until and date >= until):
+                continue
+            if champ and champ not in (obj.changes or {}):
+                continue
+            if all(getattr(obj, name) == value for name, value in expected.items()):
+                seen.add(obj.pk)
+                rows.append(obj)
+        results.extend(rows)
+
+    results.sort(key=lambda obj: (getattr(obj, date_field), obj.pk), reverse=True)
+    return results[:limit] if limit else results
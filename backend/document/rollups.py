@@ -0,0 +1,242 @@
+from datetime import datetime, time, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, TruncDate
+from django.db.models.signals import post_delete, post_save
+from django.utils.dateparse import parse_date
+from django.utils.timezone import is_naive, localdate, make_aware
+
+
+# Modèle agrégé -> (type de document, chemins entité/produit/client, montant, montant payé)
+ROLLUP_MODELS = {
+    'offres_app.Offre': (
+        'OFF', ('entity', 'produit_principal', 'client'), 'montant', None
+    ),
+    'proformas_app.Proforma': (
+        'PRO', ('entity', 'offre__produit_principal', 'client'), 'montant_ttc', None
+    ),
+    'factures_app.Facture': (
+        'FAC', ('entity', 'affaire__offre__produit_principal', 'client'),
+        'montant_ttc', 'montant_paye'
+    ),
+}
+
+KEY_FIELDS = ['doc_type', 'day', 'entity', 'produit', 'client', 'statut']
+VALUE_FIELDS = ['count', 'montant', 'montant_paye']
+
+
+def _aggregate(label, queryset):
+    """Une ligne d'agrégat par (jour, entité, produit, client, statut), en une requête GROUP BY"""
+    from .models import DocumentDailyStat
+
+    doc_type, (entity, produit, client), montant, paye = ROLLUP_MODELS[label]
+    sums = {'rollup_count': Count('pk'), 'rollup_montant': Sum(montant)}
+    if paye:
+        sums['rollup_paye'] = Sum(paye)
+
+    rows = queryset.order_by().annotate(rollup_day=TruncDate('date_creation')).values(
+        'rollup_day', 'statut', entity, produit, client
+    ).annotate(**sums)
+
+    return [
+        DocumentDailyStat(
+            doc_type=doc_type,
+            day=row['rollup_day'],
+            entity_id=row[entity],
+            produit_id=row[produit],
+            client_id=row[client],
+            statut=row['statut'] or '',
+            count=row['rollup_count'],
+            montant=row['rollup_montant'] or 0,
+            montant_paye=row.get('rollup_paye') or 0,
+        )
+        for row in rows
+    ]
+
+
+def _key(stat):
+    return (stat.entity_id, stat.produit_id, stat.client_id, stat.statut)
+
+
+def _day(value):
+    return value.date() if is_naive(value) else localdate(value)
+
+
+def _day_range(day):
+    """Bornes [début, fin) d'une journée dans le fuseau courant"""
+    bounds = [datetime.combine(day + timedelta(days=offset), time.min) for offset in (0, 1)]
+    return [make_aware(bound) for bound in bounds] if settings.USE_TZ else bounds
+
+
+def refresh_rollup(label, day):
+    """
+    Recalcule les agrégats d'un type de document pour une journée. Le jour de
+    création ne change pas lors d'un changement de statut ou de montant : seule
+    cette tranche est à recalculer. Les documents du jour sont lus par un
+    intervalle sur date_creation (indexé), et non par date_creation__date qui
+    applique une fonction à chaque ligne.
+    """
+    from .models import DocumentDailyStat
+
+    doc_type = ROLLUP_MODELS[label][0]
+    model = apps.get_model(label)
+    start, end = _day_range(day)
+    with transaction.atomic():
+        rows = _aggregate(label, model.objects.filter(date_creation__gte=start, date_creation__lt=end))
+        current = {_key(row) for row in rows}
+        stale = [
+            pk for pk, *key in DocumentDailyStat.objects.filter(doc_type=doc_type, day=day).values_list(
+                'pk', 'entity_id', 'produit_id', 'client_id', 'statut'
+            )
+            # Clés avec NULL : jamais en conflit pour l'upsert, toujours recréées
+            if tuple(key) not in current or None in key
+        ]
+        if stale:
+            DocumentDailyStat.objects.filter(pk__in=stale).delete()
+        if rows:
+            DocumentDailyStat.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=KEY_FIELDS, update_fields=VALUE_FIELDS
+            )
+
+
+def rebuild_rollups(batch_size=500):
+    """
+    Reconstruit entièrement les agrégats, par exemple après des modifications
+    faites avec QuerySet.update(). Retourne le nombre de lignes par type.
+    """
+    from .models import DocumentDailyStat
+
+    counts = {}
+    with transaction.atomic():
+        DocumentDailyStat.objects.all().delete()
+        for label, (doc_type, *_) in ROLLUP_MODELS.items():
+            rows = _aggregate(label, apps.get_model(label).objects.all())
+            DocumentDailyStat.objects.bulk_create(rows, batch_size=batch_size)
+            counts[doc_type] = len(rows)
+    return counts
+
+
+def rollup_queryset(doc_type, params=None):
+    """
+    Agrégats d'un type de document, filtrés par les paramètres de requête
+    optionnels date_debut / date_fin (AAAA-MM-JJ), entity et client (ids).
+    """
+    from .models import DocumentDailyStat
+
+    queryset = DocumentDailyStat.objects.filter(doc_type=doc_type)
+    params = params or {}
+    date_debut = parse_date(params.get('date_debut') or '')
+    date_fin = parse_date(params.get('date_fin') or '')
+    if date_debut:
+        queryset = queryset.filter(day__gte=date_debut)
+    if date_fin:
+        queryset = queryset.filter(day__lte=date_fin)
+    for dimension in ('entity', 'client'):
+        if str(params.get(dimension) or '').isdigit():
+            queryset = queryset.filter(**{f"{dimension}_id": params[dimension]})
+    return queryset
+
+
+def period_start(period):
+    """Premier jour de la période en cours : 'month' (défaut), 'quarter' ou 'year'"""
+    today = localdate()
+    if period == 'year':
+        return today.replace(month=1, day=1)
+    if period == 'quarter':
+        return today.replace(month=((today.month - 1) // 3) * 3 + 1, day=1)
+    return today.replace(day=1)
+
+
+def requested_year(params):
+    """Année du paramètre `year` (année en cours par défaut), None si elle n'est pas un entier"""
+    value = str(params.get('year') or '').strip()
+    if not value:
+        return localdate().year
+    return int(value) if value.isdigit() else None
+
+
+def offre_statistics(params):
+    """
+    Statistiques des offres de la période (period=month|quarter|year, ou
+    date_debut / date_fin), lues dans les agrégats journaliers.
+    Filtres optionnels : entity, client.
+    """
+    stats = rollup_queryset('OFF', params)
+    if not params.get('date_debut'):
+        stats = stats.filter(day__gte=period_start(params.get('period', 'month')))
+
+    def par(field):
+        return list(stats.order_by(field).values(field).annotate(count=Sum('count'), montant_total=Sum('montant')))
+
+    statut_stats = par('statut')
+    counts = {row['statut']: row['count'] for row in statut_stats}
+    return {
+        'par_statut': statut_stats,
+        'par_produit': par('produit__name'),
+        'par_entity': par('entity__name'),
+        'montant_total': sum(row['montant_total'] or 0 for row in statut_stats),
+        'taux_conversion': {
+            'total': sum(counts.values()),
+            'gagnees': counts.get('GAGNE', 0),
+            'perdues': counts.get('PERDU', 0),
+        }
+    }
+
+
+def monthly_series(queryset, year, **sums):
+    """
+    Totaux mois par mois d'une année, en une requête.
+
+    Returns:
+        list: 12 dictionnaires (janvier à décembre) des agrégats `sums`, None si le mois est vide
+    """
+    rows = queryset.filter(day__year=year).order_by().annotate(mois=ExtractMonth('day')).values('mois').annotate(**sums)
+    by_month = {row['mois']: row for row in rows}
+    return [{name: by_month.get(month, {}).get(name) for name in sums} for month in range(1, 13)]
+
+
+def _changed(instance):
+    changed_fields = getattr(instance, 'changed_fields', None)
+    return changed_fields is None or bool(changed_fields())
+
+
+def update_rollup(sender, instance, raw=False, created=False, **kwargs):
+    # Chargement de fixtures : les relations ne sont pas garanties, voir rebuild_rollups()
+    if raw or instance.date_creation is None:
+        return
+    # Mise à jour sans changement d'un champ agrégé (suivi par FieldTrackerMixin) : tranche inchangée
+    if kwargs.get('signal') is post_save and not created and not _changed(instance):
+        return
+    refresh_rollup(instance._meta.label, _day(instance.date_creation))
+
+
+def update_rollup_created(sender, instances, **kwargs):
+    """Documents créés en masse (bulk_created) : recalcul une fois par journée"""
+    if sender._meta.label not in ROLLUP_MODELS:
+        return
+    for day in sorted({_day(instance.date_creation) for instance in instances if instance.date_creation}):
+        refresh_rollup(sender._meta.label, day)
+
+
+def update_rollup_status(sender, pks, **kwargs):
+    """Changement de statut groupé : recalcul des seules journées concernées"""
+    if sender._meta.label not in ROLLUP_MODELS:
+        return
+    for day in sender.objects.filter(pk__in=pks).order_by().dates('date_creation', 'day'):
+        refresh_rollup(sender._meta.label, day)
+
+
+def connect_signals():
+    """Branche la mise à jour des agrégats sur les modèles suivis"""
+    from .bulk_status import bulk_status_changed
+    from .sequences import bulk_created
+
+    bulk_status_changed.connect(update_rollup_status, dispatch_uid='document_rollup_bulk_status')
+    bulk_created.connect(update_rollup_created, dispatch_uid='document_rollup_bulk_created')
+    for label in ROLLUP_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(update_rollup, sender=model, dispatch_uid=f'document_rollup_save_{label}')
+        post_delete.connect(update_rollup, sender=model, dispatch_uid=f'document_rollup_delete_{label}')
@@ -0,0 +1,156 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils.timezone import now
+
+# Envoyé par bulk_create_documents() après l'INSERT groupé, qui ne déclenche
+# pas post_save : sender=modèle, instances=documents créés (clés primaires renseignées)
+bulk_created = Signal()
+
+
+def month_period(date=None):
+    """Période mensuelle de numérotation (ex: '2025-03')"""
+    date = date or now()
+    return f"{date.year}-{date.month:02d}"
+
+
+def year_period(date=None):
+    """Période annuelle de numérotation (ex: '2025')"""
+    date = date or now()
+    return str(date.year)
+
+
+def _pk(value):
+    if value is None:
+        return 0
+    return getattr(value, 'pk', value) or 0
+
+
+def _lookup(doc_type, entity=None, client=None, scope='', period=''):
+    return {
+        'doc_type': doc_type,
+        'entity_pk': _pk(entity),
+        'client_pk': _pk(client),
+        'scope': str(scope or ''),
+        'period': period or '',
+    }
+
+
+def reserve_sequence(doc_type, count=1, entity=None, client=None, scope='', period='', initial=None):
+    """
+    Réserve `count` numéros consécutifs pour une portée et retourne le premier.
+
+    L'incrément est un UPDATE atomique (value = value + count) : aucun scan de la
+    table métier, et deux écrivains concurrents ne peuvent pas obtenir le même numéro.
+
+    Args:
+        doc_type (str): Type de document (OFF, RAP, FAC...)
+        count (int): Nombre de numéros à réserver
+        entity, client: Instance ou pk définissant la portée (optionnels)
+        scope (str): Discriminant libre de la portée (catégorie, formation...)
+        period (str): Période de numérotation, voir month_period()/year_period()
+        initial (callable): Appelé une seule fois, à la création du compteur, pour
+            reprendre la dernière valeur déjà utilisée par les données existantes
+    """
+    from .models import SequenceCounter
+
+    if count < 1:
+        raise ValueError("Le nombre de numéros à réserver doit être positif")
+
+    lookup = _lookup(doc_type, entity, client, scope, period)
+    counters = SequenceCounter.objects.filter(**lookup)
+
+    with transaction.atomic():
+        # L'UPDATE en premier pose le verrou d'écriture avant toute lecture
+        if not counters.update(value=F('value') + count):
+            start = (initial() if initial else 0) or 0
+            try:
+                with transaction.atomic():
+                    SequenceCounter.objects.create(value=start + count, **lookup)
+            except IntegrityError:
+                # Compteur créé entre-temps par un autre écrivain
+                counters.update(value=F('value') + count)
+        last = counters.values_list('value', flat=True).get()
+
+    return last - count + 1
+
+
+def next_sequence(doc_type, **kwargs):
+    """Alloue le prochain numéro de séquence pour une portée"""
+    return reserve_sequence(doc_type, count=1, **kwargs)
+
+
+def _scope_key(scope):
+    return (_pk(scope.get('entity')), _pk(scope.get('client')), str(scope.get('scope') or ''), scope.get('period') or '')
+
+
+def allocate_sequences(doc_type, scopes, initial=None):
+    """
+    Alloue un numéro par document pour une liste de portées, en une transaction.
+
+    Les documents partageant la même portée reçoivent des numéros consécutifs
+    réservés en un seul UPDATE : le coût dépend du nombre de portées distinctes,
+    pas du nombre de documents.
+
+    Args:
+        doc_type (str): Type de document
+        scopes (list[dict]): Une portée par document (clés entity, client, scope, period)
+        initial (callable): Reçoit la portée (dict) et retourne la dernière valeur
+            déjà utilisée, appelé uniquement à la création d'un compteur
+
+    Returns:
+        list[int]: Les numéros alloués, dans l'ordre des portées
+    """
+    scopes = list(scopes)
+    keys = [_scope_key(scope) for scope in scopes]
+    counts = Counter(keys)
+
+    next_numbers = {}
+    with transaction.atomic():
+        for key, count in counts.items():
+            entity, client, scope, period = key
+            scope_kwargs = {'entity': entity, 'client': client, 'scope': scope, 'period': period}
+            next_numbers[key] = reserve_sequence(
+                doc_type,
+                count=count,
+                initial=(lambda kwargs=scope_kwargs: initial(kwargs)) if initial else None,
+                **scope_kwargs
+            )
+
+    numbers = []
+    for key in keys:
+        numbers.append(next_numbers[key])
+        next_numbers[key] += 1
+    return numbers
+
+
+def bulk_create_documents(model, instances, batch_size=500):
+    """
+    Crée des documents en masse. save() et post_save ne sont pas exécutés :
+    le signal bulk_created est envoyé à la place, et l'index, les agrégats,
+    la file des relances, les instantanés client et le flux des modifications
+    s'y mettent à jour pour tout le lot.
+    """
+    instances = list(instances)
+    if not instances:
+        return []
+    with transaction.atomic():
+        created = model.objects.bulk_create(instances, batch_size=batch_size)
+        bulk_created.send(sender=model, instances=created)
+        return created
+
+
+def bulk_create_with_references(model, instances, batch_size=500):
+    """
+    Crée des documents en masse avec des références complètes (voir
+    bulk_create_documents).
+
+    Le modèle doit exposer generer_references_en_masse(instances), qui attribue
+    numéros de séquence et références sans requête par ligne.
+    """
+    instances = list(instances)
+    with transaction.atomic():
+        model.generer_references_en_masse(instances)
+        return bulk_create_documents(model, instances, batch_size=batch_size)
@@ -7,7 +7,7 @@ from offres_app.models import Offre
 from proformas_app.models import Proforma
 from .models import (
     Entity, Client, Category, Product, 
- Rapport, Formation, Participant, AttestationFormation
+ Rapport, Formation, Participant, AttestationFormation, DocumentIndex
 )
 
 # Entity Serializers
@@ -298,3 +298,15 @@ from rest_framework import serializers
 from .models import Product, Client, Contact, Entity
 
 
+# DocumentIndex Serializer
+class DocumentIndexSerializer(serializers.ModelSerializer):
+    doc_type_display = serializers.CharField(source='get_doc_type_display', read_only=True)
+    client_nom = serializers.CharField(source='client.nom', read_only=True, default=None)
+    entity_code = serializers.CharField(source='entity.code', read_only=True, default=None)
+
+    class Meta:
+        model = DocumentIndex
+        fields = [
+            'id', 'doc_type', 'doc_type_display', 'object_id', 'reference',
+            'client', 'client_nom', 'entity', 'entity_code', 'statut', 'date_creation'
+        ]
@@ -0,0 +1,162 @@
+"""
+Champs à la demande (sparse fieldsets) pour tous les sérialiseurs de l'API.
+
+    ?fields=id,reference,client.nom    colonnes retournées (chemins pointés pour les objets imbriqués)
+    ?expand=client,offre.client        objets imbriqués à développer
+
+Dès que l'un des deux paramètres est présent, les objets imbriqués non
+développés sont remplacés par leur clé primaire. Sans paramètre, la réponse
+est inchangée. Le queryset correspondant est restreint (voir query_plan).
+"""
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+# Remplace dans ?fields= les noms inconnus du sérialiseur (voir declared_sparse_params)
+UNKNOWN_FIELD = '~'
+
+
+def _paths(value):
+    return tuple(sorted({path.strip() for path in value.split(',') if path.strip()}))
+
+
+def parse_sparse_params(request):
+    """
+    Lit ?fields= et ?expand= d'une requête de lecture.
+
+    Returns:
+        tuple: (fields, expand) sous forme de tuples de chemins, ou None si
+        aucun des deux paramètres n'est fourni
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    if FIELDS_PARAM not in params and EXPAND_PARAM not in params:
+        return None
+    fields = _paths(params[FIELDS_PARAM]) if FIELDS_PARAM in params else None
+    return fields, _paths(params.get(EXPAND_PARAM, ''))
+
+
+def _tree(paths):
+    """('client.nom', 'id') -> {'client': {'nom': {}}, 'id': {}}"""
+    tree = {}
+    for path in paths or ():
+        node = tree
+        for part in path.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _nested(field):
+    """Sérialiseur imbriqué porté par un champ (liste ou objet), sinon None"""
+    nested = field.child if isinstance(field, serializers.ListSerializer) else field
+    if not isinstance(nested, serializers.BaseSerializer):
+        return None
+    try:
+        nested.fields
+    except (AttributeError, ImproperlyConfigured):
+        # Sérialiseur imbriqué sans champs, ou mal configuré : laissé tel quel
+        return None
+    return nested
+
+
+def _collapsed(field, model):
+    """Remplace un objet imbriqué non développé par sa clé primaire"""
+    if model is None or field.source == '*' or '.' in field.source:
+        return None
+    try:
+        relation = model._meta.get_field(field.source)
+    except Exception:
+        return None
+    if not relation.is_relation:
+        return None
+    source = None if field.source == field.field_name else field.source
+    many = isinstance(field, serializers.ListSerializer)
+    return serializers.PrimaryKeyRelatedField(read_only=True, many=many, source=source)
+
+
+def _prune(serializer, fields, expand):
+    if fields:
+        for name in [name for name in serializer.fields if name not in fields]:
+            serializer.fields.pop(name)
+
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    for name, field in list(serializer.fields.items()):
+        nested = _nested(field)
+        if nested is None:
+            continue
+        sub_fields = (fields or {}).get(name) or {}
+        if name in expand or sub_fields:
+            _prune(nested, sub_fields, expand.get(name, {}))
+            continue
+        collapsed = _collapsed(field, model)
+        if collapsed is None:
+            _prune(nested, {}, {})
+        else:
+            serializer.fields[name] = collapsed
+
+
+def apply_sparse_fieldset(serializer, fields=None, expand=()):
+    """
+    Restreint un sérialiseur (ou un sérialiseur many=True) aux champs demandés
+    et replie les objets imbriqués non développés. Modifie `serializer` en place.
+    """
+    target = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+    _prune(target, _tree(fields), _tree(expand))
+    return serializer
+
+
+def _field_tree(serializer):
+    """Champs déclarés : {nom: sous-arbre pour un objet imbriqué, None sinon}"""
+    tree = {}
+    for name, field in serializer.fields.items():
+        nested = _nested(field)
+        tree[name] = _field_tree(nested) if nested is not None else None
+    return tree
+
+
+@lru_cache(maxsize=None)
+def _declared_fields(serializer_class):
+    try:
+        return _field_tree(serializer_class())
+    except Exception:
+        return {}
+
+
+def _declared_paths(paths, tree, keep_unknown):
+    declared = set()
+    for path in paths:
+        node, parts = tree, []
+        for part in path.split('.'):
+            if node is None:
+                # Au-delà d'un champ simple, le reste du chemin est ignoré
+                break
+            if part not in node:
+                if keep_unknown:
+                    parts.append(UNKNOWN_FIELD)
+                break
+            parts.append(part)
+            node = node[part]
+        if parts:
+            declared.add('.'.join(parts))
+    return tuple(sorted(declared))
+
+
+def declared_sparse_params(serializer_class, sparse):
+    """
+    Ramène (fields, expand) aux champs déclarés par `serializer_class`, sans
+    changer la forme produite par apply_sparse_fieldset : les chemins d'expand
+    inconnus sont ignorés, et dans fields un nom inconnu devient UNKNOWN_FIELD
+    (un niveau qui ne demande que des champs inconnus reste vide). Le nombre de
+    combinaisons est ainsi borné par le sérialiseur et non par la requête.
+    """
+    fields, expand = sparse
+    tree = _declared_fields(serializer_class)
+    if fields is not None:
+        fields = _declared_paths(fields, tree, keep_unknown=True)
+    return fields, _declared_paths(expand, tree, keep_unknown=False)
@@ -0,0 +1,140 @@
+"""
+Durées passées dans chaque statut, calculées à partir de l'historique StatusChange.
+
+Chaque transition clôt la période passée dans `ancien_statut` : sa durée est
+l'écart avec la transition précédente du même objet, LAG() sur
+(content_type, object_id) triés par date (index statuschange_object_idx).
+La base renvoie un extrait compact (statut, entité, produit, secondes), les
+percentiles sont calculés en une passe par groupe.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import DurationField, ExpressionWrapper, F, OuterRef, Q, Subquery, Window
+from django.db.models.functions import Coalesce, Lag
+from django.utils.dateparse import parse_date
+from django.utils.timezone import get_current_timezone
+
+from .models import StatusChange
+
+
+# Modèle suivi -> chemins entité/produit depuis l'objet
+DURATION_MODELS = {
+    'offres_app.Offre': ('entity', 'produit_principal'),
+    'affaires_app.Affaire': ('entity', 'offre__produit_principal'),
+}
+
+PERCENTILES = (50, 90, 95)
+
+
+def _percentile(values, p):
+    """Percentile avec interpolation linéaire (percentile_cont) d'une liste triée"""
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _summary(durations):
+    durations.sort()
+    summary = {
+        'count': len(durations),
+        'moyenne_heures': round(sum(durations) / len(durations) / 3600, 2),
+    }
+    for p in PERCENTILES:
+        summary[f'p{p}_heures'] = round(_percentile(durations, p) / 3600, 2)
+    return summary
+
+
+def _bound(value, end=False):
+    day = parse_date(value or '')
+    if day is None:
+        return None
+    return datetime.combine(day, time.max if end else time.min, tzinfo=get_current_timezone())
+
+
+def status_periods(label, params=None):
+    """
+    Périodes closes passées dans chaque statut par les objets d'un modèle.
+
+    Filtres optionnels : date_debut / date_fin (AAAA-MM-JJ, début de la
+    période), entity et produit (ids), statut.
+
+    Returns:
+        QuerySet: valeurs (statut, entity, produit, duree), dont l'entrée
+        initiale (statut vide) et, avec le filtre statut, les périodes
+        d'autres statuts restent à écarter
+    """
+    model = apps.get_model(label)
+    entity, produit = DURATION_MODELS[label]
+    params = params or {}
+
+    objets = model.objects.all()
+    if str(params.get('entity') or '').isdigit():
+        objets = objets.filter(**{entity: params['entity']})
+    if str(params.get('produit') or '').isdigit():
+        objets = objets.filter(**{produit: params['produit']})
+    objet = objets.filter(pk=OuterRef('object_id')).order_by()
+
+    # Les filtres par objet gardent des partitions complètes : la transition
+    # précédente reste visible par LAG()
+    changes = StatusChange.objects.filter(content_type=ContentType.objects.get_for_model(model))
+    if objets.query.has_filters():
+        changes = changes.filter(object_id__in=objets.values('pk'))
+    statut = params.get('statut')
+    if statut:
+        # La transition qui clôt une période dans `statut` suit celle qui y est entrée
+        changes = changes.filter(Q(ancien_statut=statut) | Q(nouveau_statut=statut))
+
+    changes = changes.annotate(
+        # Sans entrée initiale dans l'historique, la période démarre à la création
+        debut=Coalesce(
+            Window(
+                Lag('date_changement'),
+                partition_by=[F('object_id')],
+                order_by=[F('date_changement').asc(), F('pk').asc()],
+            ),
+            Subquery(objet.values('date_creation')[:1]),
+        ),
+    ).annotate(
+        duree=ExpressionWrapper(F('date_changement') - F('debut'), output_field=DurationField()),
+        entity=Subquery(objet.values(entity)[:1]),
+        produit=Subquery(objet.values(produit)[:1]),
+    )
+
+    # Filtres sur les colonnes fenêtrées : appliqués après le calcul de LAG()
+    changes = changes.filter(debut__isnull=False)
+    debut, fin = _bound(params.get('date_debut')), _bound(params.get('date_fin'), end=True)
+    if debut:
+        changes = changes.filter(debut__gte=debut)
+    if fin:
+        changes = changes.filter(debut__lte=fin)
+
+    return changes.order_by().values_list('ancien_statut', 'entity', 'produit', 'duree')
+
+
+def status_duration_stats(label, params=None):
+    """
+    Nombre, moyenne et percentiles des durées (en heures) par statut, puis
+    par statut et entité, et par statut et produit.
+    """
+    groups = {'par_statut': defaultdict(list), 'par_entity': defaultdict(list), 'par_produit': defaultdict(list)}
+    params = params or {}
+    for statut, entity, produit, duree in status_periods(label, params).iterator(chunk_size=5000):
+        if not statut or params.get('statut') not in (None, '', statut):
+            continue
+        seconds = duree.total_seconds()
+        groups['par_statut'][(statut,)].append(seconds)
+        groups['par_entity'][(statut, entity)].append(seconds)
+        groups['par_produit'][(statut, produit)].append(seconds)
+
+    keys = {'par_statut': ('statut',), 'par_entity': ('statut', 'entity'), 'par_produit': ('statut', 'produit')}
+    return {
+        name: [
+            {**dict(zip(keys[name], key)), **_summary(durations)}
+            for key, durations in sorted(groups[name].items(), key=lambda item: tuple(str(k) for k in item[0]))
+        ]
+        for name in groups
+    }
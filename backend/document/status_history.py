@@ -0,0 +1,115 @@
+"""
+Historique des statuts chargé par page plutôt qu'objet par objet.
+
+    ?historique=3    ajoute aux lignes d'une liste leurs 3 dernières transitions
+
+Les sérialiseurs de liste qui déclarent `Meta.history_serializer` et
+`Meta.list_serializer_class = HistoryListSerializer` chargent l'historique
+de toute la page en une requête (voir prefetch_history). Sans paramètre, la
+réponse est inchangée.
+"""
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import StatusChange
+
+HISTORY_PARAM = 'historique'
+MAX_HISTORY = 20
+
+# Attribut portant l'historique préchargé, du plus récent au plus ancien
+PREFETCHED_ATTR = '_prefetched_history'
+
+
+def prefetch_status_history(objects, limit=None):
+    """
+    Charge les StatusChange d'objets d'un même modèle en une requête et les
+    mémorise sur chaque objet (get_status_history() ne requête plus).
+
+    Avec `limit`, seules les `limit` dernières transitions de chaque objet
+    sont lues (ROW_NUMBER() par objet), quelle que soit la longueur des historiques.
+    """
+    objects = [obj for obj in objects if obj.pk is not None]
+    if not objects:
+        return
+    changes = StatusChange.objects.filter(
+        content_type=ContentType.objects.get_for_model(objects[0]),
+        object_id__in={obj.pk for obj in objects},
+    ).order_by('-date_changement', '-pk')
+    if limit is not None:
+        changes = changes.annotate(rang=Window(
+            RowNumber(),
+            partition_by=F('object_id'),
+            order_by=(F('date_changement').desc(), F('pk').desc()),
+        )).filter(rang__lte=limit)
+
+    by_object = defaultdict(list)
+    for change in changes:
+        by_object[change.object_id].append(change)
+    for obj in objects:
+        setattr(obj, PREFETCHED_ATTR, by_object[obj.pk])
+
+
+def prefetch_history(objects, limit=None):
+    """
+    Précharge l'historique d'une liste d'objets, une requête par modèle.
+    Chaque modèle fournit la méthode de classe `prefetch_history(objects, limit)`.
+    """
+    by_model = defaultdict(list)
+    for obj in objects:
+        by_model[type(obj)].append(obj)
+    for model, instances in by_model.items():
+        model.prefetch_history(instances, limit)
+
+
+def history_limit(request):
+    """Nombre de transitions demandées par ?historique=N (0 si absent ou invalide)"""
+    if request is None or request.method not in SAFE_METHODS:
+        return 0
+    params = getattr(request, 'query_params', request.GET)
+    try:
+        return max(0, min(int(params.get(HISTORY_PARAM, 0)), MAX_HISTORY))
+    except (TypeError, ValueError):
+        return 0
+
+
+class StatusChangeSerializer(serializers.ModelSerializer):
+    """Transition de statut embarquée dans les listes"""
+
+    class Meta:
+        model = StatusChange
+        fields = ['id', 'ancien_statut', 'nouveau_statut', 'date_changement', 'utilisateur', 'commentaire']
+
+
+class RecentHistoryField(serializers.Field):
+    """Dernières entrées d'historique préchargées par HistoryListSerializer"""
+
+    def __init__(self, serializer_class, **kwargs):
+        self.serializer_class = serializer_class
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return self.serializer_class(getattr(instance, PREFETCHED_ATTR, []), many=True, context=self.context).data
+
+
+class HistoryListSerializer(serializers.ListSerializer):
+    """
+    Avec ?historique=N, ajoute à chaque ligne `historique_recent` : ses N
+    dernières entrées d'historique, chargées pour toute la page en une requête.
+    """
+
+    def to_representation(self, data):
+        limit = history_limit(self.context.get('request'))
+        history_serializer = getattr(getattr(self.child, 'Meta', None), 'history_serializer', None)
+        if not limit or history_serializer is None:
+            return super().to_representation(data)
+
+        objects = list(data.all() if hasattr(data, 'all') else data)
+        prefetch_history(objects, limit)
+        self.child.fields['historique_recent'] = RecentHistoryField(history_serializer)
+        return super().to_representation(objects)
@@ -1,30 +1,27 @@
-from celery import shared_task
-from django.utils import timezone
-from notifications.models import Notification
+"""
+Tâches d'arrière-plan, exécutées par la commande run_workers (voir document.jobs).
+"""
+from .jobs import job
 
-@shared_task
-def check_relances():
+
+@job('affaires.initialiser_projet', timeout=600)
+def initialiser_projet(affaire_id):
     """
-    Vérifie les relances à effectuer aujourd'hui
+    Crée les rapports, formations et la facture initiale d'une affaire validée
     """
-    today = timezone.now().date()
-    notifications_due = Notification.objects.filter(
-        scheduled_date=today,
-        unread=True
-    )
-    
-    for notification in notifications_due:
-        # Envoi d'un email par exemple
-        send_relance_email(notification)
+    from affaires_app.models import Affaire
 
-def send_relance_email(notification):
-    """
-    Envoie un email de relance
+    affaire = Affaire.objects.select_related('offre__client', 'offre__entity', 'offre__produit_principal').get(pk=affaire_id)
+    affaire.initialiser_projet()
+    return {'rapports': affaire.rapports.count()}
+
+
+@job('offres.check_relances')
+def check_relances():
     """
-    subject = f"Relance à effectuer - {notification.target}"
-    message = f"""
-    Une relance est à effectuer aujourd'hui pour :
-    Client: {notification.action_object}
-    Offre: {notification.target}
+    Traite les relances échues des offres, proformas et opportunités
+    (voir document.relances ; la commande run_relances le fait en continu)
     """
-    # Logique d'envoi d'email
\ No newline at end of file
+    from .relances import process_due
+
+    return {'relances': process_due()}
@@ -1,3 +1,1176 @@
-from django.test import TestCase
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from django.conf import settings
+from django.core.management import call_command
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from affaires_app.models import Affaire
+from api.user.models import User
+from client.models import Client
+from offres_app.models import Offre, OffreProduit
+from .audit import AuditWriter, recover_journals, replay_fallback
+from .changes import events_since, purge_change_feed, push_changes
+from .fixtures import DocumentFixturesMixin
+from .benchmarks import DEFAULT_SCALE, compare_to_baseline, load_baseline, run_benchmark, seed_dataset
+from .indexing import rebuild_document_index
+from .jobs import claim, enqueue, job, work
+from .middleware import JWTAuthMiddleware
+from .realtime import entity_group, publish
+from .relances import RelanceScheduler, process_due, push_notifications, rebuild_relance_queue, relances_dues, schedule
+from .retention import archive_rows, archived_months, read_history
+from .routing import websocket_urlpatterns
+from .rollups import rebuild_rollups
+from .query_plan import plan_for
+from .sparse_fields import declared_sparse_params
+from .models import (
+    AttestationFormation, AuditLog, ChangeEvent, DocumentDailyStat, DocumentIndex, Entity, Formation, Job, Notification,
+    Participant, RelanceQueue, SequenceCounter, StatusChange, UserActionLog,
+)
+from .sequences import allocate_sequences, bulk_create_with_references, next_sequence, reserve_sequence
+from .status_durations import status_duration_stats
+from .status_history import prefetch_history
+
+
+class SequenceAllocatorTest(TestCase):
+
+    def test_next_sequence_is_consecutive_per_scope(self):
+        self.assertEqual(next_sequence('OFF', entity=1, client=2, period='2025-01'), 1)
+        self.assertEqual(next_sequence('OFF', entity=1, client=2, period='2025-01'), 2)
+        # Une autre période repart de 1
+        self.assertEqual(next_sequence('OFF', entity=1, client=2, period='2025-02'), 1)
+        self.assertEqual(next_sequence('OFF', client=2), 1)
+
+    def test_initial_is_only_used_on_counter_creation(self):
+        calls = []
+
+        def initial():
+            calls.append(1)
+            return 41
+
+        self.assertEqual(next_sequence('RAP', entity=1, initial=initial), 42)
+        self.assertEqual(next_sequence('RAP', entity=1, initial=initial), 43)
+        self.assertEqual(len(calls), 1)
+
+    def test_reserve_sequence_returns_first_of_block(self):
+        self.assertEqual(reserve_sequence('FAC', count=10, entity=3), 1)
+        self.assertEqual(next_sequence('FAC', entity=3), 11)
+        self.assertEqual(SequenceCounter.objects.get(doc_type='FAC').value, 11)
+
+    def test_allocate_sequences_hands_out_consecutive_numbers_per_scope(self):
+        next_sequence('OFF', client=1)
+        numbers = allocate_sequences('OFF', [{'client': 1}, {'client': 2}, {'client': 1}, {'client': 2}])
+        self.assertEqual(numbers, [2, 1, 3, 2])
+        self.assertEqual(next_sequence('OFF', client=1), 4)
+
+
+class BulkReferencesTest(DocumentFixturesMixin, TestCase):
+    """Références attribuées en masse : contiguës avec celles des sauvegardes unitaires, sans doublon"""
+
+    def setUp(self):
+        self.create_fixtures(
+            'masse', superuser=True, client_nom='Client masse', category=('FOR', 'Formation'), produit=('FOR1', 'Formation')
+        )
+
+    def _offre(self, **kwargs):
+        return self.create_offre(save=False, **kwargs)
+
+    def assertContiguous(self, numbers, start):
+        self.assertEqual(sorted(numbers), list(range(start, start + len(numbers))))
+
+    def test_offres(self):
+        premiere = self._offre()
+        premiere.save()
+        offres = bulk_create_with_references(Offre, [self._offre() for _ in range(5)])
+        derniere = self._offre()
+        derniere.save()
+
+        offres = [premiere, *offres, derniere]
+        self.assertContiguous([offre.sequence_number for offre in offres], 1)
+        # Rang de l'offre chez le client
+        self.assertContiguous([int(offre.reference.split('/')[5]) for offre in offres], 1)
+        self.assertEqual(len({offre.reference for offre in Offre.objects.all()}), 7)
+        self.assertEqual(DocumentIndex.objects.filter(doc_type='OFF').count(), 7)
+
+    def test_bulk_created_offres_reach_every_derived_table(self):
+        from client.kpi import get_client_kpis
+        from client.models import ClientKpiSnapshot
+
+        get_client_kpis(self.client_obj.pk)
+        self.assertTrue(ClientKpiSnapshot.objects.filter(client=self.client_obj).exists())
+        relance = timezone.now() + timedelta(days=3)
+        offres = bulk_create_with_references(Offre, [
+            self._offre(montant=100, statut='ENVOYE', relance=relance), self._offre(montant=50),
+        ])
+        pks = sorted(offre.pk for offre in offres)
+
+        self.assertEqual(
+            sorted(DocumentDailyStat.objects.filter(doc_type='OFF').values_list('statut', 'count', 'montant')),
+            [('BROUILLON', 1, 50), ('ENVOYE', 1, 100)]
+        )
+        self.assertEqual(list(RelanceQueue.objects.values_list('object_id', flat=True)), [offres[0].pk])
+        self.assertEqual(sorted(ChangeEvent.objects.filter(
+            content_type=ContentType.objects.get_for_model(Offre), action='C'
+        ).values_list('object_id', flat=True)), pks)
+        self.assertFalse(ClientKpiSnapshot.objects.filter(client=self.client_obj).exists())
+
+    def test_attestations(self):
+        offre = self._offre(createur=self.user, montant=100)
+        offre.save()
+        OffreProduit.objects.create(offre=offre, produit=self.produit)
+        offre.changer_statut('GAGNE', user=self.user)
+        affaire = Affaire.objects.get(offre=offre)
+        affaire.initialiser_projet()
+        formation = Formation.objects.get(affaire=affaire)
+        participants = [
+            Participant.objects.create(nom=f'Participant {i}', prenom='Test', formation=formation)
+            for i in range(5)
+        ]
+
+        def attestation(participant):
+            return AttestationFormation(
+                affaire=affaire, formation=formation, participant=participant, rapport=formation.rapport,
+                client=self.client_obj, entity=self.entity, details_formation='Formation',
+            )
+
+        attestations = bulk_create_with_references(AttestationFormation, [attestation(p) for p in participants[:4]])
+        derniere = attestation(participants[4])
+        derniere.save()
+
+        attestations = [*attestations, derniere]
+        self.assertContiguous([a.sequence_number for a in attestations], 1)
+        self.assertContiguous([int(a.reference.split('/')[5]) for a in attestations], 1)
+        self.assertEqual(len(set(AttestationFormation.objects.values_list('reference', flat=True))), 5)
+
+
+class DocumentAggregatorTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('agregat', client_nom='Client agrégat')
+        self.offres = [self.create_offre() for _ in range(3)]
+
+    def test_ndjson_stream(self):
+        response = self.api.get('/api/documents/?format=ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(lines[0]['type'], 'metadata')
+        self.assertEqual(lines[0]['documents_par_type']['offres'], 3)
+        self.assertEqual([line['type'] for line in lines[1:]], ['offres'] * 3)
+
+    def test_json_metadata(self):
+        response = self.api.get('/api/documents/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['metadata']['total_documents'], 3)
+
+    def test_filters_are_applied_in_sql(self):
+        Offre.objects.filter(pk=self.offres[0].pk).update(statut='ENVOYE')
+        Offre.objects.filter(pk=self.offres[1].pk).update(date_creation='2024-01-15T10:00:00Z')
+
+        metadata = self.api.get('/api/documents/?statut=envoye&entity=KES').json()['metadata']
+        self.assertEqual(metadata['documents_par_type']['offres'], 1)
+
+        metadata = self.api.get('/api/documents/?date_creation_before=2024-12-31').json()['metadata']
+        self.assertEqual(metadata['documents_par_type']['offres'], 1)
+
+        metadata = self.api.get('/api/documents/?date=15/01/2024').json()['metadata']
+        self.assertEqual(metadata['total_documents'], 1)
+
+
+class DocumentFeedTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('flux', client_nom='Client flux')
+
+    def test_index_follows_saves_and_deletes(self):
+        offre = self.create_offre()
+        entry = DocumentIndex.objects.get(doc_type='OFF', object_id=offre.pk)
+        self.assertEqual(entry.reference, offre.reference)
+        self.assertEqual(entry.client_id, self.client_obj.pk)
+
+        offre.statut = 'ENVOYE'
+        offre.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.statut, 'ENVOYE')
+
+        offre.delete()
+        self.assertFalse(DocumentIndex.objects.filter(doc_type='OFF', object_id=offre.pk).exists())
+
+    def test_feed_pages_with_cursor(self):
+        offres = [self.create_offre() for _ in range(5)]
+
+        response = self.api.get('/api/documents/feed/', {'page_size': 3, 'doc_type': 'OFF'})
+        first_page = response.json()
+        self.assertEqual(len(first_page['results']), 3)
+
+        second_page = self.api.get(first_page['next']).json()
+        self.assertIsNone(second_page['next'])
+        self.assertEqual(
+            [row['object_id'] for row in first_page['results'] + second_page['results']],
+            [offre.pk for offre in reversed(offres)]
+        )
+
+    def test_feed_is_paginated_without_params(self):
+        self.create_offre()
+        page = self.api.get('/api/documents/feed/').json()
+        self.assertEqual([row['doc_type'] for row in page['results']], ['OFF'])
+        self.assertIsNone(page['next'])
+
+    def test_rebuild(self):
+        self.create_offre()
+        DocumentIndex.objects.all().delete()
+        self.assertEqual(rebuild_document_index()['OFF'], 1)
+        self.assertEqual(DocumentIndex.objects.count(), 1)
+
+
+class KeysetPaginationTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('pagination', client_nom='Client pagination')
+        self.offres = [self.create_offre() for _ in range(5)]
+
+    def _collect(self, url):
+        ids = []
+        while url:
+            page = self.api.get(url).json()
+            ids += [row['id'] for row in page['results']]
+            url = page['next']
+        return ids
+
+    def test_list_is_paginated_on_view_ordering(self):
+        self.assertEqual(self._collect('/api/offres/?page_size=2'), [offre.pk for offre in self.offres])
+
+    def test_lists_stay_arrays_without_pagination_params(self):
+        response = self.api.get('/api/offres/')
+        self.assertEqual([row['id'] for row in response.json()], [offre.pk for offre in self.offres])
+        response = self.api.get(f'/api/clients/{self.client_obj.pk}/offres/')
+        self.assertEqual(len(response.json()), 5)
+
+    @override_settings(LIST_MAX_RESULTS=3)
+    def test_arrays_are_capped_with_a_next_link(self):
+        response = self.api.get('/api/offres/')
+        self.assertEqual([row['id'] for row in response.json()], [offre.pk for offre in self.offres[:3]])
+        self.assertEqual(response['X-Total-Count'], '5')
+        next_link = response['Link'][1:response['Link'].index('>')]
+        self.assertEqual(self._collect(next_link), [offre.pk for offre in self.offres[3:]])
+
+        response = self.api.get(f'/api/clients/{self.client_obj.pk}/offres/')
+        self.assertEqual(len(response.json()), 3)
+        self.assertIn('rel="next"', response['Link'])
+        with self.settings(LIST_MAX_RESULTS=5):
+            response = self.api.get('/api/offres/')
+            self.assertNotIn('Link', response)
+            self.assertNotIn('X-Total-Count', response)
+
+    def test_relation_ordering_is_kept_in_arrays_and_refused_with_cursor(self):
+        from client.models import Pays, Region
+        for nom, pays in [('Centre', 'Cameroun'), ('Abidjan', 'Côte d\'Ivoire'), ('Dakar', 'Sénégal'), ('Littoral', 'Bénin')]:
+            Region.objects.create(nom=nom, pays=Pays.objects.create(nom=pays, code_iso=pays[:3].upper()))
+
+        response = self.api.get('/api/regions/', {'ordering': 'pays__nom'})
+        self.assertEqual([row['nom'] for row in response.json()], ['Littoral', 'Centre', 'Abidjan', 'Dakar'])
+
+        with self.settings(LIST_MAX_RESULTS=2):
+            response = self.api.get('/api/regions/', {'ordering': '-pays__nom'})
+        self.assertEqual([row['nom'] for row in response.json()], ['Dakar', 'Abidjan'])
+        self.assertEqual(response['X-Total-Count'], '4')
+        self.assertNotIn('Link', response)
+
+        response = self.api.get('/api/regions/', {'ordering': 'pays__nom', 'page_size': 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+
+    def test_action_sub_list_is_paginated(self):
+        response = self.api.get(f'/api/clients/{self.client_obj.pk}/offres/', {'page_size': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(
+            sorted(self._collect(f'/api/clients/{self.client_obj.pk}/offres/?page_size=2')),
+            [offre.pk for offre in self.offres]
+        )
+
+
+class QueryPlanTest(DocumentFixturesMixin, TestCase):
+
+    def test_plan_follows_sources_and_nested_serializers(self):
+        from proformas_app.models import Proforma
+        from proformas_app.serializers import ProformaSerializer
+
+        self.assertEqual(plan_for(ProformaSerializer, Proforma), (('offre__client', 'offre__entity'), ()))
+
+        from offres_app.serializers import OffreSerializer
+        select, prefetch = plan_for(OffreSerializer, Offre)
+        self.assertIn('client__ville__region__pays', select)
+        self.assertIn('produit_principal__category', select)
+        self.assertIn('produits__category', prefetch)
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self.create_fixtures('plan')
+
+        counts = []
+        for _ in range(2):
+            for i in range(4):
+                offre = self.create_offre(client=Client.objects.create(nom=f'Client plan {i}'))
+                offre.produits.add(self.produit)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.api.get('/api/offres/').status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SparseFieldsTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('sparse', client_nom='Client sparse')
+        self.offre = self.create_offre()
+        self.offre.produits.add(self.produit)
+
+    def test_fields_select_columns_and_nested_paths(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/offres/', {'fields': 'id,reference,client.nom'})
+
+        self.assertEqual(response.json(), [
+            {'id': self.offre.pk, 'reference': self.offre.reference, 'client': {'nom': 'Client sparse'}}
+        ])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"montant"', queries[0]['sql'])
+        self.assertNotIn('"client_client"."email"', queries[0]['sql'])
+
+    def test_nested_objects_are_collapsed_unless_expanded(self):
+        row = self.api.get('/api/offres/', {'fields': 'id,client,entity', 'expand': 'client'}).json()[0]
+        self.assertEqual(row['client']['nom'], 'Client sparse')
+        self.assertEqual(row['entity'], self.offre.entity_id)
+
+        row = self.api.get(f'/api/offres/{self.offre.pk}/', {'expand': ''}).json()
+        self.assertEqual(row['produits'], [self.offre.produit_principal_id])
+        self.assertEqual(row['client'], self.client_obj.pk)
+
+    def test_plan_cache_is_keyed_on_declared_fields(self):
+        from offres_app.serializers import OffreSerializer
+
+        plan_for.cache_clear()
+        for i in range(20):
+            response = self.api.get('/api/offres/', {'fields': f'id,inconnu{i},client.nom,client.x{i}', 'expand': f'y{i}'})
+            self.assertEqual(response.json(), [{'id': self.offre.pk, 'client': {'nom': 'Client sparse'}}])
+        self.assertEqual(plan_for.cache_info().currsize, 1)
+        self.assertEqual(
+            declared_sparse_params(OffreSerializer, (('inconnu', 'reference.x'), ('client.ville', 'z'))),
+            (('reference', '~'), ('client',))
+        )
+
+        # Un niveau qui ne demande que des champs inconnus reste vide
+        self.assertEqual(self.api.get('/api/offres/', {'fields': 'inconnu'}).json(), [{}])
+
+    def test_action_sub_list_and_default_shape(self):
+        response = self.api.get(f'/api/clients/{self.client_obj.pk}/offres/', {'fields': 'id,statut'})
+        self.assertEqual(response.json(), [{'id': self.offre.pk, 'statut': self.offre.statut}])
+
+        # Sans paramètre, la réponse est inchangée
+        row = self.api.get('/api/offres/').json()[0]
+        self.assertEqual(row['client']['nom'], 'Client sparse')
+
+
+class DailyStatRollupTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('rollup', client_nom='Client rollup')
+
+    def _offre(self, montant):
+        return self.create_offre(montant=montant)
+
+    def _rows(self):
+        return sorted(
+            DocumentDailyStat.objects.filter(doc_type='OFF').values_list('statut', 'count', 'montant')
+        )
+
+    def test_rollup_follows_saves_and_deletes(self):
+        offres = [self._offre(100), self._offre(250)]
+        self.assertEqual(self._rows(), [('BROUILLON', 2, 350)])
+
+        offres[0].statut = 'GAGNE'
+        offres[0].save()
+        self.assertEqual(self._rows(), [('BROUILLON', 1, 250), ('GAGNE', 1, 100)])
+
+        offres[1].delete()
+        self.assertEqual(self._rows(), [('GAGNE', 1, 100)])
+
+    def test_refresh_reads_one_day_through_the_index(self):
+        veille = self._offre(100)
+        Offre.objects.filter(pk=veille.pk).update(date_creation=veille.date_creation - timedelta(days=1))
+        rebuild_rollups()
+        offre = self._offre(250)
+
+        offre.statut = 'GAGNE'
+        with CaptureQueriesContext(connection) as queries:
+            offre.save()
+        self.assertEqual(self._rows(), [('BROUILLON', 1, 100), ('GAGNE', 1, 250)])
+        refresh = [
+            query['sql'] for query in queries.captured_queries
+            if 'GROUP BY' in query['sql'] and 'FROM "offres_app_offre"' in query['sql']
+        ]
+        self.assertEqual(len(refresh), 1)
+        # Intervalle sur la colonne, sans fonction appliquée à chaque ligne
+        self.assertNotIn('django_datetime_cast_date', refresh[0].split('WHERE')[1])
+        plan = Offre.objects.filter(
+            date_creation__gte=offre.date_creation, date_creation__lt=offre.date_creation + timedelta(days=1)
+        ).explain()
+        self.assertIn('USING INDEX offres_app__date_cr', plan)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self._offre(100)
+        Offre.objects.update(statut='PERDU')
+        self.assertEqual(rebuild_rollups()['OFF'], 1)
+        self.assertEqual(self._rows(), [('PERDU', 1, 100)])
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class FieldTrackerTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('tracker', client_nom='Client tracker')
+        self.offre = self.create_offre(montant=100)
+
+    def test_changes_are_tracked_from_load_until_save(self):
+        offre = Offre.objects.get(pk=self.offre.pk)
+        self.assertEqual(offre.changed_fields(), set())
+
+        offre.statut = 'ENVOYE'
+        offre.montant = 200
+        self.assertEqual(offre.changed_fields(), {'statut', 'montant'})
+        self.assertEqual(offre.previous('statut'), 'BROUILLON')
+
+        offre.save()
+        self.assertEqual(offre.changed_fields(), set())
+        self.assertEqual(offre.previous('statut'), 'ENVOYE')
+
+        # Champ différé : non suivi
+        self.assertNotIn('statut', Offre.objects.only('pk').get(pk=offre.pk).changed_fields())
+
+    def test_save_does_not_reread_the_row(self):
+        offre = Offre.objects.get(pk=self.offre.pk)
+        offre.notes = 'Relue ?'
+        with CaptureQueriesContext(connection) as queries:
+            offre.save()
+        selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "offres_app_offre"' in query['sql']
+        ]
+        self.assertEqual(selects, [])
+        # Aucun champ agrégé modifié : la tranche journalière n'est pas recalculée
+        self.assertFalse(any('document_documentdailystat' in query['sql'] for query in queries.captured_queries))
+
+    def test_updates_are_audited_with_changed_fields_only(self):
+        offre = Offre.objects.get(pk=self.offre.pk)
+        offre.montant = 250
+        offre.notes = 'Remise accordée'
+        offre.save()
+        # Sauvegarde sans modification : pas d'entrée
+        offre.save()
+
+        log = AuditLog.objects.get(action='UPDATE', object_id=str(offre.pk))
+        self.assertEqual(log.changes, {'montant': ['100.00', '250.00'], 'notes': ['', 'Remise accordée']})
+        self.assertEqual(offre.saved_changes, {})
+        self.assertEqual(list(AuditLog.objects.filter(changes__has_key='montant')), [log])
+        self.assertEqual(
+            [entry.pk for entry in read_history('document.AuditLog', champ='montant')], [log.pk]
+        )
+        self.assertEqual(read_history('document.AuditLog', champ='statut'), [])
+
+
+class BulkStatusTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('bulk', superuser=True, client_nom='Client bulk')
+        self.offres = [self.create_offre(createur=self.user, montant=10) for _ in range(5)]
+
+    def test_bulk_set_status_uses_a_constant_number_of_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Offre.bulk_set_status(Offre.objects.all(), 'PERDU', user=self.user, commentaire='Lot'), 5)
+        # Lecture, UPDATE, historique, index, agrégats du jour, instantanés client, file des relances,
+        # flux des modifications
+        sql = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertLessEqual(len(sql), 12)
+
+        offre = Offre.objects.get(pk=self.offres[0].pk)
+        self.assertEqual(offre.statut, 'PERDU')
+        self.assertEqual(offre.modificateur, self.user)
+        self.assertEqual(set(offre.dates_statuts), {'BROUILLON', 'PERDU'})
+        self.assertEqual(
+            list(offre.get_status_history().values_list('ancien_statut', 'nouveau_statut', 'commentaire')[:1]),
+            [('BROUILLON', 'PERDU', 'Lot')]
+        )
+        self.assertEqual(DocumentIndex.objects.get(doc_type='OFF', object_id=offre.pk).statut, 'PERDU')
+        self.assertEqual(
+            list(DocumentDailyStat.objects.filter(doc_type='OFF').values_list('statut', 'count')), [('PERDU', 5)]
+        )
+
+        # Déjà au statut : ignorées
+        self.assertEqual(Offre.bulk_set_status(Offre.objects.all(), 'PERDU'), 0)
+
+    def test_bulk_set_status_validates_status(self):
+        with self.assertRaises(ValidationError):
+            Offre.bulk_set_status(Offre.objects.all(), 'INCONNU')
+
+
+class StatusHistoryPrefetchTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('histo', superuser=True, client_nom='Client histo')
+        self.offres = [self.create_offre(createur=self.user, montant=10) for _ in range(4)]
+        for offre in self.offres:
+            offre.changer_statut('ENVOYE', user=self.user)
+            offre.changer_statut('PERDU', user=self.user)
+
+    def test_prefetch_loads_last_transitions_in_one_query(self):
+        offres = list(Offre.objects.all())
+        with CaptureQueriesContext(connection) as queries:
+            prefetch_history(offres, limit=2)
+            historiques = [offre.get_status_history() for offre in offres]
+        self.assertEqual(len(queries), 1)
+        for historique in historiques:
+            self.assertEqual([change.nouveau_statut for change in historique], ['PERDU', 'ENVOYE'])
+
+    def test_list_embeds_history_on_demand(self):
+        self.assertNotIn('historique_recent', self.api.get('/api/offres/').json()[0])
+
+        with CaptureQueriesContext(connection) as without:
+            self.api.get('/api/offres/')
+        with CaptureQueriesContext(connection) as embedded:
+            rows = self.api.get('/api/offres/', {'historique': 1}).json()
+        self.assertEqual(len(embedded), len(without) + 1)
+        self.assertEqual([row['historique_recent'][0]['nouveau_statut'] for row in rows], ['PERDU'] * 4)
+
+
+class StatusDurationTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('durees', superuser=True, client_nom='Client durées')
+
+        debut = datetime(2025, 1, 6, 8, tzinfo=dt_timezone.utc)
+        # Heures passées en ENVOYE par chaque offre
+        for heures in (10, 20, 30, 40):
+            offre = self.create_offre(createur=self.user, montant=10)
+            offre.changer_statut('ENVOYE', user=self.user)
+            offre.changer_statut('PERDU', user=self.user)
+            changes = list(offre.get_status_history().order_by('pk'))
+            for change, date in zip(changes, (debut, debut + timedelta(hours=1), debut + timedelta(hours=1 + heures))):
+                StatusChange.objects.filter(pk=change.pk).update(date_changement=date)
+
+    def test_percentiles_per_status_entity_and_product(self):
+        stats = status_duration_stats('offres_app.Offre')
+        envoye = next(row for row in stats['par_statut'] if row['statut'] == 'ENVOYE')
+        self.assertEqual(envoye, {
+            'statut': 'ENVOYE', 'count': 4, 'moyenne_heures': 25.0,
+            'p50_heures': 25.0, 'p90_heures': 37.0, 'p95_heures': 38.5,
+        })
+        self.assertEqual(
+            [(row['statut'], row['entity'], row['count']) for row in stats['par_entity']],
+            [('BROUILLON', self.entity.pk, 4), ('ENVOYE', self.entity.pk, 4)]
+        )
+        self.assertEqual(stats['par_produit'][1]['produit'], self.produit.pk)
+
+    def test_endpoint_filters(self):
+        response = self.api.get('/api/offres/durees_statuts/', {'statut': 'ENVOYE', 'date_debut': '2025-01-06'})
+        self.assertEqual([row['p50_heures'] for row in response.json()['par_statut']], [25.0])
+
+        response = self.api.get('/api/offres/durees_statuts/', {'date_debut': '2025-01-07'})
+        self.assertEqual(response.json()['par_statut'], [])
+
+
+@override_settings(AUDIT_LOG_ASYNC=True)
+class AuditWriterTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('audit', 'audit@example.com', 'pass')
+        self.entity = Entity.objects.create(code='KES', name='KES')
+        self.writer = AuditWriter(background=False)
+        fallback_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(fallback_dir.cleanup)
+        self.fallback = Path(fallback_dir.name) / 'audit.jsonl'
+        journal_settings = override_settings(AUDIT_LOG_FALLBACK=self.fallback)
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+
+    def _entry(self, **kwargs):
+        kwargs.setdefault('action_type', 'UPDATE')
+        return UserActionLog(
+            user=self.user, content_type=ContentType.objects.get_for_model(Entity), object_id=self.entity.pk, **kwargs
+        )
+
+    def test_entries_are_written_in_one_batch_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                self.writer.write(self._entry())
+            self.assertEqual(self.writer.pending(), 0)
+        self.assertEqual(UserActionLog.objects.count(), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.writer.flush(), 3)
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(UserActionLog.objects.count(), 3)
+
+    def test_rolled_back_entries_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.write(self._entry())
+            try:
+                with transaction.atomic():
+                    self.writer.write(self._entry(description='Annulée'))
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(self.writer.pending(), 1)
+
+    def test_failed_batch_goes_to_fallback_file_then_replays(self):
+        with override_settings(AUDIT_LOG_FALLBACK=self.fallback):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.writer.write(self._entry(action_type=None, description='Sans type'))
+            with self.assertLogs('document.audit', 'ERROR'):
+                self.writer.flush()
+
+            self.assertEqual(UserActionLog.objects.count(), 0)
+            self.assertEqual(len(self.fallback.read_text().splitlines()), 1)
+
+            # Entrée corrigée dans le fichier, puis rejouée
+            self.fallback.write_text(self.fallback.read_text().replace('"action_type": null', '"action_type": "UPDATE"'))
+            self.assertEqual(replay_fallback(), (1, 0))
+            self.assertFalse(self.fallback.exists())
+        self.assertEqual(UserActionLog.objects.get().description, 'Sans type')
+
+    def test_pending_entries_survive_a_lost_writer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for description in ('Avant', 'Après'):
+                self.writer.write(self._entry(description=description))
+        self.assertEqual(len(list(self.fallback.parent.glob('audit.pending-*'))), 1)
+
+        # Processus tué avant le vidage : la file en mémoire est perdue, pas le journal disque
+        del self.writer
+        with mock.patch('document.audit._alive', return_value=False):
+            self.assertEqual(recover_journals(), 2)
+        self.assertEqual(sorted(UserActionLog.objects.values_list('description', flat=True)), ['Après', 'Avant'])
+        self.assertEqual(list(self.fallback.parent.iterdir()), [])
+
+    def test_flushed_entries_leave_no_journal(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.write(self._entry())
+        self.writer.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.writer.write(self._entry())
+        self.assertEqual(len(list(self.fallback.parent.iterdir())), 1)
+        self.writer.flush()
+        self.assertEqual(list(self.fallback.parent.iterdir()), [])
+        self.assertEqual(recover_journals(), 0)
+        self.assertEqual(UserActionLog.objects.count(), 2)
+
+
+class RetentionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('retention', 'retention@example.com', 'pass')
+        self.entity = Entity.objects.create(code='KES', name='KES')
+        archives = tempfile.TemporaryDirectory()
+        self.addCleanup(archives.cleanup)
+        settings_override = override_settings(AUDIT_ARCHIVE_DIR=Path(archives.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        content_type = ContentType.objects.get_for_model(Entity)
+        for month, day in ((1, 10), (1, 20), (2, 5), (6, 1)):
+            log = UserActionLog.objects.create(
+                user=self.user, action_type='UPDATE', content_type=content_type, object_id=self.entity.pk,
+                description=f'{month}/{day}', timestamp=datetime(2024, month, day, tzinfo=dt_timezone.utc)
+            )
+        self.recent = log
+
+    def test_old_rows_move_to_monthly_archives(self):
+        archived = archive_rows('document.UserActionLog', before=datetime(2024, 3, 1, tzinfo=dt_timezone.utc), batch_size=2)
+        self.assertEqual(archived, 3)
+        self.assertEqual(list(UserActionLog.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(archived_months('document.UserActionLog'), ['2024-02', '2024-01'])
+
+        history = read_history('document.UserActionLog', object_id=self.entity.pk)
+        self.assertEqual([entry.description for entry in history], ['6/1', '2/5', '1/20', '1/10'])
+        self.assertEqual(history[1].user_id, self.user.pk)
+
+        # Limite atteinte en base : les archives ne sont pas lues
+        self.assertEqual(len(read_history('document.UserActionLog', limit=1)), 1)
+        self.assertEqual(read_history('document.UserActionLog', object_id=self.entity.pk + 1), [])
+
+    def test_status_history_is_not_archived(self):
+        change = StatusChange.objects.create(
+            content_type=ContentType.objects.get_for_model(Entity), object_id=self.entity.pk,
+            ancien_statut='', nouveau_statut='BROUILLON',
+        )
+        StatusChange.objects.filter(pk=change.pk).update(date_changement=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+
+        call_command('archive_audit_log', days=0, stdout=StringIO())
+        self.assertTrue(StatusChange.objects.filter(pk=change.pk).exists())
+        self.assertFalse(UserActionLog.objects.exists())
+        with self.assertRaises(ValueError):
+            archive_rows('document.StatusChange')
+
+    def test_journal_endpoint_reads_archives(self):
+        archive_rows('document.UserActionLog', before=datetime(2024, 3, 1, tzinfo=dt_timezone.utc))
+        api = APIClient()
+        api.force_authenticate(self.user)
+
+        response = api.get('/api/journal/actions/', {'date_debut': '2024-01-15', 'date_fin': '2024-02-05'})
+        self.assertEqual([row['description'] for row in response.json()['results']], ['2/5', '1/20'])
+        self.assertEqual(api.get('/api/journal/inconnu/').status_code, 404)
+
+
+@job('tests.ajouter')
+def ajouter(a, b):
+    return a + b
+
+
+@job('tests.echec', max_attempts=2)
+def echec():
+    raise ValueError("Échec")
+
+
+@override_settings(JOBS_ASYNC=True, JOBS_RETRY_BACKOFF=60)
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('jobs', 'jobs@example.com', 'pass')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_jobs_are_claimed_by_priority_once(self):
+        basse = enqueue('tests.ajouter', 1, 2)
+        haute = enqueue('tests.ajouter', 3, 4, priority=5)
+        self.assertEqual(basse.statut, 'PENDING')
+
+        self.assertEqual(claim('w1').pk, haute.pk)
+        self.assertEqual(claim('w2').pk, basse.pk)
+        self.assertIsNone(claim('w3'))
+
+    def test_idempotency_key_returns_existing_job(self):
+        premier = enqueue('tests.ajouter', 1, 2, key='somme')
+        self.assertEqual(enqueue('tests.ajouter', 1, 2, key='somme').pk, premier.pk)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_worker_runs_jobs_and_retries_with_backoff(self):
+        ok = enqueue('tests.ajouter', 1, 2)
+        ko = enqueue('tests.echec')
+        with self.assertLogs('document.jobs', 'ERROR'):
+            self.assertEqual(work(threading.Event(), burst=True), 2)
+
+        ok.refresh_from_db()
+        self.assertEqual((ok.statut, ok.result, ok.attempts), ('DONE', 3, 1))
+        ko.refresh_from_db()
+        self.assertEqual((ko.statut, ko.attempts), ('PENDING', 1))
+        self.assertIn('ValueError', ko.last_error)
+        self.assertGreater(ko.run_at, timezone.now() + timedelta(seconds=50))
+
+        # Dernière tentative : échec définitif, puis remise en file par sa clé
+        Job.objects.filter(pk=ko.pk).update(run_at=timezone.now())
+        with self.assertLogs('document.jobs', 'ERROR'):
+            work(threading.Event(), burst=True)
+        ko.refresh_from_db()
+        self.assertEqual((ko.statut, ko.attempts), ('FAILED', 2))
+
+    @override_settings(JOBS_ASYNC=False)
+    def test_synchronous_mode_runs_job_on_enqueue(self):
+        done = enqueue('tests.ajouter', 1, 2)
+        self.assertEqual((done.statut, done.result), ('DONE', 3))
+        self.assertIsNone(claim('w1'))
+
+    def test_expired_lease_is_taken_over(self):
+        queued = enqueue('tests.ajouter', 2, 2, timeout=30)
+        claim('perdu')
+        self.assertIsNone(claim('w2'))
+
+        Job.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        repris = claim('w2')
+        self.assertEqual((repris.pk, repris.locked_by, repris.attempts), (queued.pk, 'w2', 2))
+
+
+@override_settings(JOBS_ASYNC=True)
+class WorkerCommandTest(TransactionTestCase):
+
+    def test_threaded_workers_run_each_job_once(self):
+        jobs = [enqueue('tests.ajouter', i, 1) for i in range(20)]
+        stderr = StringIO()
+        call_command('run_workers', burst=True, concurrency=3, stdout=StringIO(), stderr=stderr)
+
+        # SQLite : un seul worker, sans verrou en conflit sur la table des tâches
+        self.assertIn('SQLite', stderr.getvalue())
+        self.assertEqual(
+            list(Job.objects.order_by('pk').values_list('statut', 'attempts', 'result')),
+            [('DONE', 1, job.args[0] + 1) for job in jobs]
+        )
+
+
+class RelanceSchedulerTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('relances', superuser=True, client_nom='Client relances')
+        self.offres = [self.create_offre(createur=self.user, montant=10) for _ in range(3)]
+        self.content_type = ContentType.objects.get_for_model(Offre)
+
+    def envoyer(self, offre, echeance):
+        # save() recalcule toujours la relance : échéance forcée en base et dans la file
+        offre.changer_statut('ENVOYE', user=self.user)
+        Offre.objects.filter(pk=offre.pk).update(relance=echeance)
+        schedule(Offre, {offre.pk: echeance})
+
+    def test_queue_follows_saves_and_closing(self):
+        self.assertFalse(RelanceQueue.objects.exists())
+        offre = self.offres[0]
+        offre.changer_statut('ENVOYE', user=self.user)
+        offre.refresh_from_db()
+        self.assertEqual(
+            RelanceQueue.objects.get(content_type=self.content_type, object_id=offre.pk).echeance, offre.relance
+        )
+
+        offre.changer_statut('PERDU', user=self.user)
+        self.assertFalse(RelanceQueue.objects.exists())
+
+    def test_bulk_status_updates_queue(self):
+        hier = timezone.now() - timedelta(days=1)
+        for offre in self.offres:
+            self.envoyer(offre, hier)
+        self.assertEqual(set(relances_dues(Offre).values_list('object_id', flat=True)), {o.pk for o in self.offres})
+
+        Offre.bulk_set_status(Offre.objects.filter(pk__in=[o.pk for o in self.offres[:2]]), 'PERDU')
+        self.assertEqual(list(RelanceQueue.objects.values_list('object_id', flat=True)), [self.offres[2].pk])
+
+    def test_process_due_notifies_and_advances_in_batches(self):
+        now = timezone.now()
+        for offre in self.offres[:2]:
+            self.envoyer(offre, now - timedelta(hours=1))
+        self.envoyer(self.offres[2], now + timedelta(days=3))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(process_due(now, batch_size=1), 2)
+        # Par lot : file, objets, UPDATE groupé, upsert de la file, notifications
+        sql = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertLessEqual(len(sql), 20)
+
+        notifications = Notification.objects.order_by('object_id')
+        self.assertEqual([n.object_id for n in notifications], [o.pk for o in self.offres[:2]])
+        self.assertEqual({n.destinataire_id for n in notifications}, {self.user.pk})
+        for offre in self.offres[:2]:
+            offre.refresh_from_db()
+            self.assertGreater(offre.relance, now)
+            self.assertEqual(RelanceQueue.objects.get(object_id=offre.pk).echeance, offre.relance)
+
+        # Relances avancées : rien de plus à traiter
+        self.assertEqual(process_due(now), 0)
+
+    def test_scheduler_sleeps_until_next_due(self):
+        now = timezone.now()
+        self.envoyer(self.offres[0], now - timedelta(minutes=5))
+        self.envoyer(self.offres[1], now + timedelta(seconds=20))
+
+        scheduler = RelanceScheduler(max_sleep=60)
+        created, delay = scheduler.run_once(now)
+        self.assertEqual(created, 1)
+        self.assertTrue(0 < delay <= 20)
+
+        # Passage suivant : seules les lignes modifiées sont relues
+        with CaptureQueriesContext(connection) as queries:
+            created, delay = scheduler.run_once(now + timedelta(seconds=1))
+        self.assertEqual(created, 0)
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertIn('modifie_le', queries.captured_queries[0]['sql'])
+
+        created, _ = scheduler.run_once(now + timedelta(seconds=30))
+        self.assertEqual(created, 1)
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_scheduler_retries_after_database_error(self):
+        # Passages bien après la dernière modification de la file : aucune ligne relue par sync()
+        now = timezone.now() + timedelta(hours=1)
+        self.envoyer(self.offres[0], now - timedelta(minutes=5))
+        scheduler = RelanceScheduler(max_sleep=60)
+
+        with mock.patch('document.relances.process_due', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                scheduler.run_once(now)
+        created, _ = scheduler.run_once(now + timedelta(seconds=1))
+        self.assertEqual(created, 1)
+
+    def test_rebuild_and_due_filter(self):
+        hier = timezone.now() - timedelta(days=1)
+        for offre in self.offres[:2]:
+            self.envoyer(offre, hier)
+        RelanceQueue.objects.all().delete()
+
+        self.assertEqual(rebuild_relance_queue()['offres_app.Offre'], 2)
+        self.assertEqual(
+            set(Offre.objects.filter(pk__in=relances_dues(Offre)).values_list('pk', flat=True)),
+            {offre.pk for offre in self.offres[:2]}
+        )
+
+
+class WebsocketClient(ApplicationCommunicator):
+    """Client WebSocket de test (channels.testing dépend de daphne, non installé)"""
+
+    async def send_json_to(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json_from(self, timeout=1):
+        return json.loads((await self.receive_output(timeout))['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait(1)
+
+
+@override_settings(NOTIFICATIONS_COALESCE_INTERVAL=0.05, NOTIFICATIONS_MAX_PENDING=3)
+class NotificationConsumerTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        self.create_fixtures('ws', superuser=True, client_nom='Client ws')
+        self.other = User.objects.create_user('ws2', 'ws2@example.com', 'pass')
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def connect(self, token=None):
+        communicator = WebsocketClient(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)), {
+            'type': 'websocket',
+            'path': '/ws/notifications/',
+            'query_string': f'token={token}'.encode() if token else b'',
+            'headers': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(1))['type'], 'websocket.accept')
+        return communicator
+
+    async def test_events_reach_targeted_groups_only(self):
+        communicator = await self.connect(self.token)
+        await sync_to_async(publish)({'type': 'test', 'n': 1}, users=[self.other.pk])
+        await sync_to_async(publish)({'type': 'test', 'n': 2}, users=[self.user.pk])
+        await sync_to_async(publish)({'type': 'test', 'n': 3}, departments=['IT'])
+        frame = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(frame, {'messages': [{'type': 'test', 'n': 2}, {'type': 'test', 'n': 3}], 'dropped': 0})
+
+        # Entités : sur abonnement
+        await communicator.send_json_to({'action': 'subscribe', 'entities': [self.entity.pk, 999]})
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'subscribe', 'entities': [self.entity.pk]})
+        await sync_to_async(publish)({'type': 'test', 'n': 4}, entities=[self.entity.pk])
+        self.assertEqual(await communicator.receive_json_from(timeout=1), {'message': {'type': 'test', 'n': 4}})
+        await communicator.disconnect()
+
+    async def test_subscriptions_are_limited_to_visible_entities(self):
+        hidden = await sync_to_async(Entity.objects.create)(code='KIN', name='KIN')
+        communicator = await self.connect(self.token)
+        with mock.patch(
+            'document.consumers.visible_entities', side_effect=lambda user: Entity.objects.exclude(pk=hidden.pk)
+        ):
+            await communicator.send_json_to({'action': 'subscribe', 'entities': [self.entity.pk, hidden.pk]})
+            self.assertEqual(await communicator.receive_json_from(), {'action': 'subscribe', 'entities': [self.entity.pk]})
+        await sync_to_async(publish)({'type': 'test', 'n': 1}, entities=[hidden.pk])
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await communicator.disconnect()
+
+    async def test_bursts_are_coalesced_and_bounded(self):
+        communicator = await self.connect(self.token)
+        for n in range(5):
+            await sync_to_async(publish)({'type': 'test', 'n': n}, users=[self.user.pk])
+        frame = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(frame['dropped'], 2)
+        self.assertEqual([m['n'] for m in frame['messages']], [2, 3, 4])
+
+        # Même clé : seul le dernier état est envoyé
+        for n in range(3):
+            await sync_to_async(publish)({'type': 'test', 'n': n}, users=[self.user.pk], key='offre:1')
+        self.assertEqual(await communicator.receive_json_from(timeout=1), {'message': {'type': 'test', 'n': 2}})
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await communicator.disconnect()
+
+    async def test_relances_frame_shape(self):
+        # Trame lue par frontend/src/hooks/useOffresNotifications.ts
+        communicator = await self.connect(self.token)
+        notification = await sync_to_async(Notification.objects.create)(
+            content_type=await sync_to_async(ContentType.objects.get_for_model)(Offre), object_id=7,
+            message="Relance à effectuer : offre KES/OFF/1", destinataire=self.user, entity=self.entity,
+        )
+        await sync_to_async(push_notifications)([notification])
+        self.assertEqual(await communicator.receive_json_from(timeout=1), {'message': {
+            'type': 'relances',
+            'notifications': [{
+                'id': notification.pk, 'content_type': notification.content_type_id, 'object_id': 7,
+                'message': "Relance à effectuer : offre KES/OFF/1",
+            }],
+        }})
+        await communicator.disconnect()
+
+    async def test_client_messages_are_not_relayed(self):
+        anonymous = await self.connect()
+        communicator = await self.connect(self.token)
+        await anonymous.send_json_to({'message': 'à tous'})
+        self.assertIn('error', await anonymous.receive_json_from())
+        await anonymous.send_json_to({'action': 'subscribe', 'entities': [self.entity.pk]})
+        self.assertEqual(await anonymous.receive_json_from(), {'error': 'Authentification requise'})
+        await anonymous.send_json_to({'action': 'ping'})
+        self.assertEqual(await anonymous.receive_json_from(), {'action': 'pong'})
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await anonymous.disconnect()
+        await communicator.disconnect()
+
+    def test_bulk_status_sends_one_event_per_entity(self):
+        offres = [self.create_offre(createur=self.user, montant=10) for _ in range(5)]
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(entity_group(self.entity.pk), channel)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Offre.bulk_set_status(Offre.objects.all(), 'PERDU')
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event['message']['statut'], 'PERDU')
+        self.assertEqual(sorted(event['message']['ids']), [offre.pk for offre in offres])
+
+        async def nothing_left():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(channel), 0.1)
+        async_to_sync(nothing_left)()
+        async_to_sync(layer.group_discard)(entity_group(self.entity.pk), channel)
+
+
+@override_settings(NOTIFICATIONS_COALESCE_INTERVAL=0.05)
+class ChangeFeedTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        self.create_fixtures('feed', superuser=True, client_nom='Client flux')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def creer_offre(self):
+        return self.create_offre(createur=self.user, montant=10)
+
+    def events(self, model=Offre):
+        return list(ChangeEvent.objects.filter(
+            content_type=ContentType.objects.get_for_model(model)
+        ).values_list('object_id', 'action', 'fields'))
+
+    def test_saves_append_compact_events(self):
+        offre = self.creer_offre()
+        offre.montant = 20
+        offre.save()
+        # Sauvegarde sans modification : pas d'événement
+        offre.save()
+        Offre.bulk_set_status(Offre.objects.filter(pk=offre.pk), 'PERDU')
+        pk = offre.pk
+        offre.delete()
+
+        self.assertEqual(self.events(), [
+            (pk, 'C', None), (pk, 'U', ['montant']), (pk, 'U', ['statut']), (pk, 'D', None),
+        ])
+        seqs = list(ChangeEvent.objects.values_list('pk', flat=True))
+        self.assertEqual(seqs, sorted(seqs))
+
+    def test_resume_and_reset(self):
+        self.creer_offre()
+        since = ChangeEvent.objects.latest('pk').pk
+        second = self.creer_offre()
+        self.assertEqual([event.object_id for event in events_since(since)], [second.pk])
+        self.assertIsNone(events_since(since, limit=0))
+
+        # Événements purgés : reprise impossible, le dernier est conservé
+        ChangeEvent.objects.update(timestamp=timezone.now() - timedelta(days=30))
+        total = ChangeEvent.objects.count()
+        self.assertEqual(purge_change_feed(), total - 1)
+        self.assertEqual(ChangeEvent.objects.get().object_id, second.pk)
+        self.assertEqual([event.object_id for event in events_since(since)], [second.pk])
+        self.assertIsNone(events_since(since - 1))
+        self.assertEqual(events_since(ChangeEvent.objects.get().pk), [])
+
+    async def connect(self, query=''):
+        communicator = WebsocketClient(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)), {
+            'type': 'websocket', 'path': '/ws/changes/', 'query_string': query.encode(), 'headers': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator
+
+    async def test_consumer_replays_then_streams(self):
+        anonymous = await self.connect()
+        self.assertEqual(await anonymous.receive_output(1), {'type': 'websocket.close', 'code': 4401})
+
+        offre = await sync_to_async(self.creer_offre)()
+        since = (await ChangeEvent.objects.alatest('pk')).pk - 1
+        communicator = await self.connect(f'token={self.token}&since={since}')
+        self.assertEqual((await communicator.receive_output(1))['type'], 'websocket.accept')
+        replay = await communicator.receive_json_from()
+        self.assertEqual(replay['message']['type'], 'changes')
+        self.assertEqual(
+            [(e['model'], e['pk'], e['action']) for e in replay['message']['events']],
+            [('offres_app.Offre', offre.pk, 'C')]
+        )
+
+        # Événements en direct (diffusés après le commit) : ceux déjà rejoués sont ignorés
+        deja_rejoues = await sync_to_async(list)(ChangeEvent.objects.filter(pk__gt=since))
+        await sync_to_async(push_changes)(deja_rejoues)
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        offre.montant = 30
+        await sync_to_async(offre.save)()
+        await sync_to_async(push_changes)(await sync_to_async(list)(ChangeEvent.objects.filter(pk__gt=since + 1)))
+        live = await communicator.receive_json_from()
+        self.assertEqual([(e['pk'], e['fields']) for e in live['message']['events']], [(offre.pk, ['montant'])])
+
+        await communicator.send_json_to({'action': 'resume', 'since': 10 ** 9})
+        self.assertEqual(await communicator.receive_json_from(), {'message': {'type': 'reset'}})
+        await communicator.disconnect()
+
+    def test_asgi_application_imports_before_app_registry(self):
+        # Le serveur ASGI importe le routage avant que les applications soient chargées
+        result = subprocess.run(
+            [sys.executable, '-c', 'import KES_DocGen.asgi'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class EndpointBenchmarkTest(TestCase):
+    """
+    Régressions de performance par endpoint, mesurées contre benchmark_baseline.json.
+    Après une amélioration volontaire : python manage.py benchmark_endpoints --update-baseline
+    """
+
+    def test_no_endpoint_regresses(self):
+        baseline = load_baseline()
+        # Même taille que la référence : le nombre de requêtes d'une route N+1 en dépend
+        user = seed_dataset(scale=baseline['scale'] or DEFAULT_SCALE)
+        api = APIClient()
+        api.force_authenticate(user)
+
+        results = run_benchmark(api)
+
+        self.assertTrue(results)
+        self.assertEqual(compare_to_baseline(results, baseline['routes']), [])
+
+    def test_compare_flags_extra_queries_and_server_errors(self):
+        baseline = {'api/offres/': {'status': 200, 'queries': 3, 'sql_ms': 1.0, 'wall_ms': 10.0}}
+        results = {'api/offres/': {'status': 500, 'queries': 5, 'sql_ms': 1.0, 'wall_ms': 100.0}}
+
+        self.assertEqual(len(compare_to_baseline(results, baseline)), 2)
+        self.assertEqual(len(compare_to_baseline(results, baseline, time_factor=2)), 3)
+
+        # Erreur serveur déjà présente dans la référence, ou route nouvelle : signalée aussi
+        baseline['api/offres/']['status'] = 500
+        self.assertEqual(compare_to_baseline(results, baseline), [
+            "api/offres/: statut 500 -> 500", "api/offres/: 3 -> 5 requêtes"
+        ])
+        self.assertEqual(compare_to_baseline(results, {}), ["api/offres/: statut - -> 500"])
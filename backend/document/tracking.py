@@ -0,0 +1,150 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models.fields.files import FieldFile
+
+
+def _frozen(value):
+    """Valeur comparable et sérialisable d'un champ (nom du fichier pour un FileField)"""
+    return value.name if isinstance(value, FieldFile) else value
+
+
+def _json_value(field, value):
+    """Valeur d'un champ pour le journal : convertie par le champ (montant -> "250.00" quel que soit le type affecté)"""
+    try:
+        value = field.to_python(value)
+    except ValidationError:
+        pass
+    if isinstance(value, Decimal) and getattr(field, 'decimal_places', None) is not None:
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return DjangoJSONEncoder().default(value)
+
+
+class FieldTrackerMixin(models.Model):
+    """
+    Suivi des modifications de champs sans requête supplémentaire.
+
+    Les valeurs des champs listés dans `tracked_fields` sont mémorisées au
+    chargement (from_db) puis après chaque sauvegarde. `changed_fields()` et
+    `previous()` remplacent la relecture de l'objet en base (ou un signal
+    post_init) pour détecter un changement de statut. Les valeurs suivies
+    doivent être immuables (chaînes, nombres, dates, clés étrangères).
+
+    Les colonnes de `audited_fields` sont mémorisées de la même façon pour
+    `field_diff()`, qui alimente le journal d'audit des modifications
+    (voir document.audit). Par défaut toutes les colonnes, hors clé primaire,
+    dates automatiques (auto_now) et champs JSON, modifiés en place.
+    """
+    tracked_fields = ('statut',)
+    audited_fields = '__all__'
+    audit_exclude = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def _tracked_attnames(cls):
+        """Champ suivi -> attribut (client -> client_id), calculé une fois par classe"""
+        if '_tracked_attnames_cache' not in cls.__dict__:
+            cls._tracked_attnames_cache = {
+                name: cls._meta.get_field(name).attname for name in cls.tracked_fields
+            }
+        return cls._tracked_attnames_cache
+
+    @classmethod
+    def _audited_attnames(cls):
+        """Champ audité -> attribut, calculé une fois par classe"""
+        if '_audited_attnames_cache' not in cls.__dict__:
+            if cls.audited_fields == '__all__':
+                fields = [
+                    field for field in cls._meta.concrete_fields
+                    if not field.primary_key
+                    and not getattr(field, 'auto_now', False)
+                    and not isinstance(field, models.JSONField)
+                ]
+            else:
+                fields = [cls._meta.get_field(name) for name in cls.audited_fields]
+            cls._audited_attnames_cache = {
+                field.name: field.attname for field in fields if field.name not in cls.audit_exclude
+            }
+        return cls._audited_attnames_cache
+
+    @classmethod
+    def _snapshot_attnames(cls):
+        if '_snapshot_attnames_cache' not in cls.__dict__:
+            cls._snapshot_attnames_cache = {**cls._audited_attnames(), **cls._tracked_attnames()}
+        return cls._snapshot_attnames_cache
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        # Champs différés (QuerySet.only()) : non suivis jusqu'au prochain chargement
+        instance._loaded_values = {
+            name: loaded[attname] for name, attname in cls._snapshot_attnames().items() if attname in loaded
+        }
+        return instance
+
+    def _snapshot(self, names):
+        attnames = self._snapshot_attnames()
+        loaded = getattr(self, '_loaded_values', {})
+        loaded.update({name: _frozen(getattr(self, attnames[name])) for name in names})
+        self._loaded_values = loaded
+
+    def previous(self, field):
+        """Valeur du champ au chargement ou à la dernière sauvegarde, None pour un objet nouveau"""
+        return getattr(self, '_loaded_values', {}).get(field)
+
+    def changed_fields(self):
+        """
+        Champs suivis modifiés depuis le chargement ou la dernière sauvegarde.
+        Pour un objet ni chargé ni encore sauvegardé, tous les champs suivis.
+        """
+        attnames = self._tracked_attnames()
+        if not hasattr(self, '_loaded_values'):
+            return set(attnames)
+        loaded = self._loaded_values
+        return {
+            name for name, attname in attnames.items()
+            if name in loaded and loaded[name] != getattr(self, attname)
+        }
+
+    def field_diff(self):
+        """
+        Colonnes auditées modifiées depuis le chargement ou la dernière
+        sauvegarde : {champ: [ancienne valeur, nouvelle valeur]}, valeurs
+        sérialisables en JSON (clés étrangères sous forme d'identifiant).
+        Vide pour un objet nouveau.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        diff = {}
+        for name, attname in self._audited_attnames().items():
+            if name not in loaded:
+                continue
+            old, new = loaded[name], _frozen(getattr(self, attname))
+            if old != new:
+                field = self._meta.get_field(name)
+                diff[name] = [_json_value(field, old), _json_value(field, new)]
+        return diff
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        # Modifications écrites par cette sauvegarde (ex: pour le journal de la vue)
+        self.saved_changes = {
+            name: values for name, values in self.field_diff().items()
+            if update_fields is None or name in update_fields
+        }
+        # Après les signaux post_save, qui voient encore les anciennes valeurs
+        self._snapshot([name for name in self._snapshot_attnames() if update_fields is None or name in update_fields])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._snapshot([
+            name for name, attname in self._snapshot_attnames().items()
+            if attname not in self.get_deferred_fields()
+        ])
@@ -2,6 +2,7 @@ from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 
 from document import consumers
+from .DocumentAggregator import DocumentAggregatorView, DocumentFeedView
 from .views import (
     EntityViewSet,
     CategoryViewSet,
@@ -13,6 +14,8 @@ from .views import (
     FormationViewSet,
     ParticipantViewSet,
     AttestationFormationViewSet,
+    JournalView,
+    JobView,
 )
 
 # Création du router
@@ -37,7 +40,16 @@ app_name = 'api'
 urlpatterns = [
     # Inclusion des URLs générées par le router
     path('', include(router.urls)),
-    
+
+    # Vue agrégée de tous les documents (JSON ou NDJSON en streaming)
+    path('documents/', DocumentAggregatorView.as_view(), name='document-aggregator'),
+    path('documents/feed/', DocumentFeedView.as_view(), name='document-feed'),
+
+    # Journaux (base et archives de rétention)
+    path('journal/<str:journal>/', JournalView.as_view(), name='journal'),
+
+    # Suivi des tâches d'arrière-plan
+    path('jobs/<int:pk>/', JobView.as_view(), name='job'),
     
     # URLs d'authentification de DRF
     path('auth/', include('rest_framework.urls', namespace='rest_framework')),
@@ -1,9 +1,11 @@
 from django.contrib.contenttypes.models import ContentType
+from .audit import audit_writer
 from .models import UserActionLog
 
 def log_user_action(user, action_type, instance, field_name=None, old_value=None, new_value=None, description=None, request=None):
     """
-    Utilitaire pour enregistrer une action utilisateur
+    Utilitaire pour enregistrer une action utilisateur.
+    L'entrée est écrite par lot après la requête (voir document.audit).
     """
     content_type = ContentType.objects.get_for_model(instance)
     
@@ -23,5 +25,4 @@ def log_user_action(user, action_type, instance, field_name=None, old_value=None
     if request and hasattr(request, 'META'):
         log_entry.ip_address = request.META.get('REMOTE_ADDR')
     
-    log_entry.save()
-    return log_entry
\ No newline at end of file
+    return audit_writer.write(log_entry)
\ No newline at end of file
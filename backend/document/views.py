@@ -1,20 +1,25 @@
 from rest_framework import viewsets, status, filters
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Sum, Q
-from django.utils.timezone import now
-from datetime import timedelta
+from django.db.models import Sum, Q
+from django.utils.dateparse import parse_date
+from django.utils.timezone import get_current_timezone
+from datetime import datetime, time, timedelta
 
 from factures_app.models import Facture
 from offres_app.models import Offre
+from opportunites_app.models import Opportunite
+from opportunites_app.serializers import OpportuniteSerializer
 from proformas_app.models import Proforma
 
 from .models import (
     Entity, Category, Product, 
     Rapport, Formation, 
-    Participant, AttestationFormation
+    Participant, AttestationFormation, Job
 )
 
 from .serializers import (
@@ -32,8 +37,13 @@ from .serializers import (
 )
 
 from client.serializers import ClientListSerializer
+from .pagination import PaginatedActionMixin
+from .query_plan import QueryPlanMixin
+from .relances import relances_dues
+from .retention import JOURNALS, RETENTION_MODELS, read_history
+from .rollups import offre_statistics, period_start, rollup_queryset
 
-class EntityViewSet(viewsets.ModelViewSet):
+class EntityViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Entity.objects.all()
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['code', 'name']
@@ -46,7 +56,7 @@ class EntityViewSet(viewsets.ModelViewSet):
             return EntityEditSerializer
         return EntityDetailSerializer
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['entity']
@@ -65,10 +75,9 @@ class CategoryViewSet(viewsets.ModelViewSet):
         """Retourne les produits d'une catégorie."""
         category = self.get_object()
         products = Product.objects.filter(category=category)
-        serializer = ProductListSerializer(products, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(products, ProductListSerializer)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'category__entity']
@@ -86,9 +95,8 @@ class ProductViewSet(viewsets.ModelViewSet):
     def offres(self, request, pk=None):
         """Retourne les offres liées à ce produit."""
         product = self.get_object()
-        offres = Offre.objects.filter(Q(produit=product) | Q(produits=product)).distinct()
-        serializer = OffreListSerializer(offres, many=True)
-        return Response(serializer.data)
+        offres = Offre.objects.filter(Q(produit_principal=product) | Q(produits=product)).distinct()
+        return self.paginated_response(offres, OffreListSerializer)
 
     @action(detail=True, methods=['get'])
     def opportunites(self, request, pk=None):
@@ -97,11 +105,10 @@ class ProductViewSet(viewsets.ModelViewSet):
         opportunites = Opportunite.objects.filter(
             Q(produit_principal=product) | Q(produits=product)
         ).distinct()
-        serializer = OpportuniteListSerializer(opportunites, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(opportunites, OpportuniteSerializer)
 
 
-class OffreViewSet(viewsets.ModelViewSet):
+class OffreViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Offre.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'statut', 'entity', 'produit']
@@ -131,70 +138,19 @@ class OffreViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def a_relancer(self, request):
         """Retourne les offres qui nécessitent une relance."""
+        # Échéances lues dans la file des relances (index), plutôt qu'en parcourant les offres
         offres = Offre.objects.filter(
-            relance__lte=now(),
+            pk__in=relances_dues(Offre),
             statut__in=['ENVOYE', 'EN_NEGOCIATION']
         ).order_by('relance')
-        serializer = OffreListSerializer(offres, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(offres, OffreListSerializer)
 
     @action(detail=False, methods=['get'])
     def statistiques(self, request):
-        """Retourne des statistiques sur les offres."""
-        period = request.query_params.get('period', 'month')
-        
-        if period == 'year':
-            date_debut = now().replace(month=1, day=1)
-        elif period == 'quarter':
-            current_month = now().month
-            quarter_start_month = ((current_month - 1) // 3) * 3 + 1
-            date_debut = now().replace(month=quarter_start_month, day=1)
-        else:  # month
-            date_debut = now().replace(day=1)
-        
-        # Statistiques par statut
-        statut_stats = Offre.objects.filter(
-            date_creation__gte=date_debut
-        ).values('statut').annotate(
-            count=Count('id'),
-            montant_total=Sum('montant')
-        )
-        
-        # Statistiques par produit
-        produit_stats = Offre.objects.filter(
-            date_creation__gte=date_debut
-        ).values('produit__name').annotate(
-            count=Count('id'),
-            montant_total=Sum('montant')
-        )
-        
-        # Statistiques par entité
-        entity_stats = Offre.objects.filter(
-            date_creation__gte=date_debut
-        ).values('entity__name').annotate(
-            count=Count('id'),
-            montant_total=Sum('montant')
-        )
-        
-        return Response({
-            'par_statut': statut_stats,
-            'par_produit': produit_stats,
-            'par_entity': entity_stats,
-            'montant_total': Offre.objects.filter(
-                date_creation__gte=date_debut
-            ).aggregate(Sum('montant'))['montant__sum'] or 0,
-            'taux_conversion': {
-                'total': Offre.objects.filter(date_creation__gte=date_debut).count(),
-                'gagnees': Offre.objects.filter(
-                    date_creation__gte=date_debut, statut='GAGNE'
-                ).count(),
-                'perdues': Offre.objects.filter(
-                    date_creation__gte=date_debut, statut='PERDU'
-                ).count(),
-            }
-        })
+        """Retourne des statistiques sur les offres (voir offres_app.views.OffreViewSet.statistiques)."""
+        return Response(offre_statistics(request.query_params))
 
-class ProformaViewSet(viewsets.ModelViewSet):
+class ProformaViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Proforma.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'statut', 'entity', 'offre']
@@ -240,7 +196,7 @@ class ProformaViewSet(viewsets.ModelViewSet):
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class FactureViewSet(viewsets.ModelViewSet):
+class FactureViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Facture.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'statut', 'entity', 'affaire']
@@ -275,51 +231,24 @@ class FactureViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def statistiques(self, request):
-        """Retourne des statistiques sur les factures."""
-        period = request.query_params.get('period', 'month')
-        
-        if period == 'year':
-            date_debut = now().replace(month=1, day=1)
-        elif period == 'quarter':
-            current_month = now().month
-            quarter_start_month = ((current_month - 1) // 3) * 3 + 1
-            date_debut = now().replace(month=quarter_start_month, day=1)
-        else:  # month
-            date_debut = now().replace(day=1)
-        
-        # Statistiques par statut
-        statut_stats = Facture.objects.filter(
-            date_creation__gte=date_debut
-        ).values('statut').annotate(
-            count=Count('id')
-        )
-        
-        # Statistiques par client
-        client_stats = Facture.objects.filter(
-            date_creation__gte=date_debut
-        ).values('client__nom').annotate(
-            count=Count('id')
+        """Retourne des statistiques sur les factures (agrégats journaliers)."""
+        stats = rollup_queryset('FAC', request.query_params).filter(
+            day__gte=period_start(request.query_params.get('period', 'month'))
         )
-        
+        statut_stats = list(stats.order_by('statut').values('statut').annotate(count=Sum('count')))
+        counts = {row['statut']: row['count'] for row in statut_stats}
+
         return Response({
             'par_statut': statut_stats,
-            'par_client': client_stats,
-            'total': Facture.objects.filter(date_creation__gte=date_debut).count(),
-            'brouillon': Facture.objects.filter(
-                date_creation__gte=date_debut, statut='BROUILLON'
-            ).count(),
-            'envoyees': Facture.objects.filter(
-                date_creation__gte=date_debut, statut='ENVOYE'
-            ).count(),
-            'validees': Facture.objects.filter(
-                date_creation__gte=date_debut, statut='VALIDE'
-            ).count(),
-            'refusees': Facture.objects.filter(
-                date_creation__gte=date_debut, statut='REFUSE'
-            ).count(),
+            'par_client': stats.order_by('client__nom').values('client__nom').annotate(count=Sum('count')),
+            'total': sum(counts.values()),
+            'brouillon': counts.get('BROUILLON', 0),
+            'envoyees': counts.get('ENVOYE', 0),
+            'validees': counts.get('VALIDE', 0),
+            'refusees': counts.get('REFUSE', 0),
         })
 
-class RapportViewSet(viewsets.ModelViewSet):
+class RapportViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Rapport.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'statut', 'entity', 'affaire', 'produit']
@@ -357,10 +286,9 @@ class RapportViewSet(viewsets.ModelViewSet):
         """Retourne les attestations liées à un rapport."""
         rapport = self.get_object()
         attestations = AttestationFormation.objects.filter(rapport=rapport)
-        serializer = AttestationFormationListSerializer(attestations, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(attestations, AttestationFormationListSerializer)
 
-class FormationViewSet(viewsets.ModelViewSet):
+class FormationViewSet(QueryPlanMixin, PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Formation.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'affaire', 'rapport']
@@ -379,18 +307,16 @@ class FormationViewSet(viewsets.ModelViewSet):
         """Retourne les participants d'une formation."""
         formation = self.get_object()
         participants = Participant.objects.filter(formation=formation)
-        serializer = ParticipantListSerializer(participants, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(participants, ParticipantListSerializer)
 
     @action(detail=True, methods=['get'])
     def attestations(self, request, pk=None):
         """Retourne les attestations de formation."""
         formation = self.get_object()
         attestations = AttestationFormation.objects.filter(formation=formation)
-        serializer = AttestationFormationListSerializer(attestations, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(attestations, AttestationFormationListSerializer)
 
-class ParticipantViewSet(viewsets.ModelViewSet):
+class ParticipantViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Participant.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['formation']
@@ -418,7 +344,7 @@ class ParticipantViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-class AttestationFormationViewSet(viewsets.ModelViewSet):
+class AttestationFormationViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = AttestationFormation.objects.all()
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['client', 'statut', 'entity', 'affaire', 'formation', 'participant', 'rapport']
@@ -430,4 +356,67 @@ class AttestationFormationViewSet(viewsets.ModelViewSet):
             return AttestationFormationListSerializer
         elif self.action in ['create', 'update', 'partial_update']:
             return AttestationFormationEditSerializer
-        return AttestationFormationDetailSerializer
\ No newline at end of file
+        return AttestationFormationDetailSerializer
+
+
+class JournalView(APIView):
+    """
+    Lecture d'un journal (actions, audit, statuts, courriers), base et
+    archives confondues, de l'entrée la plus récente à la plus ancienne.
+    Filtres : date_debut, date_fin (AAAA-MM-JJ), identifiants propres au
+    journal (object_id, content_type, user...), limit (100 par défaut) et,
+    pour le journal d'audit, champ (ex: champ=montant).
+    """
+    permission_classes = [IsAdminUser]
+    max_limit = 1000
+
+    def get(self, request, journal):
+        if journal not in JOURNALS:
+            return Response({'detail': "Journal inconnu."}, status=status.HTTP_404_NOT_FOUND)
+        label, accepted = JOURNALS[journal]
+
+        filters = {
+            column: request.query_params[param]
+            for param, column in accepted.items() if str(request.query_params.get(param) or '').isdigit()
+        }
+        date_debut = parse_date(request.query_params.get('date_debut') or '')
+        date_fin = parse_date(request.query_params.get('date_fin') or '')
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), self.max_limit)
+        except ValueError:
+            limit = 100
+
+        entries = read_history(
+            label,
+            since=date_debut and datetime.combine(date_debut, time.min, tzinfo=get_current_timezone()),
+            until=date_fin and datetime.combine(date_fin + timedelta(days=1), time.min, tzinfo=get_current_timezone()),
+            limit=max(limit, 1),
+            champ=request.query_params.get('champ') if journal == 'audit' else None,
+            **filters
+        )
+        date_field = RETENTION_MODELS[label]
+        return Response({
+            'results': [
+                {field.attname: getattr(entry, field.attname) for field in entry._meta.concrete_fields}
+                for entry in entries
+            ],
+            'plus_ancien': getattr(entries[-1], date_field) if entries else None,
+        })
+
+
+class JobView(APIView):
+    """
+    État d'une tâche d'arrière-plan (voir document.jobs), pour suivre une
+    opération mise en file par une requête. Visible par son auteur et les
+    administrateurs.
+    """
+    permission_classes = [IsAuthenticated]
+    fields = ['id', 'name', 'statut', 'priority', 'attempts', 'max_attempts', 'run_at', 'result', 'created_at', 'finished_at']
+
+    def get(self, request, pk):
+        jobs = Job.objects.all() if request.user.is_staff else Job.objects.filter(created_by=request.user)
+        job = get_object_or_404(jobs.values(*self.fields, 'last_error'), pk=pk)
+        last_error = job.pop('last_error')
+        if request.user.is_staff:
+            job['last_error'] = last_error
+        return Response(job)
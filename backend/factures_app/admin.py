@@ -9,7 +9,7 @@ class FactureAdmin(admin.ModelAdmin):
     list_display = ('reference', 'affaire_link', 'client_display', 'montant_ttc_display', 
                     'statut_display', 'date_creation', 'date_echeance', 'est_en_retard_display')
     list_filter = ('statut', 'date_creation', 'date_emission', 'date_echeance', 'date_paiement')
-    search_fields = ('reference', 'affaire__reference', 'affaire__offre__client__nom', 'notes')
+    search_fields = ('reference', 'affaire__reference', 'client__nom', 'notes')
     readonly_fields = ('reference', 'montant_tva', 'montant_ttc', 'created_at', 'updated_at', 'sequence_number',
                        'created_by', 'updated_by')
     fieldsets = (
@@ -57,7 +57,7 @@ class FactureAdmin(admin.ModelAdmin):
         url = reverse('admin:clients_app_client_change', args=[client.id])
         return format_html('<a href="{}">{}</a>', url, client.nom)
     client_display.short_description = 'Client'
-    client_display.admin_order_field = 'affaire__offre__client__nom'
+    client_display.admin_order_field = 'client__nom'
     
     def montant_ttc_display(self, obj):
         return f"{obj.montant_ttc:,.2f} XAF"
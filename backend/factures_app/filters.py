@@ -4,8 +4,8 @@ from .models import Facture
 class FactureFilter(filters.FilterSet):
     # Field names need to be different from the actual lookups
     # to avoid django-filter confusing them with model fields
-    client_id = filters.NumberFilter(field_name='affaire__offre__client__id', lookup_expr='exact')
-    entity_id = filters.NumberFilter(field_name='affaire__offre__entity__id', lookup_expr='exact')
+    client_id = filters.NumberFilter(field_name='client', lookup_expr='exact')
+    entity_id = filters.NumberFilter(field_name='entity', lookup_expr='exact')
     
     
     # Date filters
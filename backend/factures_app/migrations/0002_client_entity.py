@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def backfill(apps, schema_editor):
+    # Client et entité recopiés de l'offre, par tranches de clés primaires
+    Facture = apps.get_model('factures_app', 'Facture')
+    offres = apps.get_model('offres_app', 'Offre').objects.filter(affaire__facture=OuterRef('pk'))
+    last_pk = Facture.objects.aggregate(last=Max('pk'))['last'] or 0
+    for start in range(0, last_pk, 1000):
+        Facture.objects.filter(pk__gt=start, pk__lte=start + 1000).update(
+            client=Subquery(offres.values('client_id')[:1]),
+            entity=Subquery(offres.values('entity_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('affaires_app', '0004_client_entity'),
+        ('client', '0012_clientkpisnapshot'),
+        ('document', '0030_documentdailystat'),
+        ('factures_app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='client',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='client.client', verbose_name='Client'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='entity',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='document.entity', verbose_name='Entité'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['client', 'date_creation'], name='factures_ap_client__5472c2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['entity', 'date_creation'], name='factures_ap_entity__4f0943_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('affaires_app', '0004_client_entity'),
+        ('client', '0012_clientkpisnapshot'),
+        ('document', '0035_change_event'),
+        ('factures_app', '0002_client_entity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['date_creation'], name='factures_ap_date_cr_3aa2a3_idx'),
+        ),
+    ]
@@ -4,7 +4,10 @@ from django.db.models import Max
 from decimal import Decimal
 from django.conf import settings
 
-class Facture(models.Model):
+from document.sequences import allocate_sequences, month_period, next_sequence
+from document.tracking import FieldTrackerMixin
+
+class Facture(FieldTrackerMixin, models.Model):
     STATUS_CHOICES = (
         ('BROUILLON', 'Brouillon'),
         ('EMISE', 'Émise'),
@@ -16,6 +19,9 @@ class Facture(models.Model):
     
     reference = models.CharField(max_length=150, unique=True, blank=True, null=True, verbose_name="Référence")
     affaire = models.OneToOneField('affaires_app.Affaire', on_delete=models.CASCADE, related_name="facture", verbose_name="Affaire")
+    # Copies du client et de l'entité de l'offre, pour filtrer sans jointure
+    client = models.ForeignKey('client.Client', on_delete=models.CASCADE, blank=True, null=True, editable=False, related_name="+", verbose_name="Client")
+    entity = models.ForeignKey('document.Entity', on_delete=models.CASCADE, blank=True, null=True, editable=False, related_name="+", verbose_name="Entité")
     
     # Informations de base
     sequence_number = models.PositiveIntegerField(blank=True, null=True, verbose_name="Numéro de séquence")
@@ -44,38 +50,61 @@ class Facture(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création dans le système")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de dernière modification")
     
+    # Statut et champs agrégés dans les statistiques journalières (voir document.rollups)
+    tracked_fields = ('statut', 'montant_ttc', 'montant_paye', 'date_creation')
+
     class Meta:
         verbose_name = "Facture"
         verbose_name_plural = "Factures"
         ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['client', 'date_creation']),
+            models.Index(fields=['entity', 'date_creation']),
+            models.Index(fields=['date_creation']),
+        ]
     
     def __str__(self):
         return self.reference or f"Facture #{self.pk}"
     
     def save(self, *args, **kwargs):
+        if not self.pk or self.client_id is None:
+            offre = self.affaire.offre
+            self.client_id = offre.client_id
+            self.entity_id = offre.entity_id
+
         # Génération automatique de la référence
         if not self.reference:
             if not self.sequence_number:
-                # Obtenir le dernier numéro de séquence pour l'entité dans le mois courant
-                last_sequence = Facture.objects.filter(
-                    affaire__offre__entity=self.affaire.offre.entity,  # Utiliser une recherche à travers les relations
-                    date_creation__year=now().year,
-                    date_creation__month=now().month
-                ).aggregate(Max('sequence_number'))['sequence_number__max']
-                
-                self.sequence_number = (last_sequence or 0) + 1
+                # Numéro de séquence pour l'entité dans le mois courant
+                self.sequence_number = next_sequence(
+                    'FAC',
+                    entity=self.entity_id,
+                    period=month_period(),
+                    initial=lambda: Facture.objects.filter(
+                        entity=self.entity_id,
+                        date_creation__year=now().year,
+                        date_creation__month=now().month
+                    ).aggregate(Max('sequence_number'))['sequence_number__max']
+                )
             
-            # Compter le nombre total de factures pour ce client
-            total_factures_client = Facture.objects.filter(
-                affaire__offre__client=self.affaire.offre.client  # Utiliser une recherche à travers les relations
-            ).count() + 1
+            # Rang de la facture pour ce client
+            total_factures_client = next_sequence(
+                'FAC',
+                client=self.client_id,
+                initial=lambda: Facture.objects.filter(client=self.client_id).count()
+            )
             
-            # Définir la date (utiliser la date de création ou maintenant)
-            date = self.date_creation or now()
-            
-            # Générer la référence avec le format spécifié
-            self.reference = f"{self.affaire.offre.entity.code}/FAC/{self.affaire.offre.client.c_num}/{self.affaire.reference}/{self.affaire.offre.produit_principale.code}/{total_factures_client}/{self.sequence_number:04d}"
+            self.reference = self._formater_reference(total_factures_client)
         
+        self.completer_champs()
+        super().save(*args, **kwargs)
+    
+    def _formater_reference(self, total_factures_client):
+        offre = self.affaire.offre
+        return f"{offre.entity.code}/FAC/{offre.client.c_num}/{self.affaire.reference}/{offre.produit_principal.code}/{total_factures_client}/{self.sequence_number:04d}"
+    
+    def completer_champs(self):
+        """Dates, montants TVA/TTC et statut déduits du statut et des montants saisis"""
         # Mettre à jour les dates en fonction du statut
         if self.statut == 'EMISE' and not self.date_emission:
             self.date_emission = now()
@@ -95,8 +124,41 @@ class Facture(models.Model):
             self.statut = 'PAYEE'
             if not self.date_paiement:
                 self.date_paiement = now()
-            
-        super().save(*args, **kwargs)
+    
+    @classmethod
+    def generer_references_en_masse(cls, factures):
+        """
+        Attribue numéros de séquence et références à des factures non
+        sauvegardées, en vue d'un bulk_create (voir
+        document.sequences.bulk_create_with_references). Les affaires doivent
+        être chargées avec offre__entity, offre__client et offre__produit_principal.
+        """
+        factures = [facture for facture in factures if not facture.reference]
+        if not factures:
+            return factures
+
+        period = month_period()
+        sans_sequence = [facture for facture in factures if not facture.sequence_number]
+        sequences = allocate_sequences(
+            'FAC',
+            [{'entity': f.entity_id, 'period': period} for f in sans_sequence],
+            initial=lambda scope: Facture.objects.filter(
+                entity=scope['entity'],
+                date_creation__year=now().year,
+                date_creation__month=now().month
+            ).aggregate(Max('sequence_number'))['sequence_number__max']
+        )
+        for facture, sequence in zip(sans_sequence, sequences):
+            facture.sequence_number = sequence
+
+        totaux = allocate_sequences(
+            'FAC',
+            [{'client': f.client_id} for f in factures],
+            initial=lambda scope: Facture.objects.filter(client=scope['client']).count()
+        )
+        for facture, total in zip(factures, totaux):
+            facture.reference = facture._formater_reference(total)
+        return factures
     
     def calculate_amounts(self):
         """Recalcule les montants TVA et TTC à partir du montant HT"""
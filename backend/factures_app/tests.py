@@ -1,3 +1,15 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from api.user.models import User
+
+
+class FactureStatsTest(TestCase):
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('factures', 'factures@example.com', 'pass'))
+
+    def test_invalid_year_is_rejected(self):
+        self.assertEqual(self.api.get('/api/factures/stats/', {'year': 'abc'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/factures/stats/', {'year': '2025'}).status_code, 200)
@@ -4,13 +4,15 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils.timezone import now
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Q
 
+from document.query_plan import QueryPlanMixin
+from document.rollups import monthly_series, requested_year, rollup_queryset
 from factures_app.filters import FactureFilter
 from .models import Facture
 from .serializers import FactureSerializer, FactureDetailSerializer, FactureCreateSerializer
 
-class FactureViewSet(viewsets.ModelViewSet):
+class FactureViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     API endpoint pour gérer les factures.
     """
@@ -30,7 +32,7 @@ class FactureViewSet(viewsets.ModelViewSet):
         'affaire__offre__entity': ['exact'],
         'montant_ttc': ['gte', 'lte'],
     }
-    search_fields = ['reference', 'affaire__reference', 'affaire__offre__client__nom', 'notes']
+    search_fields = ['reference', 'affaire__reference', 'client__nom', 'notes']
     ordering_fields = ['date_creation', 'date_emission', 'date_echeance', 'montant_ttc', 'reference']
     ordering = ['-date_creation']
     
@@ -160,46 +162,46 @@ class FactureViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """
-        Statistiques sur les factures
+        Statistiques sur les factures, lues dans les agrégats journaliers.
+        Paramètres optionnels : date_debut, date_fin, entity, client, year.
         """
+        year = requested_year(request.query_params)
+        if year is None:
+            return Response({"detail": "Paramètre year invalide."}, status=status.HTTP_400_BAD_REQUEST)
+
+        stats = rollup_queryset('FAC', request.query_params)
+
         # Statistiques globales
-        total_count = self.get_queryset().count()
-        montant_total = self.get_queryset().aggregate(total=Sum('montant_ttc'))['total'] or 0
-        montant_paye = self.get_queryset().aggregate(total=Sum('montant_paye'))['total'] or 0
-        
+        totaux = stats.aggregate(count=Sum('count'), montant=Sum('montant'), paye=Sum('montant_paye'))
+        total_count = totaux['count'] or 0
+        montant_total = totaux['montant'] or 0
+        montant_paye = totaux['paye'] or 0
+
         # Statistiques par statut
-        stats_par_statut = self.get_queryset().values('statut').annotate(
-            count=Count('id'),
-            montant=Sum('montant_ttc')
-        ).order_by('statut')
-        
-        # Factures en retard
+        stats_par_statut = stats.order_by('statut').values('statut').annotate(
+            count=Sum('count'),
+            montant=Sum('montant')
+        )
+
+        # Factures en retard (dépend de la date du jour : lu sur les factures)
         factures_en_retard = self.get_queryset().filter(
             Q(statut='EMISE') | Q(statut='IMPAYEE'),
             date_echeance__lt=now()
         ).count()
-        
+
         # Statistiques par mois
-        current_year = now().year
-        stats_par_mois = []
-        
-        for month in range(1, 13):
-            month_data = self.get_queryset().filter(
-                date_creation__year=current_year,
-                date_creation__month=month
-            ).aggregate(
-                count=Count('id'),
-                montant=Sum('montant_ttc'),
-                paye=Sum('montant_paye')
-            )
-            
-            stats_par_mois.append({
+        stats_par_mois = [
+            {
                 'mois': month,
                 'count': month_data['count'] or 0,
                 'montant': float(month_data['montant'] or 0),
                 'paye': float(month_data['paye'] or 0)
-            })
-        
+            }
+            for month, month_data in enumerate(monthly_series(
+                stats, year, count=Sum('count'), montant=Sum('montant'), paye=Sum('montant_paye')
+            ), start=1)
+        ]
+
         return Response({
             'total_count': total_count,
             'montant_total': float(montant_total),
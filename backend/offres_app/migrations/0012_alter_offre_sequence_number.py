@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offres_app', '0011_alter_offre_date_cloture_alter_offre_date_envoi_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='offre',
+            name='sequence_number',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
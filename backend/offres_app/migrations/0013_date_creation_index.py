@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0012_clientkpisnapshot'),
+        ('document', '0035_change_event'),
+        ('offres_app', '0012_alter_offre_sequence_number'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='offre',
+            index=models.Index(fields=['date_creation'], name='offres_app__date_cr_a2bfb1_idx'),
+        ),
+    ]
@@ -6,7 +6,12 @@ from django.contrib.auth import get_user_model
 from datetime import timedelta
 
 from affaires_app.models import Affaire
+from document.changes import record_changes
+from document.indexing import index_documents
 from document.models import StatusTrackingModel
+from document.rollups import ROLLUP_MODELS, update_rollup
+from document.sequences import allocate_sequences, month_period, next_sequence
+from factures_app.models import Facture
 from proformas_app.models import Proforma
 
 
@@ -78,7 +83,7 @@ class Offre(StatusTrackingModel):
     
     # Champs supplémentaires
     notes = models.TextField(blank=True)
-    sequence_number = models.PositiveIntegerField(default=1)
+    sequence_number = models.PositiveIntegerField(default=0)
     
     # Champ pour la gestion des relances
     relance = models.DateTimeField(
@@ -92,30 +97,97 @@ class Offre(StatusTrackingModel):
         'EN_NEGOCIATION': 5,  # Relance tous les 5 jours pendant la négociation
     }
 
+    # Statut, rattachement et dimensions des agrégats journaliers (voir save() et document.rollups)
+    tracked_fields = ('statut', 'client', 'entity', 'produit_principal', 'montant')
+
+    # Création de proforma/affaire, ou relance calculée par objet (voir changer_statut)
+    statuts_avec_effets = ('GAGNE', *DELAIS_RELANCE)
+
     class Meta:
         verbose_name = "Offre commerciale"
         verbose_name_plural = "Offres commerciales"
         ordering = ['date_creation']
+        indexes = [
+            models.Index(fields=['date_creation']),
+        ]
         
     def generer_reference(self):
         """
         Génère une référence unique pour l'offre selon le format défini
         """
         if not self.sequence_number:
-            last_sequence = Offre.objects.filter(
-                entity=self.entity,
-                client=self.client,
-                date_creation__year=timezone.now().year,
-                date_creation__month=timezone.now().month
-            ).aggregate(Max('sequence_number'))['sequence_number__max']
-            self.sequence_number = (last_sequence or 0) + 1
+            self.sequence_number = next_sequence(
+                'OFF',
+                entity=self.entity_id,
+                client=self.client_id,
+                period=month_period(),
+                initial=lambda: Offre.objects.filter(
+                    entity=self.entity,
+                    client=self.client,
+                    date_creation__year=timezone.now().year,
+                    date_creation__month=timezone.now().month
+                ).aggregate(Max('sequence_number'))['sequence_number__max']
+            )
         
+        total_offres_client = next_sequence(
+            'OFF',
+            client=self.client_id,
+            initial=lambda: Offre.objects.filter(client=self.client).count()
+        )
+        return self._formater_reference(total_offres_client)
+
+    def _formater_reference(self, total_offres_client):
         produit_code = self.produit_principal.code
-        total_offres_client = Offre.objects.filter(client=self.client).count() + 1
         date = self.date_creation or timezone.now()
         
         return f"{self.entity.code}/OFF/{self.client.c_num}/{str(date.year)[-2:]}{date.month:02d}{date.day:02d}/{produit_code}/{total_offres_client}/{self.sequence_number:04d}"
 
+    @classmethod
+    def generer_references_en_masse(cls, offres):
+        """
+        Attribue numéros de séquence et références à des offres non sauvegardées,
+        en vue d'un bulk_create (voir document.sequences.bulk_create_with_references).
+        Les compteurs sont réservés par bloc et les entités, clients et produits
+        chargés en une requête chacun.
+        """
+        from client.models import Client
+        from document.models import Entity, Product
+
+        offres = [offre for offre in offres if not offre.reference]
+        if not offres:
+            return offres
+
+        period = month_period()
+        sans_sequence = [offre for offre in offres if not offre.sequence_number]
+        sequences = allocate_sequences(
+            'OFF',
+            [{'entity': o.entity_id, 'client': o.client_id, 'period': period} for o in sans_sequence],
+            initial=lambda scope: Offre.objects.filter(
+                entity=scope['entity'],
+                client=scope['client'],
+                date_creation__year=timezone.now().year,
+                date_creation__month=timezone.now().month
+            ).aggregate(Max('sequence_number'))['sequence_number__max']
+        )
+        for offre, sequence in zip(sans_sequence, sequences):
+            offre.sequence_number = sequence
+
+        totaux = allocate_sequences(
+            'OFF',
+            [{'client': o.client_id} for o in offres],
+            initial=lambda scope: Offre.objects.filter(client=scope['client']).count()
+        )
+
+        entities = Entity.objects.in_bulk({o.entity_id for o in offres})
+        clients = Client.objects.in_bulk({o.client_id for o in offres})
+        produits = Product.objects.in_bulk({o.produit_principal_id for o in offres})
+        for offre, total in zip(offres, totaux):
+            offre.entity = entities[offre.entity_id]
+            offre.client = clients[offre.client_id]
+            offre.produit_principal = produits[offre.produit_principal_id]
+            offre.reference = offre._formater_reference(total)
+        return offres
+
     def set_relance(self):
         """
         Configure la prochaine date de relance si l'offre n'est pas gagnée/perdue
@@ -179,15 +251,10 @@ class Offre(StatusTrackingModel):
         if not self.reference:
             self.reference = self.generer_reference()
 
-        # Gestion des statuts et relances
-        statut_precedent = None
-        
-        # Vérifier si l'objet existe déjà pour comparer l'ancien statut
-        if self.pk:
-            try:
-                statut_precedent = Offre.objects.get(pk=self.pk).statut
-            except Offre.DoesNotExist:
-                pass
+        # Gestion des statuts et relances : valeurs précédentes suivies au chargement, sans relecture
+        statut_precedent = self.previous('statut')
+        ancien_client = self.previous('client')
+        reattribuee = ancien_client is not None and bool({'client', 'entity'} & self.changed_fields())
         
         # Mettre à jour les relances selon le statut
         if self.statut in ['GAGNE', 'PERDU']:
@@ -200,6 +267,10 @@ class Offre(StatusTrackingModel):
         
         # Appel à la méthode save du parent (StatusTrackingModel)
         super().save(*args, **kwargs)
+
+        # Offre réattribuée : recopier le client et l'entité sur les documents liés
+        if reattribuee:
+            self.propager_client_entite()
         
         ## Mettre à jour le montant total si nécessaire
         #montant_calcule = self.calculer_montant_total
@@ -230,6 +301,35 @@ class Offre(StatusTrackingModel):
                 }
             )
     
+    @classmethod
+    def valeurs_changement_statut(cls, nouveau_statut, date_statut):
+        # Hors statuts à relance (traités objet par objet), la relance est annulée
+        return {'relance': None}
+
+    def propager_client_entite(self):
+        """
+        Recopie le client et l'entité de l'offre sur son affaire, sa proforma et
+        sa facture (colonnes dénormalisées), puis resynchronise l'index et les
+        agrégats journaliers de ces documents.
+        """
+        valeurs = {'client_id': self.client_id, 'entity_id': self.entity_id}
+        querysets = [
+            Affaire.objects.filter(offre=self),
+            Proforma.objects.filter(offre=self),
+            Facture.objects.filter(affaire__offre=self),
+        ]
+        for queryset in querysets:
+            queryset.update(**valeurs)
+
+        # QuerySet.update() ne déclenche pas les signaux : index, agrégats et flux des modifications mis à jour ici
+        documents = [document for queryset in querysets for document in queryset]
+        index_documents(documents)
+        for document in documents:
+            if document._meta.label in ROLLUP_MODELS:
+                update_rollup(type(document), document)
+        for queryset in querysets:
+            record_changes(queryset.model, [d for d in documents if isinstance(d, queryset.model)], 'U', ['client', 'entity'])
+
     def changer_statut(self, nouveau_statut, user=None, date_specifique=None, commentaire="", metadata=None):
         """
         Méthode pour changer le statut de l'offre qui gère également les effets secondaires
@@ -9,6 +9,7 @@ from api.user.serializers import UserSerializer
 from .models import Offre
 from client.models import Client, Contact
 from document.models import Entity, Product
+from document.status_history import HistoryListSerializer, StatusChangeSerializer
 
 class EntitySerializer(serializers.ModelSerializer):
     """Sérialiseur pour les entités"""
@@ -102,6 +103,9 @@ class OffreSerializer(serializers.ModelSerializer):
             'reference', 'date_creation', 'date_modification',
             'date_validation', 'necessite_relance', 'sequence_number'
         ]
+        # ?historique=N : dernières transitions de statut de chaque ligne, en une requête par page
+        list_serializer_class = HistoryListSerializer
+        history_serializer = StatusChangeSerializer
         
 
 class OffreNoteSerializer(serializers.ModelSerializer):
@@ -1,3 +1,42 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from document.fixtures import DocumentFixturesMixin
+from .models import Offre
+
+
+class OffreTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('offres', superuser=True, client_nom='Client offres')
+
+    def test_generer_references_en_masse_ignore_existing_references(self):
+        offres = [self.create_offre(save=False) for _ in range(3)]
+        offres[1].reference = 'KES/OFF/MANUELLE'
+        offres[1].sequence_number = 99
+
+        Offre.generer_references_en_masse(offres)
+
+        self.assertEqual(offres[1].reference, 'KES/OFF/MANUELLE')
+        self.assertEqual([offres[0].sequence_number, offres[2].sequence_number], [1, 2])
+
+    def test_bulk_status_action(self):
+        ids = [self.create_offre(createur=self.user, montant=10).pk for _ in range(3)]
+        response = self.api.post('/api/offres/bulk_status/', {'ids': ids + [0], 'statut': 'PERDU'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'statut': 'PERDU', 'modifies': 3, 'ignores': 1})
+
+        response = self.api.post('/api/offres/bulk_status/', {'ids': ids, 'statut': 'INCONNU'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_statistiques_read_rollup(self):
+        for montant in (100, 200, 300):
+            self.create_offre(montant=montant)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.api.get('/api/offres/statistiques/').json()
+        self.assertEqual(data['taux_conversion']['total'], 3)
+        self.assertEqual(float(data['montant_total']), 600)
+        self.assertEqual(data['par_produit'][0]['produit__name'], 'Produit')
+        self.assertLessEqual(len(queries), 3)
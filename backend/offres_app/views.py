@@ -10,6 +10,10 @@ from rest_framework.decorators import action
 
 from client.models import Client, Contact
 from document.models import Entity, Product
+from document.bulk_status import BulkStatusMixin
+from document.query_plan import QueryPlanMixin
+from document.rollups import offre_statistics
+from document.status_durations import status_duration_stats
 from document.utils import log_user_action
 
 from .models import Offre
@@ -27,7 +31,7 @@ from .serializers import (
 )
 
 
-class OffreViewSet(viewsets.ModelViewSet):
+class OffreViewSet(QueryPlanMixin, BulkStatusMixin, viewsets.ModelViewSet):
     """
     Viewset complet pour la gestion des offres (CRUD)
     """
@@ -53,15 +57,18 @@ class OffreViewSet(viewsets.ModelViewSet):
         )
         
     def perform_update(self, serializer):
+        super().perform_update(serializer)
         offre = serializer.instance
+        # Détail des valeurs dans le journal d'audit (AuditLog.changes, voir document.audit)
+        champs = ', '.join(offre.saved_changes)
         log_user_action(
             user=self.request.user,
             action_type='UPDATE',
             instance=offre,
+            field_name=champs[:100] or None,
             description=f"Modification de l'offre {offre.reference}",
             request=self.request
         )
-        return super().perform_update(serializer)
         
     @action(detail=True, methods=['put'])
     def update_status(self, request, pk=None):
@@ -85,6 +92,24 @@ class OffreViewSet(viewsets.ModelViewSet):
         )
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def statistiques(self, request):
+        """
+        Statistiques sur les offres de la période (period=month|quarter|year,
+        ou date_debut / date_fin), lues dans les agrégats journaliers.
+        """
+        return Response(offre_statistics(request.query_params))
+
+    @action(detail=False, methods=['get'])
+    def durees_statuts(self, request):
+        """
+        Durées passées par les offres dans chaque statut (nombre, moyenne,
+        p50/p90/p95 en heures), par statut, entité et produit. Filtres :
+        date_debut, date_fin, entity, produit, statut.
+        """
+        return Response(status_duration_stats('offres_app.Offre', request.query_params))
+
 # view pour prolonger la relance
 class OffreRelanceProlongationView(generics.UpdateAPIView):
     """
@@ -185,7 +210,7 @@ class OffreInitDataView(APIView):
         return Response(data)
 
 
-class ClientListView(generics.ListAPIView):
+class ClientListView(QueryPlanMixin, generics.ListAPIView):
     """
     Liste des clients disponibles pour la création d'offre
     """
@@ -206,7 +231,7 @@ class ClientListView(generics.ListAPIView):
         return queryset
 
 
-class ContactsByClientView(generics.ListAPIView):
+class ContactsByClientView(QueryPlanMixin, generics.ListAPIView):
     """
     Liste des contacts associés à un client spécifique
     """
@@ -218,7 +243,7 @@ class ContactsByClientView(generics.ListAPIView):
         return Contact.objects.filter(client_id=client_id).order_by('nom')
 
 
-class EntityListView(generics.ListAPIView):
+class EntityListView(QueryPlanMixin, generics.ListAPIView):
     """
     Liste des entités disponibles
     """
@@ -227,7 +252,7 @@ class EntityListView(generics.ListAPIView):
     serializer_class = EntitySerializer
 
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(QueryPlanMixin, generics.ListAPIView):
     """
     Liste des produits disponibles pour la création d'offre
     """
@@ -7,11 +7,14 @@ from django.contrib.contenttypes.models import ContentType
 from django.db.models import Max
 from django.conf import settings
 
+from document.audit import audit_writer
 from document.models import AuditLog
+from document.sequences import month_period, next_sequence
+from document.tracking import FieldTrackerMixin
 from offres_app.models import Offre
 
 
-class Opportunite(models.Model):
+class Opportunite(FieldTrackerMixin, models.Model):
     """
     Modèle représentant une opportunité commerciale dans le pipeline de vente.
     Une opportunité passe par différents stades (de prospect à gagnée/perdue)
@@ -205,14 +208,14 @@ class Opportunite(models.Model):
             user: Utilisateur ayant effectué l'action
             changes: Dictionnaire des modifications apportées
         """
-        AuditLog.objects.create(
+        audit_writer.write(AuditLog(
             user=user,
             action=action,
             content_type=ContentType.objects.get_for_model(self),
             object_id=str(self.pk),
             object_repr=str(self),
             changes=changes or {}
-        )
+        ))
     
     @property
     def necessite_relance(self):
@@ -250,18 +253,27 @@ class Opportunite(models.Model):
         """
         if not self.reference:
             if not self.sequence_number:
-                # Récupère le dernier numéro de séquence pour cette entité/client/mois/année
+                # Prochain numéro de séquence pour cette entité/client/mois/année
                 date = self.date_creation or now()
-                last_sequence = Opportunite.objects.filter(
-                    entity=self.entity,
-                    client=self.client,
-                    date_creation__year=date.year,
-                    date_creation__month=date.month
-                ).aggregate(Max('sequence_number'))['sequence_number__max']
-                self.sequence_number = (last_sequence or 0) + 1
+                self.sequence_number = next_sequence(
+                    'OPP',
+                    entity=self.entity_id,
+                    client=self.client_id,
+                    period=month_period(date),
+                    initial=lambda: Opportunite.objects.filter(
+                        entity=self.entity,
+                        client=self.client,
+                        date_creation__year=date.year,
+                        date_creation__month=date.month
+                    ).aggregate(Max('sequence_number'))['sequence_number__max']
+                )
             
-            # Calcul du nombre total d'opportunités pour ce client (incluant celle-ci)
-            total_opportunites_client = Opportunite.objects.filter(client=self.client).count() + 1
+            # Rang de l'opportunité pour ce client (incluant celle-ci)
+            total_opportunites_client = next_sequence(
+                'OPP',
+                client=self.client_id,
+                initial=lambda: Opportunite.objects.filter(client=self.client).count()
+            )
             
             date = self.date_creation or now()
             self.reference = (
@@ -36,11 +36,10 @@ class OpportunitePermission(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         
-        # Les méthodes de lecture sont autorisées si l'utilisateur appartient à l'entité
+        # Lecture autorisée, comme pour la liste : les utilisateurs ne sont pas
+        # rattachés à des entités (pas de relation User -> Entity)
         if request.method in permissions.SAFE_METHODS:
-            # Vérifier si l'utilisateur est associé à l'entité de l'opportunité
-            user_entities = request.user.entities.all()
-            return obj.entity in user_entities
+            return True
         
         # Pour la mise à jour, l'utilisateur doit être le créateur
         # ou avoir la permission 'change_opportunite'
@@ -1,3 +1,34 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from client.models import Contact
+from document.fixtures import DocumentFixturesMixin
+from document.models import AuditLog
+from .models import Opportunite
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class OpportuniteAuditTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('opportunite', client_nom='Client opportunité')
+        self.opportunite = Opportunite.objects.create(
+            entity=self.entity, client=self.client_obj, contact=Contact.objects.create(nom='Contact', client=self.client_obj),
+            produit_principal=self.produit, created_by=self.user, responsable=self.user,
+            montant=Decimal('1000'), montant_estime=Decimal('1000'),
+        )
+
+    def test_updates_are_audited_with_changed_fields(self):
+        opportunite = Opportunite.objects.get(pk=self.opportunite.pk)
+        self.assertEqual(opportunite.previous('statut'), 'PROSPECT')
+        opportunite.statut = 'QUALIFICATION'
+        opportunite.montant_estime = Decimal('1500')
+        self.assertEqual(opportunite.changed_fields(), {'statut'})
+        opportunite.save()
+
+        changes = AuditLog.objects.get(action='UPDATE', changes__has_key='montant_estime').changes
+        self.assertEqual(changes['montant_estime'], ['1000.00', '1500.00'])
+        self.assertEqual(changes['statut'], ['PROSPECT', 'QUALIFICATION'])
+        self.assertEqual(changes['probabilite'], [10, 30])
+        self.assertEqual(opportunite.changed_fields(), set())
@@ -6,6 +6,8 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.utils.timezone import now
 from django.db.models import Sum, Count, Q
 
+from document.query_plan import QueryPlanMixin
+from document.relances import relances_dues
 from .models import Opportunite
 from .serializers import (
     OpportuniteSerializer, 
@@ -19,7 +21,7 @@ from .filters import OpportuniteFilter
 from .permissions import OpportunitePermission
 
 
-class OpportuniteViewSet(viewsets.ModelViewSet):
+class OpportuniteViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     API pour la gestion des opportunités commerciales.
     
@@ -67,8 +69,9 @@ class OpportuniteViewSet(viewsets.ModelViewSet):
         # Filter by relance if specified
         relance = self.request.GET.get('relance')
         if relance == 'required':
+            # Échéances lues dans la file des relances (index)
             queryset = queryset.filter(
-                relance__lte=now(),
+                pk__in=relances_dues(Opportunite),
                 statut__in=['PROSPECT', 'QUALIFICATION', 'PROPOSITION', 'NEGOCIATION']
             )
         elif relance == 'upcoming':
@@ -4,8 +4,8 @@ from .models import Proforma
 
 class ProformaAdmin(admin.ModelAdmin):
     list_display = ('reference', 'offre', 'get_client', 'get_entity', 'statut', 'montant_ttc', 'date_creation', 'date_validation')
-    list_filter = ('statut', 'date_creation', 'date_validation', 'offre__entity', 'offre__client')
-    search_fields = ('reference', 'offre__reference', 'offre__client__nom', 'notes')
+    list_filter = ('statut', 'date_creation', 'date_validation', 'entity', 'client')
+    search_fields = ('reference', 'offre__reference', 'client__nom', 'notes')
     readonly_fields = ('reference', 'created_at', 'updated_at', 'sequence_number')
     fieldsets = (
         ('Informations générales', {
@@ -32,12 +32,12 @@ class ProformaAdmin(admin.ModelAdmin):
     def get_client(self, obj):
         return obj.offre.client.nom
     get_client.short_description = 'Client'
-    get_client.admin_order_field = 'offre__client__nom'
+    get_client.admin_order_field = 'client__nom'
     
     def get_entity(self, obj):
         return obj.offre.entity.code
     get_entity.short_description = 'Entité'
-    get_entity.admin_order_field = 'offre__entity__code'
+    get_entity.admin_order_field = 'entity__code'
     
     def save_model(self, request, obj, form, change):
         if not change:  # Si c'est une création (pas une modification)
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def backfill(apps, schema_editor):
+    # Client et entité recopiés de l'offre, par tranches de clés primaires
+    Proforma = apps.get_model('proformas_app', 'Proforma')
+    offres = apps.get_model('offres_app', 'Offre').objects.filter(proforma=OuterRef('pk'))
+    last_pk = Proforma.objects.aggregate(last=Max('pk'))['last'] or 0
+    for start in range(0, last_pk, 1000):
+        Proforma.objects.filter(pk__gt=start, pk__lte=start + 1000).update(
+            client=Subquery(offres.values('client_id')[:1]),
+            entity=Subquery(offres.values('entity_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0012_clientkpisnapshot'),
+        ('document', '0030_documentdailystat'),
+        ('offres_app', '0012_alter_offre_sequence_number'),
+        ('proformas_app', '0002_proforma_relance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proforma',
+            name='client',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='client.client', verbose_name='Client'),
+        ),
+        migrations.AddField(
+            model_name='proforma',
+            name='entity',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='document.entity', verbose_name='Entité'),
+        ),
+        migrations.AddIndex(
+            model_name='proforma',
+            index=models.Index(fields=['client', 'date_creation'], name='proformas_a_client__086cf1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proforma',
+            index=models.Index(fields=['entity', 'date_creation'], name='proformas_a_entity__5910f9_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0012_clientkpisnapshot'),
+        ('document', '0035_change_event'),
+        ('offres_app', '0013_date_creation_index'),
+        ('proformas_app', '0003_client_entity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='proforma',
+            index=models.Index(fields=['date_creation'], name='proformas_a_date_cr_fb165d_idx'),
+        ),
+    ]
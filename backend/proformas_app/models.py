@@ -7,7 +7,10 @@ from datetime import timedelta
 
 from django.conf import settings
 
-class Proforma(models.Model):
+from document.sequences import month_period, next_sequence
+from document.tracking import FieldTrackerMixin
+
+class Proforma(FieldTrackerMixin, models.Model):
     STATUS_CHOICES = (
         ('BROUILLON', 'Brouillon'),
         ('EN_COURS', 'En cours'),
@@ -19,6 +22,9 @@ class Proforma(models.Model):
     
     reference = models.CharField(max_length=100, unique=True, blank=True, null=True, verbose_name="Référence")
     offre = models.OneToOneField('offres_app.Offre', on_delete=models.CASCADE, related_name="proforma", verbose_name="Offre commerciale")
+    # Copies du client et de l'entité de l'offre, pour filtrer sans jointure
+    client = models.ForeignKey('client.Client', on_delete=models.CASCADE, blank=True, null=True, editable=False, related_name="+", verbose_name="Client")
+    entity = models.ForeignKey('document.Entity', on_delete=models.CASCADE, blank=True, null=True, editable=False, related_name="+", verbose_name="Entité")
     
     # Informations de base
     sequence_number = models.PositiveIntegerField(blank=True, null=True, verbose_name="Numéro de séquence")
@@ -54,6 +60,11 @@ class Proforma(models.Model):
         verbose_name = "Proforma"
         verbose_name_plural = "Proformas"
         ordering = ['-date_creation']
+        indexes = [
+            models.Index(fields=['client', 'date_creation']),
+            models.Index(fields=['entity', 'date_creation']),
+            models.Index(fields=['date_creation']),
+        ]
     
     def __str__(self):
         return self.reference or f"Proforma #{self.pk}"
@@ -85,18 +96,28 @@ class Proforma(models.Model):
         )
     
     def save(self, *args, **kwargs):
+        if not self.pk or self.client_id is None:
+            self.client_id = self.offre.client_id
+            self.entity_id = self.offre.entity_id
+
         if not self.reference:
             if not self.sequence_number:
-                last_sequence = Proforma.objects.filter(
-                    offre__entity=self.offre.entity,
-                    date_creation__year=now().year,
-                    date_creation__month=now().month
-                ).aggregate(Max('sequence_number'))['sequence_number__max']
-                
-                self.sequence_number = (last_sequence or 0) + 1
+                self.sequence_number = next_sequence(
+                    'PRO',
+                    entity=self.entity_id,
+                    period=month_period(),
+                    initial=lambda: Proforma.objects.filter(
+                        entity=self.entity_id,
+                        date_creation__year=now().year,
+                        date_creation__month=now().month
+                    ).aggregate(Max('sequence_number'))['sequence_number__max']
+                )
             
-            # Correction ici: utiliser offre__client au lieu de client
-            total_proformas_client = Proforma.objects.filter(offre__client=self.offre.client).count() + 1
+            total_proformas_client = next_sequence(
+                'PRO',
+                client=self.client_id,
+                initial=lambda: Proforma.objects.filter(client=self.client_id).count()
+            )
             
             date = self.date_creation or now()
             
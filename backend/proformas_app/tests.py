@@ -1,3 +1,41 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from document.fixtures import DocumentFixturesMixin
+from document.models import AuditLog
+from .models import Proforma
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class ProformaTest(DocumentFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.create_fixtures('proforma', client_nom='Client proforma')
+        self.proforma = Proforma.objects.create(offre=self.create_offre(), montant_ht=Decimal('1000'))
+
+    def test_updates_are_audited_with_changed_fields_only(self):
+        proforma = Proforma.objects.get(pk=self.proforma.pk)
+        proforma.montant_ht = Decimal('1200')
+        proforma.calculate_amounts()
+        proforma.notes = 'Remise annulée'
+        proforma.save()
+        # Sauvegarde sans modification : pas d'entrée
+        proforma.save()
+
+        log = AuditLog.objects.get(action='UPDATE', object_id=str(proforma.pk))
+        self.assertEqual(log.changes, {
+            'montant_ht': ['1000.00', '1200.00'],
+            'montant_tva': ['192.50', '231.00'],
+            'montant_ttc': ['1192.50', '1431.00'],
+            'notes': [None, 'Remise annulée'],
+        })
+
+        proforma.mark_as_validated(self.user)
+        self.assertEqual(
+            AuditLog.objects.filter(changes__has_key='statut').get().changes['statut'], ['BROUILLON', 'VALIDE']
+        )
+
+    def test_invalid_year_is_rejected(self):
+        self.assertEqual(self.api.get('/api/proformas/stats/', {'year': 'abc'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/proformas/stats/', {'year': '2025'}).status_code, 200)
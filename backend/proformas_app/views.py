@@ -3,11 +3,15 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils.timezone import now
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth
+
+from document.query_plan import QueryPlanMixin
+from document.rollups import monthly_series, requested_year, rollup_queryset
 from .models import Proforma
 from .serializers import ProformaSerializer, ProformaDetailSerializer, ProformaCreateSerializer
 
-class ProformaViewSet(viewsets.ModelViewSet):
+class ProformaViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """
     API endpoint pour gérer les proformas.
     """
@@ -21,10 +25,12 @@ class ProformaViewSet(viewsets.ModelViewSet):
         'statut': ['exact'],
         'date_creation': ['gte', 'lte'],
         'date_validation': ['gte', 'lte', 'isnull'],
+        'client': ['exact'],
+        'entity': ['exact'],
         'offre__client': ['exact'],
         'offre__entity': ['exact'],
     }
-    search_fields = ['reference', 'offre__reference', 'offre__client__nom', 'notes']
+    search_fields = ['reference', 'offre__reference', 'client__nom', 'notes']
     ordering_fields = ['date_creation', 'date_validation', 'montant_ttc', 'reference']
     ordering = ['-date_creation']
     
@@ -132,33 +138,37 @@ class ProformaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """
-        Statistiques sur les proformas
+        Statistiques sur les proformas, lues dans les agrégats journaliers.
+        Paramètres optionnels : date_debut, date_fin, entity, client, year.
         """
-        total = self.get_queryset().count()
-        validated = self.get_queryset().filter(statut='VALIDE').count()
-        expired = self.get_queryset().filter(statut='EXPIRE').count()
-        
-        # Statistiques par mois (pour l'année en cours)
-        current_year = now().year
-        monthly_stats = []
-        
-        for month in range(1, 13):
-            month_count = self.get_queryset().filter(
-                date_creation__year=current_year,
-                date_creation__month=month
-            ).count()
-            month_validated = self.get_queryset().filter(
-                statut='VALIDE',
-                date_validation__year=current_year,
-                date_validation__month=month
-            ).count()
-            
-            monthly_stats.append({
+        year = requested_year(request.query_params)
+        if year is None:
+            return Response({"detail": "Paramètre year invalide."}, status=status.HTTP_400_BAD_REQUEST)
+
+        stats = rollup_queryset('PRO', request.query_params)
+        par_statut = dict(stats.order_by().values_list('statut').annotate(count=Sum('count')))
+        total = sum(par_statut.values())
+        validated = par_statut.get('VALIDE', 0)
+        expired = par_statut.get('EXPIRE', 0)
+
+        # Statistiques par mois : créations depuis les agrégats, validations
+        # (datées de date_validation) en une requête groupée
+        created = monthly_series(stats, year, count=Sum('count'))
+        validated_by_month = dict(
+            self.get_queryset().filter(statut='VALIDE', date_validation__year=year)
+            .order_by().annotate(month=ExtractMonth('date_validation'))
+            .values_list('month').annotate(count=Count('id'))
+        )
+
+        monthly_stats = [
+            {
                 'month': month,
-                'count': month_count,
-                'validated': month_validated
-            })
-        
+                'count': month_data['count'] or 0,
+                'validated': validated_by_month.get(month, 0)
+            }
+            for month, month_data in enumerate(created, start=1)
+        ]
+
         return Response({
             'total': total,
             'validated': validated,
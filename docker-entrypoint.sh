@@ -1,5 +1,12 @@
 #!/bin/bash
 export DJANGO_SETTINGS_MODULE=KES_DocGen.settings
+
+# Planificateur des relances (service relances de docker-compose.yml) : même
+# image, sans migration ; il réessaie tant que la base n'est pas migrée
+if [ "$1" = "relances" ]; then
+    exec python manage.py run_relances
+fi
+
 python manage.py migrate
 python manage.py seed_docs  # Use fixtures instead of seed script
 exec python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -1,54 +1,28 @@
-import React, { useMemo } from 'react';
+import React from 'react';
 import { useOffresNotifications } from '../hooks/useOffresNotifications';
-import { OffreNotification } from '../types/offre';
+import { RelanceNotification } from '../types/offre';
 
 interface NotificationItemProps {
-  notification: OffreNotification;
+  notification: RelanceNotification;
   onAction?: () => void;
 }
 
-const NotificationItem: React.FC<NotificationItemProps> = ({ notification }) => {
-  const formattedDate = useMemo(() => 
-    new Date(notification.date_relance).toLocaleDateString('fr-FR', {
-      day: '2-digit',
-      month: '2-digit',
-      year: 'numeric'
-    }), [notification.date_relance]);
-
-  const formattedMontant = useMemo(() => 
-    new Intl.NumberFormat('fr-FR', {
-      style: 'currency',
-      currency: 'EUR'
-    }).format(parseFloat(notification.montant)), [notification.montant]);
-
-  return (
-    <div 
-      className="p-4 mb-2 bg-white shadow rounded hover:shadow-md transition-shadow"
-      role="alert"
-      aria-live="polite"
-    >
-      <div className="flex justify-between items-start">
-        <div className="font-bold text-lg mb-2 text-gray-900">
-          Relance nécessaire : {notification.reference}
-        </div>
-        <span className="px-2 py-1 text-sm bg-yellow-100 text-yellow-800 rounded-full">
-          À relancer
-        </span>
-      </div>
-      <div className="text-gray-700 space-y-2">
-        <p>
-          <span className="font-medium">Client :</span> {notification.client}
-        </p>
-        <p>
-          <span className="font-medium">Montant :</span> {formattedMontant}
-        </p>
-        <p>
-          <span className="font-medium">Date de relance :</span> {formattedDate}
-        </p>
+const NotificationItem: React.FC<NotificationItemProps> = ({ notification }) => (
+  <div 
+    className="p-4 mb-2 bg-white shadow rounded hover:shadow-md transition-shadow"
+    role="alert"
+    aria-live="polite"
+  >
+    <div className="flex justify-between items-start">
+      <div className="font-bold text-lg mb-2 text-gray-900">
+        {notification.message}
       </div>
+      <span className="px-2 py-1 text-sm bg-yellow-100 text-yellow-800 rounded-full">
+        À relancer
+      </span>
     </div>
-  );
-};
+  </div>
+);
 
 const ConnectionStatus: React.FC<{ isConnected: boolean }> = ({ isConnected }) => (
   <div 
@@ -111,9 +85,9 @@ export const OffresNotifications: React.FC = () => {
           role="log"
           aria-label="Liste des notifications d'offres à relancer"
         >
-          {notifications.map((notif, index) => (
+          {notifications.map((notif) => (
             <NotificationItem 
-              key={`${notif.reference}-${index}`} 
+              key={notif.id} 
               notification={notif} 
             />
           ))}
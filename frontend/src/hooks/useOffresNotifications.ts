@@ -1,16 +1,16 @@
 import { useState, useEffect, useCallback } from 'react';
 import { WebSocketService } from '../services/websocketService';
-import { OffreNotification } from '../types/offre';
+import { RelanceNotification, RelancesMessage } from '../types/offre';
 
 interface UseOffresNotificationsReturn {
-  notifications: OffreNotification[];
+  notifications: RelanceNotification[];
   isConnected: boolean;
   clearNotifications: () => void;
   reconnect: () => void;
 }
 
 export const useOffresNotifications = (): UseOffresNotificationsReturn => {
-  const [notifications, setNotifications] = useState<OffreNotification[]>([]);
+  const [notifications, setNotifications] = useState<RelanceNotification[]>([]);
   const [isConnected, setIsConnected] = useState<boolean>(false);
   const wsService = WebSocketService.getInstance();
 
@@ -28,14 +28,13 @@ export const useOffresNotifications = (): UseOffresNotificationsReturn => {
     return false;
   }, []);
 
-  const showNotification = useCallback((data: OffreNotification) => {
+  const showNotification = useCallback((data: RelanceNotification) => {
     if (Notification.permission === 'granted') {
       try {
-        new Notification('Relance d\'offre nécessaire', {
-          body: `L'offre ${data.reference} pour ${data.client} nécessite une relance`,
+        new Notification('Relance nécessaire', {
+          body: data.message,
           icon: '/path/to/your/icon.png',
-          tag: `offre-${data.reference}`, // Évite les doublons
-          data: { url: `/offres/${data.reference}` }, // Pour la navigation au clic
+          tag: `relance-${data.id}`, // Évite les doublons
         });
       } catch (error) {
         console.error('Error showing notification:', error);
@@ -45,16 +44,21 @@ export const useOffresNotifications = (): UseOffresNotificationsReturn => {
 
   const handleMessage = useCallback((event: MessageEvent) => {
     try {
-      const data: OffreNotification = JSON.parse(event.data);
-      if (data.type === 'RELANCE_REQUISE') {
-        setNotifications(prev => {
-          // Évite les doublons
-          const isDuplicate = prev.some(notif => notif.reference === data.reference);
-          if (isDuplicate) return prev;
-          return [...prev, data];
-        });
-        showNotification(data);
-      }
+      // Trame regroupée par le serveur : { message } ou { messages: [...], dropped }
+      const frame = JSON.parse(event.data);
+      const messages: { type?: string }[] = frame.messages ?? (frame.message ? [frame.message] : []);
+      // Relances : { type: 'relances', notifications: [...] }, une entrée par notification
+      const relances = messages
+        .filter((data): data is RelancesMessage => data.type === 'relances')
+        .flatMap((data) => data.notifications);
+      if (relances.length === 0) return;
+      setNotifications(prev => {
+        // Évite les doublons
+        const known = new Set(prev.map(notif => notif.id));
+        const nouvelles = relances.filter(notif => !known.has(notif.id));
+        return nouvelles.length ? [...prev, ...nouvelles] : prev;
+      });
+      relances.forEach(showNotification);
     } catch (error) {
       console.error('Error parsing WebSocket message:', error);
     }
@@ -1,3 +1,5 @@
+import { getAccessToken } from './authService';
+
 type WebSocketStatus = 'CONNECTING' | 'OPEN' | 'CLOSING' | 'CLOSED';
 
 export class WebSocketService {
@@ -22,7 +24,10 @@ export class WebSocketService {
     // En développement, forcez l'utilisation de ws:// au lieu de wss://
     const protocol = 'ws:';
     const host = "192.168.100.188:8080";
-    return `${protocol}//${host}/ws/notifications/`;
+    // Jeton JWT dans l'URL : groupes de l'utilisateur, de son département et de ses entités
+    const token = getAccessToken();
+    const query = token ? `?token=${encodeURIComponent(token)}` : '';
+    return `${protocol}//${host}/ws/notifications/${query}`;
   }
 
   connect(): WebSocket {
@@ -47,3 +47,16 @@ export interface OffreInitData {
   produits: Produit[];
 }
 
+
+// Relance diffusée sur la WebSocket de notifications (message de type 'relances')
+export interface RelanceNotification {
+  id: number;
+  content_type: number;
+  object_id: number;
+  message: string;
+}
+
+export interface RelancesMessage {
+  type: 'relances';
+  notifications: RelanceNotification[];
+}